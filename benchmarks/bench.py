@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+benchmarks for the CGI client and the low level decoders
+
+The network benchmarks run against the local simulator (foscontrol.simulator),
+all others use data generated in memory, so the results only depend on the code
+and the machine.
+
+    python benchmarks/bench.py                          run all, print a table
+    python benchmarks/bench.py -k decode -k dictbits    run the benchmarks whose names contain a pattern
+    python benchmarks/bench.py --json new.json          store the results
+    python benchmarks/bench.py --compare old.json       compare with stored results, exit code 1 on regression
+
+Results are stored as JSON:
+
+    {"meta": {"python": ..., "platform": ..., "commit": ..., "time": ...},
+     "results": {"name": {"unit": "op", "ops": ..., "mean": ..., "median": ..., "min": ..., "stdev": ...,
+                          "rounds": ..., "number": ..., "bytes": ...}}}
+
+Times are seconds per operation.  "bytes" is the amount of data processed per
+operation (if meaningful), so throughput = bytes / median.
+"""
+
+from __future__ import print_function
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import struct
+import subprocess
+import sys
+import time
+
+BASEDIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASEDIR)
+
+import foscontrol
+from foscontrol.simulator import CamSimulator
+from foscontrol.simulator.camera import xmlResult
+from lowlevel import FoscAudio, FoscDecoder, FoscVideo
+
+BENCHMARKS = []
+
+
+def benchmark(name, nbytes=None, network=False):
+    """
+    register a benchmark
+
+    The decorated function is called once with the context and returns the
+    function to be timed (without parameters), so the setup is not measured.
+    :param nbytes: bytes processed by one call of the timed function
+    :param network: benchmark needs the simulator
+    """
+
+    def deco(setup):
+        BENCHMARKS.append((name, setup, nbytes, network))
+        return setup
+
+    return deco
+
+
+class Context(object):
+    """
+    shared resources of the benchmarks, the simulator is started on first use
+    """
+
+    def __init__(self):
+        self.sim = None
+        self.cameras = {}
+
+    def camera(self, name, **kwargs):
+        if self.sim is None:
+            self.sim = CamSimulator()
+            self.sim.start()
+        if name not in self.cameras:
+            self.cameras[name] = self.sim.addCamera(name=name, **kwargs)
+        return self.sim.client(self.cameras[name])
+
+    def close(self):
+        if self.sim is not None:
+            self.sim.stop()
+
+
+def logXml(entries):
+    fields = [("result", 0), ("totalCnt", entries), ("curCnt", entries)]
+    fields += [("log%s" % x, "1384857415+admin+1929423040+%s" % (x % 4)) for x in range(entries)]
+    return xmlResult(fields)
+
+
+def motionXml():
+    fields = [("result", 0), ("isEnable", 1), ("linkage", 15), ("snapInterval", 2), ("sensitivity", 1),
+              ("triggerInterval", 0)]
+    fields += [("schedule%s" % x, 281474976710655) for x in range(7)]
+    fields += [("area%s" % x, 1023) for x in range(10)]
+    return xmlResult(fields)
+
+
+def fosc(cmd, data):
+    return struct.pack("<I4sI", cmd, b"FOSC", len(data)) + data
+
+
+# CGI client
+
+@benchmark("cgi.decodeResult.log10")
+def bench_decode_log(ctx):
+    base = foscontrol.CamBase("http", "localhost", 88, "admin", "")
+    data = logXml(10)
+    return lambda: base.decodeResult(data)
+
+
+@benchmark("cgi.decodeResult.motion_doBool")
+def bench_decode_motion(ctx):
+    base = foscontrol.CamBase("http", "localhost", 88, "admin", "")
+    data = motionXml()
+    return lambda: base.decodeResult(data, doBool=["isEnable"])
+
+
+@benchmark("cgi.ResultObj")
+def bench_resultobj(ctx):
+    base = foscontrol.CamBase("http", "localhost", 88, "admin", "")
+    decoded = base.decodeResult(logXml(10))
+    return lambda: foscontrol.ResultObj(dict(decoded))
+
+
+@benchmark("cgi.ResultObj.collectArray")
+def bench_collect(ctx):
+    base = foscontrol.CamBase("http", "localhost", 88, "admin", "")
+    decoded = base.decodeResult(logXml(10))
+
+    def run():
+        foscontrol.ResultObj(dict(decoded)).collectArray("log", "_log")
+
+    return run
+
+
+@benchmark("cgi.DictBits.toInt")
+def bench_dictbits_toint(ctx):
+    labels = ["ring", "picture", "video"]
+    return lambda: foscontrol.BD_alarmAction.toInt(labels)
+
+
+@benchmark("cgi.DictBits.toArray")
+def bench_dictbits_toarray(ctx):
+    return lambda: foscontrol.BD_alarmAction.toArray(13)
+
+
+@benchmark("cgi.sendcommand.getDevState", network=True)
+def bench_sendcommand(ctx):
+    cam = ctx.camera("latency")
+    return lambda: cam.getDevState()
+
+
+@benchmark("cgi.getLog.100entries", network=True)
+def bench_getlog(ctx):
+    cam = ctx.camera("paging", logEntries=100)
+    return lambda: cam.getLog()
+
+
+@benchmark("cgi.snapPicture", network=True)
+def bench_snapshot(ctx):
+    cam = ctx.camera("snapshot", snapshotPadding=100000)
+    return lambda: cam.snapPicture()
+
+
+@benchmark("cgi.snapPicture2", network=True)
+def bench_snapshot2(ctx):
+    cam = ctx.camera("snapshot", snapshotPadding=100000)
+    # snapPicture2 answers with the JPEG data, not XML
+    return lambda: cam.sendcommand("snapPicture2", raw=True)
+
+
+# low level protocol
+
+VIDEO_STREAM = b"".join([b"\x00\x00\x00\x01\x67\x42\x00\x1e", b"\x00\x00\x00\x01\x68\xce\x38\x80",
+                         b"\x00\x00\x00\x01\x65\x88" + b"\x55" * 20000] +
+                        [b"\x00\x00\x00\x01\x41\x9a" + b"\x66" * 3000] * 29)
+VIDEO_PACKETS = [fosc(26, b"\x00" * 36 + VIDEO_STREAM[x:x + 1400]) for x in range(0, len(VIDEO_STREAM), 1400)]
+AUDIO_PACKET = fosc(27, b"\x00" * 36 + b"\x01\x02" * 480)
+
+
+@benchmark("fosc.video.demux.30frames", nbytes=len(VIDEO_STREAM))
+def bench_video(ctx):
+    return lambda: list(FoscVideo.demux(VIDEO_PACKETS))
+
+
+@benchmark("fosc.audio.feedPacket", nbytes=960)
+def bench_audio(ctx):
+    sink = FoscAudio.AudioSink(seconds=1)
+    return lambda: sink.feedPacket(AUDIO_PACKET)
+
+
+# video with an audio packet after every 4th video packet, as (command, packet)
+MEDIA_PACKETS = []
+for x, packet in enumerate(VIDEO_PACKETS):
+    MEDIA_PACKETS.append((26, packet))
+    if x % 4 == 3:
+        MEDIA_PACKETS.append((27, AUDIO_PACKET))
+
+
+@benchmark("fosc.decode.media", nbytes=sum(len(p) for cmd, p in MEDIA_PACKETS))
+def bench_decode_media(ctx):
+    # the decoders of the command 26 and 27 packets with their sinks, dispatched like ticklecam's ReadThread.proc
+    video = FoscDecoder.FossCmd26()
+    video.sink = FoscVideo.VideoDemuxer()
+    audio = FoscDecoder.FossCmd27()
+    audio.sink = FoscAudio.AudioSink(seconds=1)
+    decoders = dict((decoder.cmd_no(), decoder.decode) for decoder in (video, audio))
+
+    def run():
+        for cmd, packet in MEDIA_PACKETS:
+            decoders[cmd](packet)
+
+    return run
+
+
+@benchmark("fosc.hexdump.4k", nbytes=4096)
+def bench_hexdump(ctx):
+    data = bytes(bytearray(range(256))) * 16
+    highlight = list(range(16, 32)) + list(range(1000, 1200))
+    return lambda: FoscDecoder.hexdump(data, highlight=highlight)
+
+
+def datacompare(size):
+    compare = FoscDecoder.DataCompare()
+    blocks = [bytes(bytearray((x * y) & 0xff for y in range(size))) for x in range(16)]
+    state = {"n": 0}
+
+    def run():
+        state["n"] += 1
+        compare.put(blocks[state["n"] % 16])
+
+    return run
+
+
+@benchmark("fosc.DataCompare.36", nbytes=36)
+def bench_datacompare(ctx):
+    return datacompare(36)
+
+
+@benchmark("fosc.DataCompare.1400", nbytes=1400)
+def bench_datacompare_packet(ctx):
+    # a full network packet, differs almost everywhere
+    return datacompare(1400)
+
+
+def measure(func, rounds, mintime):
+    """
+    :returns: list with the seconds per call of each round, number of calls per round
+    """
+    func()  # warm up
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= mintime:
+            break
+        number *= 2 if elapsed == 0 else max(2, min(10, int(mintime / elapsed) + 1))
+
+    times = [elapsed / number]
+    for _ in range(rounds - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - start) / number)
+    return times, number
+
+
+def gitCommit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BASEDIR,
+                                       stderr=subprocess.DEVNULL).decode("ascii").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(patterns, rounds, mintime, network=True):
+    ctx = Context()
+    results = {}
+    try:
+        for name, setup, nbytes, needsnet in BENCHMARKS:
+            if patterns and not any(p in name for p in patterns):
+                continue
+            if needsnet and not network:
+                continue
+            times, number = measure(setup(ctx), rounds, mintime)
+            median = statistics.median(times)
+            results[name] = {
+                "unit": "op",
+                "ops": 1.0 / median if median else None,
+                "mean": statistics.mean(times),
+                "median": median,
+                "min": min(times),
+                "stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+                "rounds": rounds,
+                "number": number,
+                "bytes": nbytes,
+            }
+    finally:
+        ctx.close()
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "commit": gitCommit(),
+            "time": datetime.datetime.now().isoformat(),
+        },
+        "results": results,
+    }
+
+
+def fmtTime(secs):
+    for unit, factor in (("s", 1), ("ms", 1e3), ("us", 1e6)):
+        if secs * factor >= 1:
+            return "%.2f %s" % (secs * factor, unit)
+    return "%.0f ns" % (secs * 1e9)
+
+
+def printTable(report, baseline=None):
+    print("%-36s %12s %12s %14s" % ("benchmark", "median", "stdev", "MB/s" if baseline is None else "change"))
+    for name, res in sorted(report["results"].items()):
+        extra = ""
+        if baseline is not None:
+            old = baseline["results"].get(name)
+            if old is not None:
+                extra = "%+.1f %%" % ((res["median"] / old["median"] - 1) * 100)
+        elif res["bytes"]:
+            extra = "%.1f" % (res["bytes"] / res["median"] / 1e6)
+        print("%-36s %12s %12s %14s" % (name, fmtTime(res["median"]), fmtTime(res["stdev"]), extra))
+
+
+def regressions(report, baseline, threshold):
+    """
+    :returns: list of (name, ratio) with benchmarks slower than baseline by more than threshold
+    """
+    res = []
+    for name, new in report["results"].items():
+        old = baseline["results"].get(name)
+        if old is not None and old["median"]:
+            ratio = new["median"] / old["median"]
+            if ratio > 1 + threshold:
+                res.append((name, ratio))
+    return res
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="pyFosControl benchmarks")
+    parser.add_argument("-k", dest="patterns", action="append", default=[],
+                        help="run only benchmarks whose name contains this string (repeatable)")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.1, help="min. seconds per round")
+    parser.add_argument("--no-network", action="store_true", help="skip the benchmarks using the simulator")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="compare with results stored by --json")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="relative slowdown regarded as regression (default 0.1)")
+    parser.add_argument("--list", action="store_true", help="list the benchmarks")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name, setup, nbytes, network in BENCHMARKS:
+            print(name)
+        return 0
+
+    report = run(args.patterns, args.rounds, args.min_time, network=not args.no_network)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+    printTable(report, baseline)
+
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump(report, fh, indent=2, sort_keys=True)
+
+    if baseline is not None:
+        slow = regressions(report, baseline, args.threshold)
+        for name, ratio in slow:
+            print("regression: %s is %.2f times slower" % (name, ratio))
+        return 1 if slow else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
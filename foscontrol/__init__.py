@@ -1,7 +1,9 @@
 #!/usr/bin/python3
 # -*- coding: utf-8 -*-
 
+import collections
 import datetime
+import os
 import re
 import socket
 import struct
@@ -19,9 +21,15 @@ except ImportError:
     from urllib.request import urlopen, Request
 
 try:
-    from urllib import urlencode, unquote, urlopen
+    from urllib import urlencode, unquote, quote, urlopen
 except:
-    from urllib.parse import urlencode, unquote
+    from urllib.parse import urlencode, unquote, quote
+
+from . import debuglog, errors, instrument, resilience, transport
+from .multipart import MultipartEncoder, uploadFile
+from .errors import CamError, CircuitOpen, ResultError, CgiFormatError, AuthError, AccessDenied, CgiExecuteError, \
+    CamTimeout, UnknownResultError, SubResultError
+from .transport import clock
 
 def my_urlopen(url, data=None, context=None):
     if sys.hexversion < 0x03040300:
@@ -33,56 +41,12 @@ def my_urlopen(url, data=None, context=None):
 def encode_multipart(fields, files, boundary=None):
     """
     Encodes a file in order to send it as an answer to a form
+    :returns: (body as bytes, headers)
+
+    .. note:: builds the whole body in memory, use :class:`multipart.MultipartEncoder` for large files
     """
-    import mimetypes
-    import random
-    import string
-
-    _BOUNDARY_CHARS = string.digits + string.ascii_letters
-
-    # see http://code.activestate.com/recipes/578668-encode-multipart-form-data-for-uploading-files-via/
-    def escape_quote(s):
-        return s.replace('"', '\\"')
-
-    if boundary is None:
-        boundary = ''.join(random.choice(_BOUNDARY_CHARS) for i in range(30))
-    lines = []
-
-    for name, value in fields.items():
-        lines.extend((
-            '--{0}'.format(boundary),
-            'Content-Disposition: form-data; name="{0}"'.format(escape_quote(name)),
-            '',
-            str(value),
-        ))
-
-    for name, value in files.items():
-        filename = value['filename']
-        if 'mimetype' in value:
-            mimetype = value['mimetype']
-        else:
-            mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
-        lines.extend((
-            '--{0}'.format(boundary),
-            'Content-Disposition: form-data; name="{0}"; filename="{1}"'.format(
-                escape_quote(name), escape_quote(filename)),
-            'Content-Type: {0}'.format(mimetype),
-            '',
-            value['content'],
-        ))
-
-    lines.extend((
-        '--{0}--'.format(boundary),
-        '',
-    ))
-    body = '\r\n'.join(lines)
-
-    headers = {
-        'Content-Type': 'multipart/form-data; boundary={0}'.format(boundary),
-        'Content-Length': str(len(body)),
-    }
-
-    return (body, headers)
+    enc = MultipartEncoder(fields, files, boundary)
+    return (b''.join(bytes(chunk) for chunk in enc), enc.headers)
 
 
 class DictBits(object):
@@ -181,6 +145,7 @@ DC_timeSource = DictChar({"0": "NTP server", "1": "manually"})
 DC_timeDateFormat = DictChar({"0": "YYYY-MM-DD", "1": "DD/MM/YYYY", "2": "MM/DD/YYYY"})
 DC_timeFormat = DictChar({"0": "12 hours", "1": "24 hours"})
 DC_infraLedMode =  DictChar({"0": "auto", "1": "manuel"})
+DC_recordType = DictChar({"0": "schedule", "1": "alarm", "2": "manual"})
 
 def array2dict(source, keyprefix, convertFunc=None):
     """ convert an array to dict
@@ -226,61 +191,114 @@ def long2ip(w):
     return socket.inet_ntoa(struct.pack('<L', w))
 
 
+class Record(collections.namedtuple("Record", "path size startTime endTime recordType")):
+    """ recording on the SD card, see :func:`Cam.getRecordList`
+    - path: full path on the camera
+    - size: bytes
+    - startTime, endTime: unix time stamps
+    - recordType: 0 = schedule, 1 = alarm, 2 = manual
+    """
+    __slots__ = ()
+
+    @property
+    def start(self):
+        return datetime.datetime.fromtimestamp(self.startTime)
+
+    @property
+    def end(self):
+        return datetime.datetime.fromtimestamp(self.endTime)
+
+    @property
+    def typeName(self):
+        return DC_recordType.get(str(self.recordType), "type %s" % self.recordType)
+
+
+def decodeRecord(s):
+    """ convert an entry of getRecordList
+    :param s: e.g. "/mnt/sd/record/MDalarm_20150203_101010.avi+123456+1422954610+1422954670+1"
+              (path+size+startTime+endTime+recordType)
+    :returns: :class:`Record`, None if the entry is empty, or the original string, if it doesn't fit the format
+    """
+    if s == "": return None
+    ma = re.search(r"^(.+)\+(\d+)\+(\d+)\+(\d+)\+(\d+)$", s)
+    if ma is None: return s
+    return Record(ma.group(1), int(ma.group(2)), int(ma.group(3)), int(ma.group(4)), int(ma.group(5)))
+
+
 def emptyStringNone(s):
     if s is None: return None
     if s == "": return None
     return s
 
 
+RESULT_TEXT = {
+    0: "Success",
+    -1: "CGI request string format error",
+    -2: "Username or password error",
+    -3: "Access denied",
+    -4: "CGI execute failure",
+    -5: "Timeout",
+    -6: "Reserve",
+    -7: "Unknown error",
+    -8: "Reserve",
+    None: "Missing result parameter",
+}
+
+
 class ResultObj(object):
     """
     create a resultObject from the XML data returned by the camera.
     XML fields will be accessible as object attributes
     """
 
-    def __init__(self, data):
+    def __init__(self, data, strict=False, cmd=None):
+        """
+        :param data: dict with the decoded XML fields
+        :param strict: raise :class:`errors.SubResultError` in :func:`extendedResult`
+        :param cmd: name of the command (for error messages)
+        """
         self.data = data
+        self.strict = strict
+        self.cmd = cmd
+        self.result = self.parseResult(data.get("result"))
 
-        s = {
-            0: "Success",
-            -1: "CGI request string format error",
-            -2: "Username or password error",
-            -3: "Access denied",
-            -4: "CGI execute failure",
-            -5: "Timeout",
-            -6: "Reserve",
-            -7: "Unknown error",
-            -8: "Reserve",
-            None: "Missing result parameter",
-        }.get(self.result)
-        if not s is None:
-            self.set("_result", s)
+    @staticmethod
+    def parseResult(value):
+        """ "result" field: return as integer, if possible
+        """
+        if value is None: return None
+        try:
+            return int(value)
+        except ValueError:
+            return value
 
     def __getattr__(self, name):
         """
         make XML fields accessible as attributes
-        Special treatment for "result" field: return as integer, if possible
+        "_result" (description of the result code) is only looked up when needed
         """
-        if name == "result":
-            try:
-                return int(self.data.get(name))
-            except ValueError:
-                pass
+        if name == "_result" and name not in self.data:
+            return RESULT_TEXT.get(self.result)
         return self.data.get(name)
 
     def __str__(self):
         w = ""
         for x in self.data.keys():
             w += "%s: %s\n" % (x, self.data[x])
+        if "_result" not in self.data and self.result in RESULT_TEXT:
+            w += "_result: %s\n" % RESULT_TEXT[self.result]
         return w
 
     def get(self, name):
+        if name == "result": return self.result
         return self.__getattr__(name)
 
     def set(self, name, value):
         """ create (or override) attribute name with value
         """
         self.data[name] = value
+        if name == "result":
+            self.result = self.parseResult(value)
 
     def extendedResult(self, name):
         """ override "result", if main result is 0, but subresult is not
@@ -290,6 +308,8 @@ class ResultObj(object):
         if self.result != 0: return
         subresult = self.get(name)
         if subresult is None: return
+        if self.strict and subresult != "0":
+            raise errors.SubResultError(self.cmd, name, subresult, self)
         try:
             self.set("result", abs(int(subresult)))
         except ValueError:
@@ -377,7 +397,8 @@ class CamBase(object):
     - resultObj param "result" is converted to integer, if possible
     """
 
-    def __init__(self, prot, host, port, user, password, context=None):
+    def __init__(self, prot, host, port, user, password, context=None, timeout=resilience.DEFAULT_TIMEOUT,
+                 retry=None, breaker=False, strict=False):
         """
         :param prot: protocol used ("http" or "https")
         :param host: hostname (e.g. "www.example.com")
@@ -385,8 +406,20 @@ class CamBase(object):
         :param user: username of account in camera
         :param password: password of account in camera
         :param context; context for secure TLS connections
+        :param timeout: seconds, either a single value or a tuple (connect timeout, read timeout),
+                        None = wait forever
+        :param retry: :class:`resilience.RetryPolicy` for idempotent commands,
+                      None = default policy, resilience.NO_RETRY = no retries
+        :param breaker: :class:`resilience.CircuitBreaker`, True = default breaker, False = none.
+                        The default breaker has no background probe: the first command after the
+                        reset timeout is sent as trial.
+        :param strict: raise exceptions (see :mod:`errors`) if the camera returns an error code
         """
 
+        self.prot = prot
+        self.host = host
+        self.port = port
+        self.target = "%s:%s" % (host, port)
         self.base = "%s://%s:%s/cgi-bin/CGIProxy.fcgi" % (prot, host, port)
         self.user = user
         self.password = password
@@ -395,17 +428,38 @@ class CamBase(object):
         self.debugfile = None
         self.consoleDump = False
 
+        # instrumentation, see addHook()
+        self.hooks = []
+        self.opener = None
+
+        self.timeout = None
+        self.setTimeout(timeout)
+        self.retry = resilience.RetryPolicy() if retry is None else retry
+        if breaker is True:
+            breaker = resilience.CircuitBreaker()
+        self.breaker = breaker or None
+        self.strict = strict
+
+        # encoded credentials and URLs of commands without parameters, see commandUrl()
+        self.credentialKey = None
+        self.credentialQuery = None
+        self.urlCache = {}
+
         # GetMJStream has is special URL
         p = {"cmd": "GetMJStream", "usr": self.user, "pwd": self.password}
         ps = urlencode(p)
         self.MJStreamURL = "%s://%s:%s/cgi-bin/CGIStream.cgi?%s" % (prot, host, port, ps)
         self.RTSPStreamURL = "rtsp://%s:%s@%s:%s/videoMain" % (user, password, host, port)
 
-    def openDebug(self, filename):
+    def openDebug(self, filename, **options):
         """ dump communication with camera into file
         :param filename: filename to dump into
+        :param options: see :class:`debuglog.DebugWriter` (rotation, compression, queue size, ...)
+
+        The file is written by a background thread, credentials are removed.
         """
-        self.debugfile = open(filename, "w")
+        self.closeDebug()
+        self.debugfile = debuglog.DebugWriter(filename, **options)
 
     def closeDebug(self):
         """ close debug file
@@ -419,6 +473,163 @@ class CamBase(object):
         """
         self.consoleDump = onOff
 
+    def addHook(self, hook):
+        """ register an instrumentation hook for this camera
+        :param hook: object with methods pre(event) and post(event), see :class:`instrument.Hook`
+        """
+        if hook not in self.hooks:
+            self.hooks.append(hook)
+
+    def removeHook(self, hook):
+        if hook in self.hooks:
+            self.hooks.remove(hook)
+
+    def setTimeout(self, timeout):
+        """ set the timeouts of the requests
+        :param timeout: seconds, either a single value or a tuple (connect timeout, read timeout),
+                        None = wait forever
+        """
+        if timeout is not None and not isinstance(timeout, tuple):
+            timeout = (timeout, timeout)
+        self.timeout = timeout
+        self.opener = None
+
+    def setStrict(self, onOff):
+        """ switch strict mode on/off
+        In strict mode error codes of the camera raise :class:`errors.ResultError` (or a subclass),
+        the results returned are always successful.
+        """
+        self.strict = onOff
+
+    def isAvailable(self):
+        """ False if the circuit breaker regards the camera as down, see :class:`resilience.CircuitBreaker`
+        """
+        return self.breaker is None or self.breaker.available()
+
+    def probe(self):
+        """ check whether the camera answers, used by the circuit breaker
+        :raises: exception if the camera is not reachable
+        """
+        self.openUrl(self.commandUrl("getDevName"))
+
+    def commandUrl(self, cmd, param=None):
+        """ build the URL of a command
+        :param cmd: command
+        :param param: list or dictionary of the (already converted) parameters, None or empty = no parameters
+        :returns: URL with command, credentials and parameters
+
+        The encoded credentials are cached until user or password change, the URLs of
+        commands without parameters (getDevState, snapPicture, ptzMoveUp, ...) are cached completely.
+        """
+        self._refreshCredentials()
+        if not param:
+            url = self.urlCache.get(cmd)
+            if url is None:
+                url = self.urlCache[cmd] = "%s?%s&%s" % (self.base, urlencode({"cmd": cmd}), self.credentialQuery)
+            return url
+        return "%s?%s&%s&%s" % (self.base, urlencode({"cmd": cmd}), self.credentialQuery, urlencode(param))
+
+    def _refreshCredentials(self):
+        key = (self.user, self.password)
+        if key != self.credentialKey:
+            self.credentialKey = key
+            self.credentialQuery = urlencode([("usr", self.user), ("pwd", self.password)])
+            self.urlCache = {}
+        return self.credentialQuery
+
+    def recordUrl(self, path):
+        """ URL to download a file of the SD card
+        :param path: path on the camera as returned by getRecordList (e.g. /mnt/sd/record/...)
+        """
+        return "%s?%s" % (urljoin(self.base, quote(path)), self._refreshCredentials())
+
+    def connection(self):
+        """ new HTTP(S) connection to the camera (not yet connected) for keep-alive requests,
+        with the timeouts and the TLS context of the camera
+        """
+        kwargs = {}
+        if self.timeout is not None:
+            kwargs = {"timeout": self.timeout[1], "connectTimeout": self.timeout[0]}
+        if self.prot == "https":
+            return transport.TimedHTTPSConnection(self.host, self.port, context=self.context, **kwargs)
+        return transport.TimedHTTPConnection(self.host, self.port, **kwargs)
+
+    def openUrl(self, url, data=None, headers=None, event=None, out=None):
+        """ send a request to the camera
+        :param event: :class:`instrument.CommandEvent` to record the timings in, or None
+        :param out: file object the body is copied to (in chunks), None = return the body
+        :returns: body of the response, or its size if out is given
+        """
+        if hasattr(data, "rewind"):
+            # streamed body (MultipartEncoder), sent again from the start
+            data.rewind()
+        if event is None and self.timeout is None:
+            if headers is None:
+                resp = my_urlopen(url, data=data, context=self.context)
+            else:
+                resp = my_urlopen(Request(url, data=data, headers=headers), context=self.context)
+        else:
+            if self.opener is None:
+                self.opener = transport.buildOpener(self.context,
+                                                    connectTimeout=None if self.timeout is None else self.timeout[0])
+            request = Request(url, data=data, headers=headers or {})
+            if self.timeout is None:
+                resp = self.opener.open(request)
+            else:
+                resp = self.opener.open(request, timeout=self.timeout[1])
+        try:
+            if out is None:
+                retdata = resp.read()
+                size = len(retdata)
+            else:
+                size = 0
+                while True:
+                    chunk = resp.read(65536)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+                    size += len(chunk)
+                retdata = size
+        finally:
+            resp.close()
+        if event is not None:
+            event.timings.update(resp.timings)
+            event.timings["total"] = clock() - event.start
+            event.bytesIn = size
+        return retdata
+
+    def fetch(self, cmd, url, data=None, headers=None, event=None):
+        """ openUrl() with circuit breaker and retries
+        :raises: :class:`CircuitOpen` if the camera is regarded as down
+        """
+        if self.breaker is not None:
+            self.breaker.check(self.target)
+        attempts = self.retry.attemptsFor(cmd) if self.retry is not None else 1
+        attempt = 0
+        while True:
+            attempt += 1
+            if event is not None:
+                event.attempts = attempt
+            try:
+                retdata = self.openUrl(url, data=data, headers=headers, event=event)
+            except Exception as err:
+                if not resilience.isNetworkError(err):
+                    # the camera did answer
+                    if self.breaker is not None: self.breaker.success()
+                    raise
+                if attempt >= attempts:
+                    # one failure per command, not per attempt
+                    if self.breaker is not None: self.breaker.failure()
+                    raise
+                self.retry.sleep(self.retry.delay(attempt))
+                continue
+            if self.breaker is not None: self.breaker.success()
+            return retdata
+
+    def callHooks(self, method, event):
+        for hook in instrument.globalHooks() + self.hooks:
+            getattr(hook, method)(event)
+
     def decodeResult(self, xmldata, doBool=None):
         """decode XML resulted by API call
         :param xmldata: the xml string
@@ -473,46 +684,69 @@ class CamBase(object):
         :param headers: headers of the request (used in POST)
         :param data:    data used for POST
         :return: resultObj with decoded data or raw data
+        :raises: :class:`errors.ResultError` in strict mode if the result code is not 0
         """
 
-        if param is None: param = {}
-
-        # convert boolean to "0"/"1"
-        if not doBool is None:
-            for p in param:
-                if p in doBool:
-                    if param[p] is True: param[p] = "1"
-                    if param[p] is False: param[p] = "0"
+        if param:
+            # convert boolean to "0"/"1"
+            if not doBool is None:
+                for p in param:
+                    if p in doBool:
+                        if param[p] is True: param[p] = "1"
+                        if param[p] is False: param[p] = "0"
 
-        pa = {"cmd": cmd, "usr": self.user, "pwd": self.password}
+            # drop params set to None
+            param = [(p, v) for p, v in param.items() if not v is None]
 
-        # add params not set to None
-        for p in param:
-            if not param[p] is None:
-                pa[p] = param[p]
+        url = self.commandUrl(cmd, param)
+        self.dump(url)
 
-        ps = urlencode(pa)
+        event = None
+        if self.hooks or instrument.globalHooks():
+            event = instrument.CommandEvent(cmd, self.host, self.port, len(url) + len(data or b""))
+            self.callHooks("pre", event)
 
-        if self.consoleDump:
-            print("%s?%s\n\n" % (self.base, ps))
-        if not self.debugfile is None: self.debugfile.write("%s?%s\n\n" % (self.base, ps))
-        url = self.base + "?" + ps
+        try:
+            retdata = self.fetch(cmd, url, data=data, headers=headers, event=event)
+            self.dump(retdata)
 
-        if headers is None:
-            retdata = my_urlopen(url, data=data, context=self.context).read()
-        else:
-            request = Request(url, data=data, headers=headers)
-            retdata = my_urlopen(request, context=self.context).read()
+            if raw:
+                reso = retdata
+            else:
+                reso = self.makeResult(cmd, retdata, doBool=doBool, event=event)
+        except Exception as err:
+            if event is not None:
+                event.error = err
+                event.timings.setdefault("total", clock() - event.start)
+                self.callHooks("post", event)
+            raise
+
+        if event is not None:
+            self.callHooks("post", event)
+        return reso
 
+    def dump(self, data):
+        """ write a request URL or an answer to the console and the debug file, if enabled
+        :param data: str or bytes
+        """
         if self.consoleDump:
-            print("%s\n\n" % retdata)
-        if not self.debugfile is None: self.debugfile.write("%s\n\n" % (retdata))
-
-        if raw:
-            return retdata
-
+            text = data.decode("utf-8", "replace") if isinstance(data, bytes) else data
+            print("%s\n\n" % debuglog.redact(text))
+        if not self.debugfile is None: self.debugfile.write(data)
+
+    def makeResult(self, cmd, retdata, doBool=None, event=None):
+        """ decode the answer of a command
+        :returns: resultObj
+        :raises: :class:`errors.ResultError` in strict mode if the result code is not 0
+        """
+        decodestart = clock()
         res = self.decodeResult(retdata, doBool=doBool)
-        reso = ResultObj(res)
+        reso = ResultObj(res, strict=self.strict, cmd=cmd)
+        if event is not None:
+            event.timings["decode"] = clock() - decodestart
+            event.result = reso.result
+        if self.strict and reso.result != 0:
+            raise errors.resultError(cmd, reso.result, reso, RESULT_TEXT.get(reso.result))
         return reso
 
     # image settings
@@ -690,6 +924,15 @@ class CamBase(object):
     def ptzReset(self):
         return self.sendcommand("ptzReset")
 
+    def ptzController(self, **options):
+        """ controller for joysticks: warm connection, coalescing of superseded moves, latency reporting
+        :param options: see :class:`ptz.PTZController`
+        :returns: :class:`ptz.PTZController`, close() it when done
+        """
+        from .ptz import PTZController
+
+        return PTZController(self, **options)
+
     def ptzMoveDown(self):
         return self.sendcommand("ptzMoveDown")
 
@@ -796,31 +1039,56 @@ class CamBase(object):
     def restoreToFactorySetting(self):
         return self.sendcommand("restoreToFactorySetting")
 
-    def exportConfig(self):
+    def exportConfig(self, out=None):
         """ queries the camera for a blob with all settings
 
-        :return: tuple with data and filename (provided by the camera) or None (in case of an error)
+        :param out: file object to write the blob into, None = return the blob
+        :return: tuple with data (or its size if out is given) and filename (provided by the camera)
+                 or None (in case of an error)
         """
         w = self.sendcommand("exportConfig")
 
         if w.result == 0:
             link = "/configs/export/%s" % w.fileName
             link2 = urljoin(self.base, link)
-            data = my_urlopen(link2, context=self.context).read()
+            data = self.openUrl(link2, out=out)
             return (data, w.fileName)
         else:
             return None
 
     def importConfig(self, filedata, filename):
         """ send config file to camera
-        :param filedata: binary content of the config file
+        :param filedata: binary content of the config file (bytes, memoryview) or a binary file object,
+                         a file is sent in chunks from its current position
         :param filename: filename of the config file
         .. note:: camera will reboot after successful upload and not be responsive for some time
         """
-        fields = {'submit': 'import'}
-        files = {'file': {'filename': filename, 'content': filedata}}
-        data, headers = encode_multipart(fields, files)
-        return self.sendcommand("importConfig", headers=headers, data=data)
+        data = MultipartEncoder({'submit': 'import'}, {'file': uploadFile(filedata, filename)})
+        return self.sendcommand("importConfig", headers=data.headers, data=data)
+
+    def importConfigFile(self, path):
+        """ send a config file from disk to the camera, with constant memory usage
+        :param path: name of the config file
+        """
+        with open(path, 'rb') as fh:
+            return self.importConfig(fh, os.path.basename(path))
+
+    def upgradeFirmware(self, filedata, filename):
+        """ upload a firmware image to the camera
+        :param filedata: binary content of the image (bytes, memoryview, mmap) or a binary file object,
+                         sent in chunks
+        :param filename: filename of the image
+        .. note:: camera will reboot after successful upload and not be responsive for some time
+        """
+        data = MultipartEncoder({'submit': 'upgrade'}, {'file': uploadFile(filedata, filename)})
+        return self.sendcommand("fwUpgrade", headers=data.headers, data=data)
+
+    def upgradeFirmwareFile(self, path):
+        """ upload a firmware image from disk, with constant memory usage
+        :param path: name of the image file
+        """
+        with open(path, 'rb') as fh:
+            return self.upgradeFirmware(fh, os.path.basename(path))
 
     def snapPicture(self):
         """ queries the camera for a snapshot
@@ -1182,7 +1450,7 @@ class Cam(CamBase):
 
         link2 = urljoin(self.base, link)
 
-        data = my_urlopen(link2, context=self.context).read()
+        data = self.openUrl(link2)
         return (data, fname)
 
     def getPTZSpeed(self):
@@ -1388,6 +1656,33 @@ class Cam(CamBase):
         res.set("_log", bigarray)
         return res
 
+    def getRecordList(self, recordPath=None, startTime=None, endTime=None, recordType=None):
+        """ all recordings (all pages) matching the filter
+        :param recordPath: path of the recordings on the camera, None = default
+        :param startTime: unix time stamp, only recordings starting at or after it
+        :param endTime: unix time stamp, only recordings ending at or before it
+        :param recordType: 0 = schedule, 1 = alarm, 2 = manual, None = all
+        :returns: resultObj, "_record" contains a list of :class:`Record`
+        """
+        res = CamBase.getRecordList(self, recordPath, startTime, endTime, recordType)
+        if res.result != 0:
+            return res
+        total = int(res.totalCnt)
+        offset = 0
+        bigarray = []
+        while True:
+            res.collectArray("record", "_record", convertFunc=decodeRecord)
+            bigarray += res._record or []
+            curcnt = int(res.curCnt or 0)
+            offset += curcnt
+            if curcnt == 0 or offset >= total:
+                break
+            res = CamBase.getRecordList(self, recordPath, startTime, endTime, recordType, startNo=offset)
+            if res.result != 0:
+                return res
+        res.set("_record", bigarray)
+        return res
+
     def ptzAddPresetPoint(self, name):
         res = CamBase.ptzAddPresetPoint(self, name)
         res.extendedResult("addResult")
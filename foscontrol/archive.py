@@ -0,0 +1,456 @@
+# -*- coding: utf-8 -*-
+
+"""
+archive of snapshots in large append-only segment files
+
+    archive = SnapshotArchive("/srv/snapshots", segmentSize=256 * 1024 * 1024)
+    archive.append("garden", jpeg, time.time())
+    for when, picture in archive.find("garden", start=yesterday, end=today):
+        ...                                   # picture is a memoryview into the segment
+    archive.compact(lambda camera, when, length: when > time.time() - 30 * 86400)
+
+Files in the directory:
+
+- seg-NNNNNN.dat: the snapshots, each preceded by a header (magic, camera, time, length)
+- seg-NNNNNN.log: index of the segment being written, in the order of the snapshots
+- seg-NNNNNN.idx: index of a full (sealed) segment, sorted by camera and time
+- compaction:     manifest of a running compact()
+
+An index entry has a fixed size (camera: 32 bytes, time, offset, length).  The index
+of a sealed segment is mapped into memory (mmap) and searched binary, the segment
+itself is mapped as well, so a snapshot is returned as a memoryview of the mapping
+without copying it.  The entries of the segment being written are kept in memory.
+
+A segment is sealed when the next snapshot would exceed segmentSize (or by rotate()).
+compact() copies the snapshots to keep from the sealed segments into new ones and
+removes the old files, so deleted snapshots and small segments disappear.  Before it
+starts, the manifest records the old segments and the number of the first new one;
+it is marked done when the new segments are sealed.  If the archive is opened with a
+manifest left by a crash, the compaction is completed (done: the old segments are
+removed) or rolled back (the new segments are removed).
+
+The data of a snapshot is written before its index entry: after a crash the data
+without an index entry is cut off when the archive is opened again, and the index
+entries without complete data (checked by the header of the snapshot) are dropped.  Keys returned
+by append() (segment, offset, length) are only valid until the next compact().
+"""
+
+import bisect
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+
+SEGMENT_SIZE = 256 * 1024 * 1024
+
+MAGIC = b"FSNP"
+HEADER = struct.Struct("<4s32sdI")  # magic, camera, time, length
+ENTRY = struct.Struct("<32sdQI")  # camera, time, offset of the data, length
+
+COMPACTION = "compaction"
+
+_SEGMENT_RE = re.compile(r"^seg-(\d{6})\.dat$")
+
+
+def cameraKey(camera):
+    """
+    :returns: camera name as stored in the index (32 bytes)
+    """
+    key = camera.encode("utf-8")
+    if len(key) > 32:
+        raise ValueError("camera name longer than 32 bytes: %s" % camera)
+    return key.ljust(32, b"\x00")
+
+
+class IndexView(object):
+    """
+    sequence of (camera key, time) of a mapped index, for bisect
+    """
+
+    def __init__(self, buf):
+        self.buf = buf
+        self.count = len(buf) // ENTRY.size
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        return ENTRY.unpack_from(self.buf, index * ENTRY.size)[:2]
+
+    def entry(self, index):
+        return ENTRY.unpack_from(self.buf, index * ENTRY.size)
+
+
+class Segment(object):
+    """
+    one segment file and its index
+    """
+
+    def __init__(self, directory, number):
+        self.number = number
+        base = os.path.join(directory, "seg-%06d" % number)
+        self.dataName = base + ".dat"
+        self.indexName = base + ".idx"
+        self.logName = base + ".log"
+        self.size = 0
+        self.entries = []  # (camera key, time, offset, length) of an unsealed segment
+        self.dataMap = None
+        self.indexMap = None
+        self.index = None
+        self.sealed = os.path.exists(self.indexName)
+
+    def open(self):
+        """ map a sealed segment, or load the log of an unsealed one
+        """
+        self.size = os.path.getsize(self.dataName)
+        if self.sealed:
+            self.indexMap = _mapFile(self.indexName)
+            self.index = IndexView(self.indexMap if self.indexMap is not None else b"")
+            return
+        data = b""
+        if os.path.exists(self.logName):
+            with open(self.logName, "rb") as fh:
+                data = fh.read()
+        self.entries = self.checkLog(data)
+        # cut off what was written after the last valid index entry (crash)
+        end = self.entries[-1][2] + self.entries[-1][3] if self.entries else 0
+        if self.size > end:
+            with open(self.dataName, "r+b") as fh:
+                fh.truncate(end)
+            self.size = end
+        if len(data) != len(self.entries) * ENTRY.size:
+            with open(self.logName, "r+b") as fh:
+                fh.truncate(len(self.entries) * ENTRY.size)
+
+    def checkLog(self, data):
+        """ the entries of the log whose snapshot is completely in the data file
+
+        The file system may have written the log, but not (all of) the data, e.g. a
+        data file filled up with zeros.  The entries from the first one whose header
+        does not match are dropped.
+        :returns: list of entries
+        """
+        entries = []
+        with open(self.dataName, "rb") as fh:
+            for x in range(len(data) // ENTRY.size):
+                entry = ENTRY.unpack_from(data, x * ENTRY.size)
+                key, when, offset, length = entry
+                if offset < HEADER.size or offset + length > self.size:
+                    break
+                fh.seek(offset - HEADER.size)
+                if HEADER.unpack(fh.read(HEADER.size)) != (MAGIC, key, when, length):
+                    break
+                entries.append(entry)
+        return entries
+
+    def view(self, offset, length):
+        """
+        :returns: memoryview of the data, without copying
+        """
+        if self.dataMap is None or len(self.dataMap) < offset + length:
+            # the mapping of a growing segment is renewed, views of the old one stay valid
+            self.dataMap = _mapFile(self.dataName)
+        return memoryview(self.dataMap)[offset:offset + length]
+
+    def lookup(self, key, start, end):
+        """
+        :returns: list of (time, offset, length) of a camera, start <= time <= end
+        """
+        if self.sealed:
+            index = self.index
+            first = bisect.bisect_left(index, (key, start))
+            last = bisect.bisect_right(index, (key, end))
+            return [index.entry(x)[1:] for x in range(first, last)]
+        return [e[1:] for e in self.entries if e[0] == key and start <= e[1] <= end]
+
+    def allEntries(self):
+        if self.sealed:
+            return [self.index.entry(x) for x in range(len(self.index))]
+        return list(self.entries)
+
+    def remove(self):
+        """ delete the files of the segment
+        """
+        self.close()
+        for name in (self.dataName, self.indexName, self.indexName + ".tmp", self.logName):
+            if os.path.exists(name):
+                os.remove(name)
+
+    def close(self):
+        for name in ("dataMap", "indexMap"):
+            mm = getattr(self, name)
+            setattr(self, name, None)
+            if mm is not None:
+                try:
+                    mm.close()
+                except BufferError:
+                    pass  # still used by views handed out, freed with them
+        self.index = None
+
+
+def _mapFile(name):
+    """
+    :returns: read-only mmap of the file, None if it is empty
+    """
+    with open(name, "rb") as fh:
+        if os.fstat(fh.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class SnapshotArchive(object):
+    """
+    append-only archive of snapshots, see module description
+    """
+
+    def __init__(self, directory, segmentSize=SEGMENT_SIZE, clock=time.time):
+        """
+        :param directory: directory of the segment files, created if missing
+        :param segmentSize: a segment is sealed before it exceeds this size
+        """
+        self.directory = directory
+        self.segmentSize = segmentSize
+        self.clock = clock
+        self.lock = threading.RLock()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.finishCompaction()
+
+        self.segments = {}
+        for name in sorted(os.listdir(directory)):
+            ma = _SEGMENT_RE.match(name)
+            if ma:
+                segment = Segment(directory, int(ma.group(1)))
+                segment.open()
+                self.segments[segment.number] = segment
+
+        self.active = None
+        self.dataFile = None
+        self.logFile = None
+        unsealed = [s for s in self.segments.values() if not s.sealed]
+        for segment in sorted(unsealed, key=lambda s: s.number)[:-1]:
+            self.seal(segment)  # left over by an interrupted rotation
+        if unsealed:
+            self.activate(max(unsealed, key=lambda s: s.number))
+
+    def writeCompaction(self, first, old, done):
+        """ write the manifest of compact(), replaces the previous one atomically
+        :param first: number of the first new segment
+        :param old: numbers of the segments being replaced
+        :param done: the new segments are complete
+        """
+        name = os.path.join(self.directory, COMPACTION)
+        with open(name + ".tmp", "w") as fh:
+            fh.write("first %d\nold %s\n" % (first, " ".join(str(n) for n in old)))
+            if done:
+                fh.write("done\n")
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.rename(name + ".tmp", name)
+
+    def finishCompaction(self):
+        """ complete or roll back a compact() interrupted by a crash
+        """
+        name = os.path.join(self.directory, COMPACTION)
+        if os.path.exists(name + ".tmp"):
+            os.remove(name + ".tmp")
+        if not os.path.exists(name):
+            return
+        with open(name) as fh:
+            fields = dict((line.split()[0], line.split()[1:]) for line in fh if line.strip())
+        if "done" in fields:
+            numbers = [int(n) for n in fields["old"]]
+        else:
+            first = int(fields["first"][0])
+            numbers = [int(ma.group(1)) for ma in map(_SEGMENT_RE.match, os.listdir(self.directory))
+                       if ma and int(ma.group(1)) >= first]
+        for number in numbers:
+            Segment(self.directory, number).remove()
+        os.remove(name)
+
+    def nextNumber(self):
+        return max(self.segments) + 1 if self.segments else 1
+
+    def activate(self, segment):
+        self.active = segment
+        self.dataFile = open(segment.dataName, "ab")
+        self.logFile = open(segment.logName, "ab")
+
+    def newSegment(self):
+        segment = Segment(self.directory, self.nextNumber())
+        open(segment.dataName, "wb").close()
+        self.segments[segment.number] = segment
+        return segment
+
+    def append(self, camera, data, when=None):
+        """ add a snapshot, can be used as store of :class:`dedup.SnapshotDedup`
+        :param data: JPEG data (bytes, memoryview)
+        :param when: unix time, default now
+        :returns: key (segment, offset, length)
+        """
+        key = cameraKey(camera)
+        if when is None:
+            when = self.clock()
+        length = len(data)
+        with self.lock:
+            segment = self.active
+            if segment is not None and segment.size and segment.size + HEADER.size + length > self.segmentSize:
+                self.rotate()
+                segment = None
+            if segment is None:
+                segment = self.newSegment()
+                self.activate(segment)
+            offset = segment.size + HEADER.size
+            self.dataFile.write(HEADER.pack(MAGIC, key, when, length))
+            self.dataFile.write(data)
+            self.dataFile.flush()
+            entry = (key, when, offset, length)
+            self.logFile.write(ENTRY.pack(*entry))
+            self.logFile.flush()
+            segment.entries.append(entry)
+            segment.size = offset + length
+            return (segment.number, offset, length)
+
+    def sync(self):
+        """ write the open segment to disk (fsync)
+        """
+        with self.lock:
+            if self.active is not None:
+                os.fsync(self.dataFile.fileno())
+                os.fsync(self.logFile.fileno())
+
+    def rotate(self):
+        """ seal the segment being written, the next snapshot starts a new one
+        """
+        with self.lock:
+            if self.active is None:
+                return
+            self.dataFile.close()
+            self.logFile.close()
+            segment, self.active = self.active, None
+            self.dataFile = self.logFile = None
+            self.seal(segment)
+
+    def seal(self, segment):
+        """ write the sorted index of a segment and map it
+        """
+        tmp = segment.indexName + ".tmp"
+        with open(tmp, "wb") as fh:
+            for entry in sorted(segment.entries, key=lambda e: e[:2]):
+                fh.write(ENTRY.pack(*entry))
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.rename(tmp, segment.indexName)
+        if os.path.exists(segment.logName):
+            os.remove(segment.logName)
+        segment.close()
+        segment.entries = []
+        segment.sealed = True
+        segment.open()
+
+    def read(self, key):
+        """
+        :param key: result of append()
+        :returns: memoryview of the snapshot
+        """
+        number, offset, length = key
+        with self.lock:
+            return self.segments[number].view(offset, length)
+
+    def find(self, camera, start=None, end=None):
+        """ snapshots of a camera in a period
+        :param start: unix time, None = no limit
+        :param end: unix time, None = no limit
+        :returns: list of (time, memoryview), ordered by time
+        """
+        key = cameraKey(camera)
+        start = float("-inf") if start is None else start
+        end = float("inf") if end is None else end
+        res = []
+        with self.lock:
+            for segment in self.segments.values():
+                for when, offset, length in segment.lookup(key, start, end):
+                    res.append((when, segment.number, offset, length))
+            res.sort()
+            return [(when, self.segments[number].view(offset, length)) for when, number, offset, length in res]
+
+    def get(self, camera, when):
+        """
+        :returns: memoryview of the snapshot of the camera taken at `when`, None if there is none
+        """
+        found = self.find(camera, when, when)
+        return found[0][1] if found else None
+
+    def compact(self, keep=None):
+        """ copy the snapshots to keep from the sealed segments into new segments and remove the old ones
+        :param keep: function (camera, time, length) returning False for snapshots to drop, None = keep all
+                     (only merges the segments)
+        :returns: (number of snapshots dropped, bytes freed)
+        """
+        with self.lock:
+            old = [s for s in self.segments.values() if s.sealed]
+            if not old:
+                return 0, 0
+            before = sum(s.size for s in old)
+            numbers = sorted(s.number for s in old)
+            first = self.nextNumber()
+            self.writeCompaction(first, numbers, False)
+            dropped = 0
+            target = None
+            written = []
+            out = None
+            entries = []
+            for segment in sorted(old, key=lambda s: s.number):
+                for cam, when, offset, length in segment.allEntries():
+                    camera = cam.rstrip(b"\x00").decode("utf-8")
+                    if keep is not None and not keep(camera, when, length):
+                        dropped += 1
+                        continue
+                    if target is None or (target.size and target.size + HEADER.size + length > self.segmentSize):
+                        if target is not None:
+                            os.fsync(out.fileno())
+                            out.close()
+                            target.entries = entries
+                            written.append(target)
+                        target = self.newSegment()
+                        out = open(target.dataName, "ab")
+                        entries = []
+                    out.write(HEADER.pack(MAGIC, cam, when, length))
+                    out.write(segment.view(offset, length))
+                    entries.append((cam, when, target.size + HEADER.size, length))
+                    target.size += HEADER.size + length
+            if target is not None:
+                os.fsync(out.fileno())
+                out.close()
+                target.entries = entries
+                written.append(target)
+
+            for segment in written:
+                self.seal(segment)
+            self.writeCompaction(first, numbers, True)
+            for segment in old:
+                del self.segments[segment.number]
+                segment.remove()
+            os.remove(os.path.join(self.directory, COMPACTION))
+            return dropped, before - sum(s.size for s in written)
+
+    def stats(self):
+        """
+        :returns: dict with the number of segments, snapshots and bytes (segment files)
+        """
+        with self.lock:
+            segments = list(self.segments.values())
+            return {"segments": len(segments),
+                    "snapshots": sum(len(s.index) if s.sealed else len(s.entries) for s in segments),
+                    "bytes": sum(s.size for s in segments)}
+
+    def close(self):
+        with self.lock:
+            if self.active is not None:
+                self.dataFile.close()
+                self.logFile.close()
+                self.active = None
+            for segment in self.segments.values():
+                segment.close()
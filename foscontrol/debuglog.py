@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+"""
+debug dump of the communication with the camera
+
+The records are put into a bounded queue and written by a background thread,
+so the calling thread never waits for the disk.  If the queue is full the
+record is dropped and counted.  Credentials are removed by the writer thread
+before the record reaches the file:
+
+- URL parameters: usr, pwd and the password parameters of the account, FTP, SMTP, DDNS,
+  and wifi commands
+- XML results: password, psk, and wifi key fields
+
+The file is rotated when it exceeds maxBytes (filename.1, filename.2, ...),
+rotated files can be compressed with gzip (filename.1.gz, ...).
+"""
+
+import gzip
+import os
+import re
+import shutil
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+# parameters in URLs
+_SECRET_PARAMS = re.compile(r"([?&](?:usr|pwd|usrPwd|oldPwd|newPwd|passWord|password|psk|key[1-4])=)[^&\s]*")
+# fields in XML results
+_SECRET_FIELDS = re.compile(r"<(password|pwd|psk|key[1-4])>[^<]*</\1>")
+
+REDACTED = "***"
+
+_STOP = object()
+
+
+def redact(text):
+    """
+    replace credentials in URLs and XML results
+    """
+    text = _SECRET_PARAMS.sub(r"\1" + REDACTED, text)
+    return _SECRET_FIELDS.sub(r"<\1>" + REDACTED + r"</\1>", text)
+
+
+class DebugWriter(object):
+    """
+    asynchronous, redacting, rotating debug file
+
+    w = DebugWriter("/tmp/cam.log", maxBytes=1000000, backupCount=3, compress=True)
+    w.write(url)
+    w.write(response)
+    w.close()
+    """
+
+    def __init__(self, filename, maxBytes=10 * 1024 * 1024, backupCount=5, compress=False, queueSize=10000,
+                 maxRecord=4096, redactSecrets=True, append=False):
+        """
+        :param filename: name of the debug file
+        :param maxBytes: rotate the file if it gets bigger, 0 = never rotate
+        :param backupCount: number of rotated files to keep
+        :param compress: compress rotated files with gzip
+        :param queueSize: max. number of records waiting to be written
+        :param maxRecord: records are cut off after this number of characters (e.g. pictures), 0 = no limit
+        :param redactSecrets: remove credentials
+        :param append: append to an existing file instead of overwriting it
+        """
+        self.filename = filename
+        self.maxBytes = maxBytes
+        self.backupCount = backupCount
+        self.compress = compress
+        self.maxRecord = maxRecord
+        self.redactSecrets = redactSecrets
+
+        self.queue = queue.Queue(queueSize)
+        self.lock = threading.Lock()
+        self.fh = open(filename, "a" if append else "w")
+        self.size = self.fh.tell()
+
+        self.written = 0
+        self.dropped = 0
+        self.rotations = 0
+        self.errors = 0  # records lost by errors while formatting, writing or rotating
+        self.lastError = None
+
+        self.thread = threading.Thread(target=self.run, name="DebugWriter")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def write(self, data):
+        """
+        queue a record, never blocks
+        :param data: str or bytes
+        """
+        try:
+            self.queue.put_nowait(data)
+        except queue.Full:
+            self.dropped += 1
+
+    def format(self, data):
+        if isinstance(data, bytes):
+            data = data.decode("utf-8", "replace")
+        # redact before cutting off, a cut inside a secret would hide it from the patterns
+        if self.redactSecrets:
+            data = redact(data)
+        if self.maxRecord and len(data) > self.maxRecord:
+            data = "%s... [%s characters]" % (data[:self.maxRecord], len(data))
+        return data + "\n\n"
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            batch = [item]
+            # write everything waiting at once
+            while item is not _STOP:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(item)
+
+            with self.lock:
+                for item in batch:
+                    if item is _STOP:
+                        self.flush()
+                        return
+                    try:
+                        self.writeRecord(item)
+                    except Exception as err:
+                        # the thread must survive, else the queue fills up
+                        self.errors += 1
+                        self.lastError = err
+                self.flush()
+
+    def writeRecord(self, item):
+        if self.fh.closed:
+            # a failed rotation
+            self.fh = open(self.filename, "a")
+            self.size = self.fh.tell()
+        text = self.format(item)
+        self.fh.write(text)
+        self.size += len(text.encode("utf-8"))
+        self.written += 1
+        if self.maxBytes and self.size >= self.maxBytes:
+            self.rotate()
+
+    def flush(self):
+        try:
+            if not self.fh.closed:
+                self.fh.flush()
+        except Exception as err:
+            self.errors += 1
+            self.lastError = err
+
+    def backupName(self, index):
+        return "%s.%s%s" % (self.filename, index, ".gz" if self.compress else "")
+
+    def rotate(self):
+        self.fh.close()
+        if self.backupCount > 0:
+            for index in range(self.backupCount - 1, 0, -1):
+                src = self.backupName(index)
+                if os.path.exists(src):
+                    os.rename(src, self.backupName(index + 1))
+            if self.compress:
+                with open(self.filename, "rb") as src:
+                    with gzip.open(self.backupName(1), "wb") as dst:
+                        shutil.copyfileobj(src, dst)
+                os.remove(self.filename)
+            else:
+                os.rename(self.filename, self.backupName(1))
+        self.fh = open(self.filename, "w")
+        self.size = 0
+        self.rotations += 1
+
+    def stats(self):
+        return {"written": self.written, "dropped": self.dropped, "rotations": self.rotations,
+                "errors": self.errors, "queued": self.queue.qsize()}
+
+    def close(self):
+        """
+        write the remaining records and close the file
+        """
+        if self.thread is None:
+            return
+        # the writer thread may have died, don't wait for space in its queue forever
+        while self.thread.is_alive():
+            try:
+                self.queue.put(_STOP, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        self.thread.join()
+        self.thread = None
+        self.fh.close()
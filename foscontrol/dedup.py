@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+
+"""
+deduplication of snapshots with perceptual hashes
+
+    dedup = SnapshotDedup(store, threshold=4)
+    key, stored = dedup.snap("garden", cam)      # snapPicture + ingest
+    print(dedup.stats())
+
+Most snapshots of a quiet scene differ only by noise and compression artefacts, so
+their bytes differ, but not their content.  The picture is reduced to a few gray
+pixels and hashed (64 bit):
+
+- average: 8 x 8 pixels, a bit is set if the pixel is brighter than the mean
+- dct:     32 x 32 pixels, the 8 x 8 lowest frequencies of the DCT, a bit is set if
+           the coefficient is above their median (more robust against brightness changes)
+
+A snapshot whose hash differs in at most `threshold` bits from the last stored one of
+the same camera is not stored again, the stored one gets another reference instead.
+
+The decoder producing the gray pixels is pluggable, the default one requires Pillow
+(it decodes the JPEG at a reduced size, see Image.draft).  The store is a function
+(camera, data, time) returning a key, e.g. a file name or the position in an archive.
+"""
+
+import math
+import threading
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+HASH_SIZE = 8
+DCT_SIZE = 32
+
+
+def pilDecoder(data, size):
+    """ decode a JPEG with Pillow
+    :returns: size x size gray pixels, row by row (bytes)
+    """
+    import io
+    from PIL import Image
+
+    img = Image.open(io.BytesIO(data))
+    img.draft("L", (size * 2, size * 2))
+    return img.convert("L").resize((size, size), Image.BILINEAR).tobytes()
+
+
+def averageHash(pixels):
+    """
+    :param pixels: 8 x 8 gray values
+    :returns: 64 bit hash
+    """
+    mean = sum(pixels) / float(len(pixels))
+    res = 0
+    for p in pixels:
+        res = (res << 1) | (p > mean)
+    return res
+
+
+_DCT_TABLE = [[math.cos(math.pi * (2 * x + 1) * u / (2.0 * DCT_SIZE)) for x in range(DCT_SIZE)]
+              for u in range(HASH_SIZE)]
+_DCT_MATRIX = None if numpy is None else numpy.array(_DCT_TABLE)
+
+
+def dctCoefficients(pixels):
+    """
+    :param pixels: 32 x 32 gray values
+    :returns: the 8 x 8 lowest frequencies of the DCT, row by row (numpy if available)
+    """
+    n = DCT_SIZE
+    if numpy is not None:
+        # separable DCT as two matrix products: table x pixels x table transposed
+        square = numpy.asarray(pixels, dtype=float).reshape(n, n)
+        return _DCT_MATRIX.dot(square).dot(_DCT_MATRIX.T).ravel().tolist()
+    rows = [pixels[y * n:(y + 1) * n] for y in range(n)]
+    # separable DCT, only the frequencies needed: first along the rows, then the columns
+    rowCoeffs = [[sum(c * p for c, p in zip(cos, row)) for cos in _DCT_TABLE] for row in rows]
+    return [sum(cos[y] * rowCoeffs[y][u] for y in range(n)) for cos in _DCT_TABLE for u in range(HASH_SIZE)]
+
+
+def dctHash(pixels):
+    """
+    :param pixels: 32 x 32 gray values
+    :returns: 64 bit hash of the lowest frequencies
+    """
+    coeffs = dctCoefficients(pixels)
+    median = sorted(coeffs[1:])[len(coeffs) // 2 - 1]  # without the DC coefficient (mean brightness)
+    res = 0
+    for c in coeffs:
+        res = (res << 1) | (c > median)
+    return res
+
+
+METHODS = {"average": (HASH_SIZE, averageHash), "dct": (DCT_SIZE, dctHash)}
+
+
+def hamming(a, b):
+    """
+    :returns: number of different bits
+    """
+    return bin(a ^ b).count("1")
+
+
+class SnapshotDedup(object):
+    """
+    stores a snapshot only if it differs from the last one of the camera, see module description
+    """
+
+    def __init__(self, store, threshold=4, thresholds=None, method="average", decoder=None, clock=time.time):
+        """
+        :param store: function (camera, data, time) storing a snapshot, returns its key
+        :param threshold: max. number of different bits of a duplicate
+        :param thresholds: dict {camera: threshold} for single cameras
+        :param method: "average" or "dct"
+        :param decoder: function (data, size) returning size x size gray pixels, default Pillow
+        """
+        if method not in METHODS:
+            raise ValueError("unknown hash method: %s" % method)
+        self.store = store
+        self.threshold = threshold
+        self.thresholds = thresholds or {}
+        self.method = method
+        self.decoder = pilDecoder if decoder is None else decoder
+        self.clock = clock
+
+        self.lock = threading.Lock()
+        self.cameraLocks = {}  # camera: lock held by ingest() from the comparison until the snapshot is recorded
+        self.last = {}  # camera: (hash, key) of the last stored snapshot
+        self.refs = {}  # key: number of snapshots represented by it
+        self.counters = {}  # camera: [snapshots, stored]
+
+    def hash(self, data):
+        size, func = METHODS[self.method]
+        return func(bytearray(self.decoder(data, size)))
+
+    def ingest(self, camera, data, when=None):
+        """ store a snapshot unless it is a duplicate
+        :returns: (key of the stored snapshot representing it, True if it was stored now)
+        """
+        if when is None:
+            when = self.clock()
+        value = self.hash(data)
+        threshold = self.thresholds.get(camera, self.threshold)
+        with self.lock:
+            cameraLock = self.cameraLocks.get(camera)
+            if cameraLock is None:
+                cameraLock = self.cameraLocks[camera] = threading.Lock()
+        # snapshots of one camera in turn, each one is compared with the one stored before
+        with cameraLock:
+            with self.lock:
+                counter = self.counters.setdefault(camera, [0, 0])
+                counter[0] += 1
+                last = self.last.get(camera)
+                if last is not None and hamming(value, last[0]) <= threshold:
+                    self.refs[last[1]] += 1
+                    return last[1], False
+            key = self.store(camera, data, when)
+            with self.lock:
+                counter[1] += 1
+                self.last[camera] = (value, key)
+                self.refs[key] = self.refs.get(key, 0) + 1
+        return key, True
+
+    def snap(self, camera, cam):
+        """ take a snapshot (:func:`Cam.snapPicture`) and ingest it
+        :returns: result of ingest(), None if the camera did not deliver a picture
+        """
+        data, filename = cam.snapPicture()
+        if data is None:
+            return None
+        return self.ingest(camera, data)
+
+    def references(self, key):
+        with self.lock:
+            return self.refs.get(key, 0)
+
+    def release(self, key):
+        """ drop a reference, e.g. when a snapshot is deleted from the archive
+        :returns: number of remaining references, the stored snapshot can be removed at 0
+        """
+        with self.lock:
+            count = self.refs.get(key, 0) - 1
+            if count > 0:
+                self.refs[key] = count
+                return count
+            self.refs.pop(key, None)
+            for camera, last in list(self.last.items()):
+                if last[1] == key:
+                    del self.last[camera]
+            return 0
+
+    def stats(self):
+        """
+        :returns: dict {camera: {"snapshots", "stored", "duplicates", "hitRate"}}, hitRate = duplicates / snapshots
+        """
+        res = {}
+        with self.lock:
+            for camera, (snapshots, stored) in self.counters.items():
+                res[camera] = {"snapshots": snapshots, "stored": stored, "duplicates": snapshots - stored,
+                               "hitRate": (snapshots - stored) / float(snapshots) if snapshots else 0.0}
+        return res
@@ -0,0 +1,373 @@
+# -*- coding: utf-8 -*-
+
+"""
+parallel download of the recordings on the SD cards, resumable
+
+    downloader = RecordDownloader("/srv/recordings", perCamera=2)
+    tasks = downloader.download({"garden": cam1, "gate": cam2},
+                                index.query(start=yesterday22h, end=today6h))
+    for camera, stats in downloader.progress().items():
+        print(camera, stats["bytes"], stats["throughput"])
+
+The recordings (:class:`foscontrol.Record`, e.g. from getRecordList or
+:func:`recordindex.RecordIndex.query`) are stored as <directory>/<camera>/<file name>.
+A recording whose file already exists with the listed size is skipped.
+
+The body is written to <file name>.part in chunks as it arrives and renamed when
+complete.  If a transfer breaks off, the next attempt asks only for the missing part
+(Range header), as does a later run finding the .part file.
+
+All cameras share one pool of worker threads, at most `perCamera` downloads of a camera
+run at the same time.  Every camera has its own pool of keep-alive connections.
+"""
+
+import os
+import socket
+import threading
+
+try:
+    from urllib.parse import urlsplit
+except ImportError:
+    from urlparse import urlsplit
+
+from . import Record, errors, resilience
+from .fleet import cameraItems
+from .transport import clock, httplib
+
+CHUNK_SIZE = 65536
+
+PENDING = "pending"
+DONE = "done"
+SKIPPED = "skipped"
+FAILED = "failed"
+
+
+class DownloadTask(object):
+    """
+    download of one recording
+
+    - camera:   name of the camera
+    - record:   :class:`foscontrol.Record`
+    - filename: local file name
+    - status:   pending, done, skipped or failed
+    - received: bytes received by this download (without the part resumed from disk)
+    - resumed:  number of requests that continued a partial file
+    - attempts: number of failed attempts
+    - error:    last exception, None if none
+    """
+
+    def __init__(self, camera, record, filename):
+        self.camera = camera
+        self.record = record
+        self.filename = filename
+        self.status = PENDING
+        self.received = 0
+        self.resumed = 0
+        self.attempts = 0
+        self.error = None
+
+    def __repr__(self):
+        return "<DownloadTask %s %s %s>" % (self.camera, self.record.path, self.status)
+
+
+class ConnectionPool(object):
+    """
+    idle keep-alive connections to one camera
+    """
+
+    def __init__(self, cam):
+        self.cam = cam
+        self.lock = threading.Lock()
+        self.idle = []
+        self.created = 0
+
+    def acquire(self):
+        """
+        :returns: (connection, True if it is new)
+        """
+        with self.lock:
+            if self.idle:
+                return self.idle.pop(), False
+            self.created += 1
+        return self.cam.connection(), True
+
+    def release(self, conn):
+        with self.lock:
+            self.idle.append(conn)
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for conn in idle:
+            conn.close()
+
+
+class CameraProgress(object):
+    """
+    counters of the downloads from one camera
+    """
+
+    def __init__(self):
+        self.files = 0
+        self.done = 0
+        self.skipped = 0
+        self.failed = 0
+        self.bytes = 0
+        self.resumed = 0
+        self.active = 0
+        self.busy = 0.0  # seconds with at least one active download
+        self.busySince = None
+
+    def asDict(self, now):
+        busy = self.busy + (now - self.busySince if self.busySince is not None else 0.0)
+        return {"files": self.files, "done": self.done, "skipped": self.skipped, "failed": self.failed,
+                "bytes": self.bytes, "resumed": self.resumed, "active": self.active,
+                "throughput": self.bytes / busy if busy > 0 else 0.0}
+
+
+class RecordDownloader(object):
+    """
+    downloads recordings of many cameras, see module description
+    """
+
+    def __init__(self, directory, perCamera=2, workers=8, retry=resilience.RetryPolicy(attempts=5, backoff=1.0),
+                 chunkSize=CHUNK_SIZE):
+        """
+        :param directory: base directory, a subdirectory is created per camera
+        :param perCamera: max. number of parallel downloads from one camera
+        :param workers: number of downloads running at the same time (all cameras)
+        :param retry: :class:`resilience.RetryPolicy` for interrupted downloads, each attempt resumes
+        :param chunkSize: size of the chunks written to disk
+        """
+        self.directory = directory
+        self.perCamera = perCamera
+        self.workers = workers
+        self.retry = retry
+        self.chunkSize = chunkSize
+
+        self.lock = threading.Condition()
+        self.pools = {}
+        self.counters = {}
+        self.queues = {}
+        self.order = []
+        self.listeners = []  # functions called with (task, bytes received so far) after each chunk
+
+    def localName(self, camera, record):
+        return os.path.join(self.directory, camera, os.path.basename(record.path))
+
+    def plan(self, camera, records):
+        """
+        :returns: list of :class:`DownloadTask`, recordings already on disk are marked as skipped
+        """
+        tasks = []
+        for record in records:
+            task = DownloadTask(camera, record, self.localName(camera, record))
+            try:
+                if os.path.getsize(task.filename) == record.size:
+                    task.status = SKIPPED
+            except OSError:
+                pass
+            tasks.append(task)
+        return tasks
+
+    def download(self, cams, records):
+        """ download recordings, returns when all are done or failed
+        :param cams: dict {name: camera object} or list of camera objects
+        :param records: dict {name: list of :class:`foscontrol.Record`} or
+                        list of (name, :class:`foscontrol.Record`) as returned by RecordIndex.query
+        :returns: list of :class:`DownloadTask`
+        """
+        if isinstance(records, dict):
+            records = [(name, r) for name, rs in records.items() for r in rs]
+        byCamera = {}
+        for name, record in records:
+            if isinstance(record, Record):
+                byCamera.setdefault(name, []).append(record)
+
+        cams = dict(cameraItems(cams))
+        tasks = []
+        with self.lock:
+            for name in sorted(byCamera):
+                if name not in cams:
+                    raise KeyError("no camera %s" % name)
+                planned = self.plan(name, byCamera[name])
+                tasks += planned
+                counter = self.counters.setdefault(name, CameraProgress())
+                counter.files += len(planned)
+                counter.skipped += sum(1 for t in planned if t.status == SKIPPED)
+                if name not in self.pools:
+                    self.pools[name] = ConnectionPool(cams[name])
+                    self.order.append(name)
+                self.queues.setdefault(name, []).extend(t for t in planned if t.status == PENDING)
+
+        threads = [threading.Thread(target=self.work) for x in range(min(self.workers, len(tasks)))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return tasks
+
+    def nextTask(self):
+        """ wait for a task of a camera with less than perCamera active downloads
+        :returns: :class:`DownloadTask`, None if all queues are empty
+        """
+        with self.lock:
+            while True:
+                waiting = False
+                for x, name in enumerate(self.order):
+                    queue = self.queues.get(name)
+                    if not queue:
+                        continue
+                    waiting = True
+                    counter = self.counters[name]
+                    if counter.active < self.perCamera:
+                        # round robin: the camera goes to the end of the list
+                        self.order.append(self.order.pop(x))
+                        counter.active += 1
+                        if counter.busySince is None:
+                            counter.busySince = clock()
+                        return queue.pop(0)
+                if not waiting:
+                    return None
+                self.lock.wait()
+
+    def finished(self, task):
+        with self.lock:
+            counter = self.counters[task.camera]
+            counter.active -= 1
+            if counter.active == 0:
+                counter.busy += clock() - counter.busySince
+                counter.busySince = None
+            if task.status == DONE:
+                counter.done += 1
+            else:
+                counter.failed += 1
+            self.lock.notify_all()
+
+    def work(self):
+        while True:
+            task = self.nextTask()
+            if task is None:
+                return
+            try:
+                self.fetch(task)
+                task.status = DONE
+            except Exception as err:
+                task.status = FAILED
+                task.error = err
+            self.finished(task)
+
+    def fetch(self, task):
+        """ download one recording, resuming after interruptions
+        :raises: exception of the last attempt
+        """
+        directory = os.path.dirname(task.filename)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                if not os.path.isdir(directory):
+                    raise
+        part = task.filename + ".part"
+        attempt = 0
+        while True:
+            try:
+                self.transfer(task, part)
+                break
+            except (socket.error, httplib.HTTPException, IOError) as err:
+                task.error = err
+                attempt += 1
+                task.attempts = attempt
+                if attempt >= self.retry.attempts:
+                    raise
+                self.retry.sleep(self.retry.delay(attempt))
+        os.rename(part, task.filename)
+        task.error = None
+
+    def transfer(self, task, part):
+        """ one request, continues the part file
+        """
+        record = task.record
+        try:
+            offset = os.path.getsize(part)
+        except OSError:
+            offset = 0
+        if offset > record.size:
+            offset = 0
+        elif offset == record.size and os.path.exists(part):
+            return
+
+        pool = self.pools[task.camera]
+        cam = pool.cam
+        url = urlsplit(cam.recordUrl(record.path))
+        path = "%s?%s" % (url.path, url.query)
+        headers = {"Range": "bytes=%s-" % offset} if offset else {}
+        while True:
+            conn, fresh = pool.acquire()
+            try:
+                conn.request("GET", path, headers=headers)
+                resp = conn.getresponse()
+                break
+            except (socket.error, httplib.HTTPException):
+                conn.close()
+                if fresh:
+                    raise
+                # the camera closed the idle connection, try the next one
+
+        if resp.status not in (200, 206):
+            resp.read()
+            self.releaseConnection(pool, conn, resp)
+            if resp.status == 416 and os.path.exists(part):
+                os.remove(part)  # does not fit the recording (any more), start again
+                raise IOError("%s: range not satisfiable" % record.path)
+            raise errors.CamError("%s: HTTP %s %s" % (record.path, resp.status, resp.reason))
+        if resp.status == 200:
+            offset = 0
+        else:
+            task.resumed += 1
+            with self.lock:
+                self.counters[task.camera].resumed += 1
+
+        buf = bytearray(self.chunkSize)
+        view = memoryview(buf)
+        try:
+            with open(part, "r+b" if offset else "wb") as fh:
+                fh.seek(offset)
+                fh.truncate()
+                while True:
+                    n = resp.readinto(buf)
+                    if not n:
+                        break
+                    fh.write(view[:n])
+                    offset += n
+                    task.received += n
+                    with self.lock:
+                        self.counters[task.camera].bytes += n
+                    for listener in list(self.listeners):
+                        listener(task, offset)
+        except Exception:
+            conn.close()
+            raise
+        self.releaseConnection(pool, conn, resp)
+        if offset != record.size:
+            raise IOError("%s: got %s of %s bytes" % (record.path, offset, record.size))
+
+    def releaseConnection(self, pool, conn, resp):
+        if resp.will_close:
+            conn.close()
+        else:
+            pool.release(conn)
+
+    def progress(self):
+        """
+        :returns: dict {camera: dict with the counters files, done, skipped, failed, bytes,
+                  resumed, active and throughput (bytes per second while downloading)}
+        """
+        now = clock()
+        with self.lock:
+            return dict((name, counter.asDict(now)) for name, counter in self.counters.items())
+
+    def close(self):
+        for pool in list(self.pools.values()):
+            pool.close()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+"""
+exceptions raised by foscontrol
+"""
+
+
+class CamError(Exception):
+    """
+    base class of all foscontrol exceptions
+    """
+
+
+class CircuitOpen(CamError):
+    """
+    the camera failed repeatedly, requests are refused until it recovers
+    """
+
+    def __init__(self, target, retryAt=None):
+        CamError.__init__(self, "circuit open for %s" % target)
+        self.target = target
+        self.retryAt = retryAt
+
+
+class ResultError(CamError):
+    """
+    the camera returned a result code other than 0 (strict mode)
+    """
+
+    def __init__(self, cmd, code, resultObj=None, message=None):
+        CamError.__init__(self, "%s: %s (%s)" % (cmd, message or "error", code))
+        self.cmd = cmd
+        self.code = code
+        self.resultObj = resultObj
+
+
+class CgiFormatError(ResultError):
+    """ -1: CGI request string format error """
+
+
+class AuthError(ResultError):
+    """ -2: username or password error """
+
+
+class AccessDenied(ResultError):
+    """ -3: access denied """
+
+
+class CgiExecuteError(ResultError):
+    """ -4: CGI execute failure """
+
+
+class CamTimeout(ResultError):
+    """ -5: timeout reported by the camera """
+
+
+class UnknownResultError(ResultError):
+    """ any other result code, or the result is missing """
+
+
+class SubResultError(ResultError):
+    """
+    the main result is 0, but the command specific result (e.g. addResult) is not
+    """
+
+    def __init__(self, cmd, name, code, resultObj=None):
+        ResultError.__init__(self, cmd, code, resultObj, "sub error (%s)" % name)
+        self.name = name
+
+
+RESULT_ERRORS = {
+    -1: CgiFormatError,
+    -2: AuthError,
+    -3: AccessDenied,
+    -4: CgiExecuteError,
+    -5: CamTimeout,
+}
+
+
+def resultError(cmd, code, resultObj=None, message=None):
+    """
+    :returns: exception matching the result code
+    """
+    return RESULT_ERRORS.get(code, UnknownResultError)(cmd, code, resultObj, message)
@@ -0,0 +1,489 @@
+# -*- coding: utf-8 -*-
+
+"""
+operations on many cameras
+
+- parallel():      runs a function for many cameras with a limited number of threads
+- ConfigStore:     content-addressed store of config blobs (an unchanged config is stored once)
+                   and the manifests of the backups per camera
+- ConfigBackup:    nightly backups with exportConfig in parallel, restore with importConfig
+- FirmwareRollout: firmware upgrades in waves
+
+    store = ConfigStore("/var/backups/foscam")
+    backup = ConfigBackup(store, workers=16)
+    report = backup.backup({"garden": cam1, "gate": cam2})
+    ...
+    report = backup.restore({"gate": cam2}, maxRebooting=1)
+
+Cameras are passed as dict {name: camera object} or as list (the name is "host:port").
+
+Layout of the store:
+
+- objects/ab/cdef...            config blob, named by its SHA-256
+- manifests/<camera>/<run>.json one per backup run and camera (JSON)
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from . import errors
+
+
+def cameraItems(cams):
+    """
+    :param cams: dict {name: camera object} or list of camera objects
+    :returns: list of (name, camera object)
+    """
+    if isinstance(cams, dict):
+        return sorted(cams.items(), key=lambda item: item[0])
+    return [(cam.target, cam) for cam in cams]
+
+
+def parallel(items, func, workers=8):
+    """ call func(item) for all items, with at most `workers` threads
+    :returns: list of (item, result, exception or None) in the order of the items
+    """
+    items = list(items)
+    results = [None] * len(items)
+    todo = queue.Queue()
+    for index in range(len(items)):
+        todo.put(index)
+
+    def worker():
+        while True:
+            try:
+                index = todo.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                results[index] = (items[index], func(items[index]), None)
+            except Exception as err:
+                results[index] = (items[index], None, err)
+
+    threads = [threading.Thread(target=worker, name="fleet") for x in range(min(workers, len(items)))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def runId(now=None):
+    """
+    :returns: name of a backup run, sortable (UTC with microseconds)
+    """
+    if now is None:
+        now = time.time()
+    return time.strftime("%Y%m%dT%H%M%S", time.gmtime(now)) + "%06dZ" % int((now % 1) * 1000000)
+
+
+class BlobWriter(object):
+    """
+    file object which hashes the data while writing it into a temporary file
+    commit() moves it into the store
+    """
+
+    def __init__(self, store):
+        self.store = store
+        fd, self.tmpname = tempfile.mkstemp(dir=store.tmpdir)
+        self.fh = os.fdopen(fd, "wb")
+        self.hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.hash.update(data)
+        self.fh.write(data)
+        self.size += len(data)
+
+    def commit(self):
+        """
+        :returns: (digest, True if the blob was not yet in the store)
+        """
+        self.fh.close()
+        digest = self.hash.hexdigest()
+        path = self.store.blobPath(digest)
+        if os.path.exists(path):
+            os.remove(self.tmpname)
+            return digest, False
+        if not os.path.isdir(os.path.dirname(path)):
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError:
+                # created by another thread
+                pass
+        os.rename(self.tmpname, path)
+        return digest, True
+
+    def abort(self):
+        self.fh.close()
+        os.remove(self.tmpname)
+
+
+class ConfigStore(object):
+    """
+    content-addressed store of config blobs and backup manifests, see module description
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.objects = os.path.join(directory, "objects")
+        self.manifestDir = os.path.join(directory, "manifests")
+        self.tmpdir = os.path.join(directory, "tmp")
+        for path in (self.objects, self.manifestDir, self.tmpdir):
+            if not os.path.isdir(path):
+                os.makedirs(path)
+
+    # blobs
+
+    def blobPath(self, digest):
+        return os.path.join(self.objects, digest[:2], digest[2:])
+
+    def writer(self):
+        """
+        :returns: :class:`BlobWriter`, e.g. for cam.exportConfig(out=writer)
+        """
+        return BlobWriter(self)
+
+    def put(self, data):
+        """
+        :returns: (digest, True if the blob was not yet in the store)
+        """
+        writer = self.writer()
+        writer.write(data)
+        return writer.commit()
+
+    def has(self, digest):
+        return os.path.exists(self.blobPath(digest))
+
+    def get(self, digest):
+        """
+        :returns: content of the blob
+        :raises: :class:`errors.CamError` if the content does not match the digest
+        """
+        with open(self.blobPath(digest), "rb") as fh:
+            data = fh.read()
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise errors.CamError("config blob %s is corrupt" % digest)
+        return data
+
+    def blobs(self):
+        """
+        :returns: set of the digests of all blobs
+        """
+        res = set()
+        for prefix in os.listdir(self.objects):
+            for rest in os.listdir(os.path.join(self.objects, prefix)):
+                res.add(prefix + rest)
+        return res
+
+    # manifests
+
+    def cameraDir(self, name):
+        safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in name)
+        return os.path.join(self.manifestDir, safe)
+
+    def writeManifest(self, manifest):
+        directory = self.cameraDir(manifest["camera"])
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                pass
+        filename = os.path.join(directory, "%s.json" % manifest["run"])
+        with open(filename + ".tmp", "w") as fh:
+            json.dump(manifest, fh, indent=1, sort_keys=True)
+        os.rename(filename + ".tmp", filename)
+
+    def cameras(self):
+        """
+        :returns: names of the cameras with manifests
+        """
+        res = []
+        for entry in sorted(os.listdir(self.manifestDir)):
+            for filename in os.listdir(os.path.join(self.manifestDir, entry)):
+                if filename.endswith(".json"):
+                    with open(os.path.join(self.manifestDir, entry, filename)) as fh:
+                        res.append(json.load(fh)["camera"])
+                    break
+        return res
+
+    def runs(self, name):
+        """
+        :returns: run ids of the manifests of a camera, oldest first
+        """
+        directory = self.cameraDir(name)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(f[:-5] for f in os.listdir(directory) if f.endswith(".json"))
+
+    def manifest(self, name, run=None):
+        """
+        :param run: run id, None = latest successful backup
+        :returns: manifest (dict) or None
+        """
+        runs = self.runs(name) if run is None else [run]
+        for run in reversed(runs):
+            filename = os.path.join(self.cameraDir(name), "%s.json" % run)
+            if not os.path.exists(filename):
+                continue
+            with open(filename) as fh:
+                manifest = json.load(fh)
+            if manifest.get("blob"):
+                return manifest
+        return None
+
+    def prune(self, keep=30):
+        """ delete all but the last `keep` manifests per camera and the blobs no longer referenced
+        :returns: number of blobs deleted
+        """
+        referenced = set()
+        for entry in os.listdir(self.manifestDir):
+            directory = os.path.join(self.manifestDir, entry)
+            files = sorted(f for f in os.listdir(directory) if f.endswith(".json"))
+            for filename in files[:-keep] if keep else files:
+                os.remove(os.path.join(directory, filename))
+            for filename in files[-keep:] if keep else []:
+                with open(os.path.join(directory, filename)) as fh:
+                    blob = json.load(fh).get("blob")
+                if blob:
+                    referenced.add(blob)
+        deleted = 0
+        for digest in self.blobs() - referenced:
+            os.remove(self.blobPath(digest))
+            deleted += 1
+        return deleted
+
+
+class ConfigBackup(object):
+    """
+    backup and restore of the configs of many cameras, see module description
+    """
+
+    def __init__(self, store, workers=8, sleep=time.sleep, clock=time.time):
+        """
+        :param store: :class:`ConfigStore`
+        :param workers: number of cameras exported at the same time
+        """
+        self.store = store
+        self.workers = workers
+        self.sleep = sleep
+        self.clock = clock
+
+    def backup(self, cams, run=None):
+        """ export the configs of the cameras in parallel and write a manifest per camera
+        :param cams: dict {name: camera object} or list of camera objects
+        :param run: id of the run, None = current time
+        :returns: dict {name: manifest}, failed cameras have the key "error" instead of "blob"
+        """
+        if run is None:
+            run = runId(self.clock())
+        results = parallel(cameraItems(cams), lambda item: self.backupCamera(item[0], item[1], run), self.workers)
+        report = {}
+        for (name, cam), manifest, error in results:
+            if error is not None:
+                manifest = {"camera": name, "target": cam.target, "run": run,
+                            "time": self.clock(), "error": "%s: %s" % (type(error).__name__, error)}
+                self.store.writeManifest(manifest)
+            report[name] = manifest
+        return report
+
+    def backupCamera(self, name, cam, run):
+        writer = self.store.writer()
+        try:
+            res = cam.exportConfig(out=writer)
+        except Exception:
+            writer.abort()
+            raise
+        if res is None:
+            writer.abort()
+            raise errors.CamError("exportConfig failed")
+        digest, new = writer.commit()
+        manifest = {"camera": name, "target": cam.target, "run": run, "time": self.clock(),
+                    "blob": digest, "size": writer.size, "fileName": res[1], "new": new}
+        self.store.writeManifest(manifest)
+        return manifest
+
+    def restore(self, cams, run=None, maxRebooting=2, rebootWindow=180.0, pollInterval=2.0, minDowntime=10.0):
+        """ import the backed up configs in parallel
+
+        The cameras reboot after the import.  A camera keeps its slot until it answers
+        again (or rebootWindow has passed), so that at most `maxRebooting` cameras are
+        down at the same time.
+
+        :param cams: dict {name: camera object} or list of camera objects
+        :param run: run id to restore, None = latest successful backup of each camera
+        :param maxRebooting: number of cameras importing or rebooting at the same time
+        :param rebootWindow: seconds a camera may need to answer again after the import
+        :param pollInterval: seconds between the checks whether the camera is back
+        :param minDowntime: seconds after which a camera that was not seen down counts as rebooted
+        :returns: dict {name: report}, report is a dict with run, blob, downtime (seconds) or error
+        """
+        def restoreCamera(item):
+            return self.restoreCamera(item[0], item[1], run, rebootWindow, pollInterval, minDowntime)
+
+        report = {}
+        for (name, cam), result, error in parallel(cameraItems(cams), restoreCamera, maxRebooting):
+            if error is not None:
+                result = {"error": "%s: %s" % (type(error).__name__, error)}
+            report[name] = result
+        return report
+
+    def restoreCamera(self, name, cam, run, rebootWindow, pollInterval, minDowntime=10.0):
+        manifest = self.store.manifest(name, run)
+        if manifest is None:
+            raise errors.CamError("no backup of %s" % name)
+        data = self.store.get(manifest["blob"])
+        res = cam.importConfig(data, manifest["fileName"])
+        res.extendedResult("importResult")
+        if res.result != 0:
+            raise errors.CamError("importConfig failed: %s" % res.result)
+        return {"run": manifest["run"], "blob": manifest["blob"],
+                "downtime": self.waitForCamera(cam, rebootWindow, pollInterval, minDowntime)}
+
+    def waitForCamera(self, cam, rebootWindow, pollInterval, minDowntime=10.0):
+        """ wait until the camera went down for the reboot and answers again
+
+        The camera may still answer shortly after the import, so an answer only counts
+        once the camera was seen down or minDowntime has passed.
+
+        :returns: seconds waited
+        :raises: :class:`errors.CamError` if the camera did not answer within rebootWindow
+        """
+        start = self.clock()
+        down = False
+        while True:
+            self.sleep(pollInterval)
+            try:
+                cam.probe()
+            except Exception as err:
+                down = True
+                if self.clock() - start >= rebootWindow:
+                    raise errors.CamError("camera did not answer within %s seconds after the import: %s"
+                                          % (rebootWindow, err))
+                continue
+            if down or self.clock() - start >= minDowntime:
+                return self.clock() - start
+
+
+class FirmwareRollout(object):
+    """
+    firmware upgrade of many cameras in waves
+
+    The image is mapped into memory once (mmap) and uploaded from there to all cameras.
+    Cameras already running the target version are left alone.  The cameras of a wave are
+    upgraded in parallel (at most maxParallel at a time), each one is polled with
+    getDevInfo until it reports the new firmwareVer.  The next wave only starts if the
+    failures of the current one do not exceed maxFailures.
+
+        rollout = FirmwareRollout("/srv/fw/2.11.2.10.bin", "2.11.2.10", waves=(1, 5, 20))
+        report = rollout.run({"garden": cam1, "gate": cam2, ...})
+    """
+
+    def __init__(self, path, version, waves=(1, 5, 20), maxParallel=5, maxFailures=0, rebootWindow=600.0,
+                 pollInterval=10.0, sleep=time.sleep, clock=time.time):
+        """
+        :param path: name of the image file
+        :param version: firmwareVer the cameras report after the upgrade
+        :param waves: number of cameras per wave, the last number is repeated until all cameras are done
+        :param maxParallel: number of cameras uploading or rebooting at the same time
+        :param maxFailures: failed cameras tolerated per wave before the rollout stops
+        :param rebootWindow: seconds a camera may need to come back with the new version
+        :param pollInterval: seconds between the getDevInfo polls
+        """
+        self.path = path
+        self.filename = os.path.basename(path)
+        self.version = version
+        self.waves = tuple(waves)
+        self.maxParallel = maxParallel
+        self.maxFailures = maxFailures
+        self.rebootWindow = rebootWindow
+        self.pollInterval = pollInterval
+        self.sleep = sleep
+        self.clock = clock
+
+    def firmwareVer(self, cam):
+        res = cam.getDevInfo()
+        if res.result != 0:
+            raise errors.resultError("getDevInfo", res.result, res)
+        return res.firmwareVer
+
+    def plan(self, items):
+        """
+        :returns: list of waves, each a list of (name, camera object)
+        """
+        res = []
+        pos = 0
+        for x in range(len(items)):
+            if pos >= len(items):
+                break
+            size = self.waves[min(x, len(self.waves) - 1)]
+            res.append(items[pos:pos + size])
+            pos += size
+        return res
+
+    def upgradeCamera(self, name, cam, image):
+        start = self.clock()
+        before = self.firmwareVer(cam)
+        if before == self.version:
+            return {"status": "current", "from": before}
+        res = cam.upgradeFirmware(image, self.filename)
+        if res.result != 0:
+            raise errors.resultError("fwUpgrade", res.result, res)
+        while True:
+            self.sleep(self.pollInterval)
+            try:
+                current = self.firmwareVer(cam)
+            except Exception:
+                # still rebooting
+                current = None
+            if current == self.version:
+                return {"status": "upgraded", "from": before, "duration": self.clock() - start}
+            if self.clock() - start >= self.rebootWindow:
+                raise errors.CamError("firmwareVer is %s after %s seconds, expected %s"
+                                      % (current, self.rebootWindow, self.version))
+
+    def run(self, cams):
+        """ upgrade the cameras
+        :param cams: dict {name: camera object} or list of camera objects
+        :returns: dict {name: report}, report is a dict with status ("current", "upgraded", "failed",
+                  "skipped"), wave, from (previous version), duration, error
+        """
+        import mmap
+
+        report = {}
+        with open(self.path, "rb") as fh:
+            image = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                waves = self.plan(cameraItems(cams))
+                for number, wave in enumerate(waves):
+                    results = parallel(wave, lambda item: self.upgradeCamera(item[0], item[1], image),
+                                       self.maxParallel)
+                    failures = 0
+                    for (name, cam), result, error in results:
+                        if error is not None:
+                            failures += 1
+                            result = {"status": "failed", "error": "%s: %s" % (type(error).__name__, error)}
+                        result["wave"] = number
+                        report[name] = result
+                    if failures > self.maxFailures:
+                        for later in waves[number + 1:]:
+                            for name, cam in later:
+                                report[name] = {"status": "skipped", "wave": None}
+                        break
+            finally:
+                try:
+                    image.close()
+                except BufferError:
+                    # an upload still references the mapping, it is closed with the last reference
+                    pass
+        return report
@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+
+"""
+instrumentation of the CGI commands
+
+Hooks are registered with CamBase.addHook() (single camera) or addGlobalHook()
+(all cameras).  For every command sendcommand() calls hook.pre(event) before the
+request is sent and hook.post(event) after the result has been decoded or the
+request failed.  Without hooks sendcommand() does not create events at all.
+
+    agg = HistogramAggregator()
+    addGlobalHook(agg)
+    ...
+    print(PrometheusExporter(agg).render())
+    for target, cmd, p95 in agg.slowest(5):
+        ...
+"""
+
+import bisect
+import socket
+import threading
+import time
+
+from .transport import clock
+
+# upper bounds of the histogram buckets in seconds (Prometheus style, +Inf is implicit)
+DEFAULT_BOUNDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# timings recorded in CommandEvent.timings ("queue": wait of PTZ commands, see ptz.PTZController)
+PHASES = ("queue", "dns", "connect", "tls", "firstByte", "total", "decode")
+
+_globalHooks = []
+
+
+def addGlobalHook(hook):
+    """
+    register a hook for all cameras
+    """
+    if hook not in _globalHooks:
+        _globalHooks.append(hook)
+
+
+def removeGlobalHook(hook):
+    if hook in _globalHooks:
+        _globalHooks.remove(hook)
+
+
+def globalHooks():
+    return _globalHooks
+
+
+class CommandEvent(object):
+    """
+    data of a single CGI command, passed to the hooks
+
+    - cmd:      name of the command
+    - host:     host of the camera
+    - port:     port of the camera
+    - target:   "host:port", identifies the camera
+    - time:     start of the command (unix time)
+    - bytesOut: size of the request (URL and body)
+    - bytesIn:  size of the response body (None if the request failed)
+    - timings:  dict with seconds per phase, see PHASES, phases not measured are missing
+    - result:   result code of the camera, None for raw results or if the request failed
+    - error:    exception if the request failed, else None
+    - attempts: number of attempts (retries, see resilience.RetryPolicy)
+    """
+
+    def __init__(self, cmd, host, port, bytesOut=0):
+        self.cmd = cmd
+        self.host = host
+        self.port = port
+        self.target = "%s:%s" % (host, port)
+        self.time = time.time()
+        self.start = clock()
+        self.bytesOut = bytesOut
+        self.bytesIn = None
+        self.timings = {}
+        self.result = None
+        self.error = None
+        self.attempts = 0
+
+    def __repr__(self):
+        return "<CommandEvent %s %s result=%s error=%r %s>" % (self.target, self.cmd, self.result, self.error,
+                                                               self.timings)
+
+
+class Hook(object):
+    """
+    base class for hooks, override pre() and/or post()
+
+    The hooks run synchronously in the thread calling sendcommand, they should be quick.
+    """
+
+    def pre(self, event):
+        pass
+
+    def post(self, event):
+        pass
+
+
+class HistogramSnapshot(object):
+    """
+    merged state of a histogram
+    """
+
+    def __init__(self, bounds, counts, total, count):
+        self.bounds = bounds
+        self.counts = counts  # per bucket, last one is +Inf
+        self.sum = total
+        self.count = count
+
+    def cumulative(self):
+        """
+        :returns: list of (upper bound, cumulative count), the last bound is float("inf")
+        """
+        res = []
+        acc = 0
+        for bound, cnt in zip(list(self.bounds) + [float("inf")], self.counts):
+            acc += cnt
+            res.append((bound, acc))
+        return res
+
+    def quantile(self, q):
+        """
+        estimate a quantile by linear interpolation inside the bucket
+        :param q: 0..1
+        :returns: seconds, None if empty
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        acc = 0
+        lower = 0.0
+        for bound, cnt in zip(self.bounds, self.counts):
+            if acc + cnt >= rank and cnt:
+                return lower + (bound - lower) * (rank - acc) / cnt
+            acc += cnt
+            lower = bound
+        return self.bounds[-1]
+
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+
+class HistogramAggregator(Hook):
+    """
+    collects latency histograms and counters per camera and command
+
+    Every thread writes into its own shard (plain dicts and lists), so the hot
+    path needs no lock; a lock is only taken once per thread to register the
+    shard.  snapshot() merges the shards, values written concurrently may be
+    missing from that snapshot but are never lost.  The shards of threads which
+    have ended are merged into one (when a thread registers or on snapshot()),
+    so short-lived workers (e.g. of fleet.parallel) do not pile up shards.
+
+    Keys:
+    - histograms: (target, cmd, phase)
+    - counters: (target, cmd, name) with name "result=<code>", "error=<exception class>",
+      "bytesIn", "bytesOut"
+    """
+
+    def __init__(self, bounds=DEFAULT_BOUNDS):
+        self.bounds = tuple(bounds)
+        self.local = threading.local()
+        self.shards = []  # (thread, shard)
+        self.retired = ({}, {})  # merged shards of ended threads
+        self.lock = threading.Lock()
+
+    def shard(self):
+        try:
+            return self.local.shard
+        except AttributeError:
+            shard = ({}, {})  # histograms, counters
+            with self.lock:
+                self.retire()
+                self.shards.append((threading.current_thread(), shard))
+            self.local.shard = shard
+            return shard
+
+    def retire(self):
+        """ merge the shards of ended threads, call with the lock held
+        """
+        alive = []
+        for thread, shard in self.shards:
+            if thread.is_alive():
+                alive.append((thread, shard))
+            else:
+                self.merge(self.retired, shard)
+        self.shards = alive
+
+    def merge(self, target, shard):
+        """ add the values of a shard to the target (histograms, counters)
+        """
+        histograms, counters = target
+        shist, scount = shard
+        # list() of a dict is atomic in CPython, the writing thread may add keys meanwhile
+        for key, (counts, total, cnt) in list(shist.items()):
+            merged = histograms.get(key)
+            if merged is None:
+                merged = histograms[key] = [[0] * (len(self.bounds) + 1), 0.0, 0]
+            for x, c in enumerate(list(counts)):
+                merged[0][x] += c
+            merged[1] += total
+            merged[2] += cnt
+        for key, value in list(scount.items()):
+            counters[key] = counters.get(key, 0) + value
+
+    def observe(self, key, value):
+        """
+        add a value to the histogram key
+        """
+        histograms = self.shard()[0]
+        h = histograms.get(key)
+        if h is None:
+            # counts per bucket, sum, count
+            h = histograms[key] = [[0] * (len(self.bounds) + 1), 0.0, 0]
+        h[0][bisect.bisect_left(self.bounds, value)] += 1
+        h[1] += value
+        h[2] += 1
+
+    def count(self, key, n=1):
+        counters = self.shard()[1]
+        counters[key] = counters.get(key, 0) + n
+
+    def post(self, event):
+        for phase, secs in event.timings.items():
+            self.observe((event.target, event.cmd, phase), secs)
+        if event.error is not None:
+            self.count((event.target, event.cmd, "error=%s" % type(event.error).__name__))
+        else:
+            self.count((event.target, event.cmd, "result=%s" % event.result))
+        self.count((event.target, event.cmd, "bytesOut"), event.bytesOut)
+        if event.bytesIn is not None:
+            self.count((event.target, event.cmd, "bytesIn"), event.bytesIn)
+
+    def snapshot(self):
+        """
+        :returns: tuple (dict {key: HistogramSnapshot}, dict {key: count})
+        """
+        result = ({}, {})
+        with self.lock:
+            self.retire()
+            shards = [shard for thread, shard in self.shards]
+            self.merge(result, self.retired)
+        for shard in shards:
+            self.merge(result, shard)
+        histograms, counters = result
+        return (dict((k, HistogramSnapshot(self.bounds, v[0], v[1], v[2])) for k, v in histograms.items()),
+                counters)
+
+    def slowest(self, n=10, phase="total", q=0.95):
+        """
+        :returns: list of (target, cmd, quantile in seconds), slowest first
+        """
+        histograms, counters = self.snapshot()
+        res = [(key[0], key[1], h.quantile(q)) for key, h in histograms.items() if key[2] == phase and h.count]
+        res.sort(key=lambda x: x[2], reverse=True)
+        return res[:n]
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class PrometheusExporter(object):
+    """
+    renders the state of a HistogramAggregator in the Prometheus text format,
+    e.g. for the textfile collector of the node exporter
+    """
+
+    def __init__(self, aggregator, prefix="foscam"):
+        self.aggregator = aggregator
+        self.prefix = prefix
+
+    def render(self):
+        histograms, counters = self.aggregator.snapshot()
+        p = self.prefix
+        lines = ["# HELP %s_command_duration_seconds duration of the CGI commands per phase" % p,
+                 "# TYPE %s_command_duration_seconds histogram" % p]
+        for (target, cmd, phase), h in sorted(histograms.items()):
+            labels = 'camera="%s",cmd="%s",phase="%s"' % (_label(target), _label(cmd), _label(phase))
+            for bound, acc in h.cumulative():
+                lines.append('%s_command_duration_seconds_bucket{%s,le="%s"} %s' % (p, labels, _fmt(bound), acc))
+            lines.append("%s_command_duration_seconds_sum{%s} %s" % (p, labels, _fmt(h.sum)))
+            lines.append("%s_command_duration_seconds_count{%s} %s" % (p, labels, h.count))
+
+        results = []
+        traffic = []
+        for (target, cmd, name), value in sorted(counters.items()):
+            labels = 'camera="%s",cmd="%s"' % (_label(target), _label(cmd))
+            if name in ("bytesIn", "bytesOut"):
+                traffic.append('%s_command_bytes_total{%s,direction="%s"} %s'
+                               % (p, labels, "in" if name == "bytesIn" else "out", value))
+            else:
+                kind, _, code = name.partition("=")
+                results.append('%s_commands_total{%s,%s="%s"} %s' % (p, labels, kind, _label(code), value))
+        lines += ["# HELP %s_commands_total number of CGI commands by result code or error" % p,
+                  "# TYPE %s_commands_total counter" % p] + results
+        lines += ["# HELP %s_command_bytes_total bytes sent and received" % p,
+                  "# TYPE %s_command_bytes_total counter" % p] + traffic
+        return "\n".join(lines) + "\n"
+
+    def write(self, filename):
+        """
+        write the metrics atomically (textfile collector reads *.prom files)
+        """
+        import os
+
+        tmp = filename + ".tmp"
+        with open(tmp, "w") as fh:
+            fh.write(self.render())
+        os.rename(tmp, filename)
+
+
+class StatsDExporter(Hook):
+    """
+    sends the metrics of each command as one UDP datagram to a StatsD server
+
+    Metric names: <prefix>.<camera>.<cmd>.<phase> (timer, ms),
+    <prefix>.<camera>.<cmd>.result.<code> or .error.<exception> (counter),
+    <prefix>.<camera>.<cmd>.bytesIn/bytesOut (counter).
+    Dots and colons in the camera address are replaced by underscores.
+    Sending errors are ignored, the counter `dropped` is incremented instead.
+    """
+
+    def __init__(self, host="127.0.0.1", port=8125, prefix="foscam"):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.dropped = 0
+
+    def metrics(self, event):
+        base = "%s.%s.%s" % (self.prefix, event.target.replace(".", "_").replace(":", "_"), event.cmd)
+        lines = ["%s.%s:%.3f|ms" % (base, phase, secs * 1000.0) for phase, secs in sorted(event.timings.items())]
+        if event.error is not None:
+            lines.append("%s.error.%s:1|c" % (base, type(event.error).__name__))
+        else:
+            lines.append("%s.result.%s:1|c" % (base, event.result))
+        lines.append("%s.bytesOut:%s|c" % (base, event.bytesOut))
+        if event.bytesIn is not None:
+            lines.append("%s.bytesIn:%s|c" % (base, event.bytesIn))
+        return "\n".join(lines)
+
+    def post(self, event):
+        try:
+            self.sock.sendto(self.metrics(event).encode("utf-8"), self.address)
+        except (socket.error, OSError):
+            self.dropped += 1
+
+    def close(self):
+        self.sock.close()
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+"""
+local motion scoring on the 10 x 10 grid of the camera's motion detection (requires numpy)
+
+    scorer = MotionScorer(threshold=8)
+    for frame in frames:                     # numpy arrays (gray or RGB), see decodeJpeg()
+        scores = scorer.score(frame)         # mean change per cell, 0..255
+        if scorer.motion(scores):
+            ...
+    quiet = scorer.activeRatio() < 0.05      # cells which are rarely active
+    cam.setMotionDetectConfig(..., areas=toAreas(fromAreas(current) & quiet))
+
+The frame is first reduced to a thumbnail of (10 * cellSize) x (10 * cellSize) pixels
+by averaging blocks, the difference to the previous thumbnail is then averaged per cell.
+Everything is done with whole-array operations, a frame costs a few reshapes and means,
+so one core can score dozens of streams (decoding the JPEG is the expensive part, the
+reduced decoding of decodeJpeg() helps).
+
+The grid is the one of setMotionDetectConfig: row r is the parameter area<r>, bit c
+(value 1 << c) of it is column c, counted from the left.
+"""
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+GRID = 10
+
+# weights of R, G, B for the brightness
+LUMA = (0.299, 0.587, 0.114)
+
+
+def requireNumpy():
+    if numpy is None:
+        raise ImportError("motion scoring requires numpy")
+
+
+def decodeJpeg(data, size=None):
+    """ decode a JPEG into a gray numpy array (requires Pillow)
+    :param data: JPEG data
+    :param size: (width, height) the picture is at least needed in, the decoder skips the
+                 details of larger pictures (scaled DCT), None = full size
+    """
+    requireNumpy()
+    import io
+    from PIL import Image
+
+    img = Image.open(io.BytesIO(data))
+    if size is not None:
+        img.draft("L", size)
+    return numpy.asarray(img.convert("L"))
+
+
+def thumbnail(frame, size):
+    """ reduce a frame by averaging blocks
+    :param frame: numpy array height x width (gray) or height x width x channels (RGB, RGBA)
+    :param size: side length of the result, rows and columns beyond a multiple of it are ignored
+    :returns: float32 array size x size with the brightness
+    """
+    frame = numpy.asarray(frame)
+    height, width = frame.shape[:2]
+    bh, bw = height // size, width // size
+    if not bh or not bw:
+        raise ValueError("frame smaller than %s x %s" % (size, size))
+    frame = frame[:bh * size, :bw * size]
+    if frame.ndim == 3:
+        blocks = frame[..., :3].reshape(size, bh, size, bw, 3).mean(axis=(1, 3), dtype=numpy.float32)
+        return blocks.dot(numpy.asarray(LUMA, dtype=numpy.float32))
+    return frame.reshape(size, bh, size, bw).mean(axis=(1, 3), dtype=numpy.float32)
+
+
+def toAreas(cells):
+    """
+    :param cells: boolean array 10 x 10
+    :returns: list of the 10 row masks (area0..area9 of setMotionDetectConfig)
+    """
+    requireNumpy()
+    cells = numpy.asarray(cells, dtype=bool)
+    weights = 1 << numpy.arange(cells.shape[1])
+    return [int(x) for x in cells.dot(weights)]
+
+
+def fromAreas(areas):
+    """
+    :param areas: the 10 row masks (list of int, or the result of getMotionDetectConfig)
+    :returns: boolean array 10 x 10
+    """
+    requireNumpy()
+    if hasattr(areas, "get"):
+        areas = [areas.get("area%s" % row) for row in range(GRID)]
+    rows = numpy.asarray([int(x) for x in areas], dtype=numpy.int64)
+    return (rows[:, None] >> numpy.arange(GRID)) & 1 == 1
+
+
+class MotionScorer(object):
+    """
+    frame difference per grid cell of one stream, see module description
+    """
+
+    def __init__(self, threshold=10.0, cellSize=4, grid=GRID, areas=None):
+        """
+        :param threshold: mean change of the brightness (0..255) from which a cell counts as active
+        :param cellSize: side length of a cell in the thumbnail, more = less sensitive to noise
+        :param areas: cells considered by motion(), row masks as for setMotionDetectConfig, None = all
+        """
+        requireNumpy()
+        self.threshold = threshold
+        self.cellSize = cellSize
+        self.grid = grid
+        self.mask = numpy.ones((grid, grid), dtype=bool) if areas is None else fromAreas(areas)
+        self.previous = None
+        self.frames = 0  # number of scored frames (all but the first)
+        self.activeCount = numpy.zeros((grid, grid), dtype=numpy.int64)
+
+    def reset(self):
+        self.previous = None
+
+    def score(self, frame):
+        """
+        :param frame: numpy array (gray or RGB)
+        :returns: float32 array grid x grid, mean change of the brightness per cell (zero for the first frame)
+        """
+        thumb = thumbnail(frame, self.grid * self.cellSize)
+        previous, self.previous = self.previous, thumb
+        grid, cell = self.grid, self.cellSize
+        if previous is None:
+            return numpy.zeros((grid, grid), dtype=numpy.float32)
+        scores = numpy.abs(thumb - previous).reshape(grid, cell, grid, cell).mean(axis=(1, 3))
+        self.frames += 1
+        self.activeCount += scores >= self.threshold
+        return scores
+
+    def active(self, scores):
+        """
+        :returns: boolean array of the cells over the threshold
+        """
+        return scores >= self.threshold
+
+    def motion(self, scores):
+        """
+        :returns: True if a cell within the areas is active
+        """
+        return bool((self.active(scores) & self.mask).any())
+
+    def activeRatio(self):
+        """
+        :returns: float array grid x grid, fraction of the frames in which each cell was active
+        """
+        if not self.frames:
+            return numpy.zeros((self.grid, self.grid))
+        return self.activeCount / float(self.frames)
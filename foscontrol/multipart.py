@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+"""
+streaming multipart/form-data encoder for uploads (importConfig, firmware)
+
+    enc = MultipartEncoder({"submit": "import"}, {"file": {"filename": "cfg.bin", "file": open(path, "rb")}})
+    request = Request(url, data=enc, headers=enc.headers)
+
+The body is never built in memory: the encoder produces the part headers, the
+content of the files in chunks, and the closing boundary.  The Content-Length is
+computed in advance from the sizes of the parts.  The encoder offers both
+iteration (chunks) and read(size), the interface http.client uses to send files.
+"""
+
+import io
+import mimetypes
+import os
+import random
+import string
+
+_BOUNDARY_CHARS = string.digits + string.ascii_letters
+
+CHUNK_SIZE = 65536
+
+
+def _escapeQuote(s):
+    return s.replace('"', '\\"')
+
+
+def _fileSize(fh):
+    """
+    :returns: number of bytes from the current position to the end of the file
+    """
+    pos = fh.tell()
+    try:
+        return os.fstat(fh.fileno()).st_size - pos
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        fh.seek(0, 2)
+        size = fh.tell() - pos
+        fh.seek(pos)
+        return size
+
+
+def uploadFile(filedata, filename):
+    """
+    :param filedata: bytes, memoryview, mmap (anything with the buffer interface) or a binary file object
+    :returns: entry of the `files` parameter of :class:`MultipartEncoder`
+    """
+    try:
+        return {"filename": filename, "content": memoryview(filedata)}
+    except TypeError:
+        return {"filename": filename, "file": filedata}
+
+
+class MultipartEncoder(object):
+    """
+    multipart/form-data body, produced in chunks
+    """
+
+    def __init__(self, fields, files, boundary=None, chunkSize=CHUNK_SIZE):
+        """
+        :param fields: dict {name: value} of the simple form fields
+        :param files: dict {name: {"filename": ..., "content": bytes or memoryview}} or
+                      {name: {"filename": ..., "file": binary file object}}, optional key "mimetype"
+        :param boundary: None = random boundary
+        :param chunkSize: size of the chunks read from the files
+        """
+        if boundary is None:
+            boundary = ''.join(random.choice(_BOUNDARY_CHARS) for i in range(30))
+        self.boundary = boundary
+        self.chunkSize = chunkSize
+
+        # list of (bytes, source), source is a memoryview, (file object, start, size) or None
+        self.parts = []
+        for name, value in fields.items():
+            head = '--{0}\r\nContent-Disposition: form-data; name="{1}"\r\n\r\n{2}\r\n'.format(
+                boundary, _escapeQuote(name), value)
+            self.parts.append((head.encode('utf-8'), None))
+
+        for name, value in files.items():
+            filename = value['filename']
+            mimetype = value.get('mimetype') or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            head = ('--{0}\r\nContent-Disposition: form-data; name="{1}"; filename="{2}"\r\n'
+                    'Content-Type: {3}\r\n\r\n').format(boundary, _escapeQuote(name), _escapeQuote(filename),
+                                                        mimetype)
+            if 'file' in value:
+                fh = value['file']
+                source = (fh, fh.tell(), _fileSize(fh))
+            else:
+                source = memoryview(value['content'])
+            self.parts.append((head.encode('utf-8'), source))
+            self.parts.append((b'\r\n', None))
+
+        self.parts.append(('--{0}--\r\n'.format(boundary).encode('utf-8'), None))
+
+        self.length = 0
+        for head, source in self.parts:
+            self.length += len(head)
+            if isinstance(source, tuple):
+                self.length += source[2]
+            elif source is not None:
+                self.length += source.nbytes
+
+        self.stream = None
+        self.buffer = memoryview(b'')
+
+    @property
+    def headers(self):
+        return {'Content-Type': 'multipart/form-data; boundary={0}'.format(self.boundary),
+                'Content-Length': str(self.length)}
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        """ chunks of the body, each iteration starts at the beginning
+        """
+        for head, source in self.parts:
+            yield head
+            if isinstance(source, tuple):
+                fh, start, size = source
+                fh.seek(start)
+                while size > 0:
+                    chunk = fh.read(min(self.chunkSize, size))
+                    if not chunk:
+                        raise IOError("file shorter than expected")
+                    size -= len(chunk)
+                    yield chunk
+            elif source is not None:
+                for pos in range(0, source.nbytes, self.chunkSize):
+                    yield source[pos:pos + self.chunkSize]
+
+    def read(self, size=-1):
+        """ file interface, continues where the last read() stopped
+        :returns: a memoryview slice of the current chunk if the read falls inside it (no copy),
+                  otherwise bytes joined from the chunks
+        """
+        if self.stream is None:
+            self.stream = iter(self)
+        pieces = []
+        have = 0
+        while size is None or size < 0 or have < size:
+            if not len(self.buffer):
+                try:
+                    self.buffer = memoryview(next(self.stream))
+                except StopIteration:
+                    break
+            if size is None or size < 0:
+                piece = self.buffer
+            else:
+                piece = self.buffer[:size - have]
+            self.buffer = self.buffer[len(piece):]
+            if not pieces and len(piece) == size:
+                return piece
+            pieces.append(piece.tobytes())
+            have += len(piece)
+        return b''.join(pieces)
+
+    def rewind(self):
+        """ read() starts at the beginning again, e.g. to repeat the request
+        """
+        self.stream = None
+        self.buffer = memoryview(b'')
@@ -0,0 +1,420 @@
+# -*- coding: utf-8 -*-
+
+"""
+polling of the camera state, reporting only the changes
+
+    poller = StatePoller({"garden": cam1, "gate": cam2}, commands=("getDevState", "getMotionDetectConfig"))
+    poller.listeners.append(print)
+    while True:
+        poller.poll()
+        time.sleep(1)
+
+For every camera and command the last state is kept as a tuple of values (the field
+names are stored once per command).  An answer identical to the last one is detected
+by its hash and not decoded at all, otherwise only the fields that changed become
+:class:`ChangeEvent` objects.  The first poll of a camera only records the state.
+
+If a camera does not answer, an event with the field "available" (command None) is
+emitted, and another one when it answers again.  Only network errors and the errors
+of :mod:`errors` count as not answering, other exceptions are raised by poll() (after
+all cameras were polled).  The last exception of each camera is kept in lastError.
+
+:class:`AdaptivePoller` runs the polls with an interval per camera, adapted to the
+changes, alarms, and response times of the camera, within a global request budget.
+"""
+
+import heapq
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from . import errors
+from .fleet import cameraItems, parallel
+from .resilience import isNetworkError
+
+# value of getDevState fields while the alarm is active
+ALARM_ACTIVE = {"motionDetectAlarm": "2", "soundAlarm": "2", "IOAlarm": "1"}
+
+# fields changing all the time, not reported
+DEFAULT_IGNORE = {"getSystemTime": frozenset(["year", "mon", "day", "hour", "minute", "sec"])}
+
+AVAILABLE = "available"
+
+
+class ChangeEvent(object):
+    """
+    change of a single field
+
+    - camera: name of the camera
+    - cmd:    command which returned the field (None for "available")
+    - field:  name of the field
+    - old:    previous value (None if the field is new)
+    - new:    current value (None if the field disappeared)
+    - time:   unix time of the poll
+    - kind:   "alarmRaised", "alarmCleared", "available", "unavailable" or "changed"
+    """
+
+    def __init__(self, camera, cmd, field, old, new, when=None):
+        self.camera = camera
+        self.cmd = cmd
+        self.field = field
+        self.old = old
+        self.new = new
+        self.time = time.time() if when is None else when
+
+    @property
+    def kind(self):
+        if self.field == AVAILABLE:
+            return "available" if self.new else "unavailable"
+        active = ALARM_ACTIVE.get(self.field)
+        if active is not None and self.cmd == "getDevState":
+            if self.new == active:
+                return "alarmRaised"
+            if self.old == active:
+                return "alarmCleared"
+        return "changed"
+
+    def __repr__(self):
+        return "<ChangeEvent %s %s %s.%s: %r -> %r>" % (self.kind, self.camera, self.cmd, self.field, self.old,
+                                                         self.new)
+
+
+class StatePoller(object):
+    """
+    polls cameras and reports the changes, see module description
+    """
+
+    def __init__(self, cams, commands=("getDevState",), ignore=None, workers=8):
+        """
+        :param cams: dict {name: camera object} or list of camera objects
+        :param commands: getters to poll
+        :param ignore: dict {command: set of fields} not reported, default DEFAULT_IGNORE
+        :param workers: number of cameras polled at the same time by poll()
+        """
+        self.cams = cameraItems(cams)
+        self.commands = tuple(commands)
+        self.ignore = DEFAULT_IGNORE if ignore is None else ignore
+        self.workers = workers
+        self.listeners = []  # functions called with each ChangeEvent
+
+        self.lock = threading.Lock()
+        self.fieldNames = {}  # cmd: list of fields
+        self.fieldIndex = {}  # cmd: {field: index}
+        self.states = {}  # (camera, cmd): (hash of the answer, tuple of values)
+        self.available = {}  # camera: bool
+        self.lastError = {}  # camera: exception of the last failed poll
+        self.polls = 0
+        self.unchanged = 0  # answers identical to the last one
+
+    def index(self, cmd, field):
+        """ position of a field in the state tuples of cmd, new fields are appended
+        """
+        index = self.fieldIndex.setdefault(cmd, {})
+        pos = index.get(field)
+        if pos is None:
+            with self.lock:
+                pos = index.get(field)
+                if pos is None:
+                    names = self.fieldNames.setdefault(cmd, [])
+                    pos = index[field] = len(names)
+                    names.append(field)
+        return pos
+
+    def diff(self, name, cam, cmd, body, when):
+        """ compare an answer with the last state
+        :returns: list of :class:`ChangeEvent`
+        """
+        key = (name, cmd)
+        digest = hash(body)
+        last = self.states.get(key)
+        if last is not None and last[0] == digest:
+            self.unchanged += 1
+            return []
+
+        data = cam.decodeResult(body)
+        if data.get("result") != "0":
+            # error code, the state is unknown
+            return []
+        ignore = self.ignore.get(cmd, ())
+        positions = []
+        for field, value in data.items():
+            if field != "result" and field not in ignore:
+                positions.append((self.index(cmd, field), value))
+        values = [None] * len(self.fieldNames.get(cmd, ()))
+        for pos, value in positions:
+            values[pos] = value
+        values = tuple(values)
+        self.states[key] = (digest, values)
+        if last is None:
+            return []
+
+        events = []
+        oldValues = last[1]
+        names = self.fieldNames.get(cmd, ())
+        for pos, value in enumerate(values):
+            old = oldValues[pos] if pos < len(oldValues) else None
+            if value != old:
+                events.append(ChangeEvent(name, cmd, names[pos], old, value, when))
+        for pos in range(len(values), len(oldValues)):
+            if oldValues[pos] is not None:
+                events.append(ChangeEvent(name, cmd, names[pos], oldValues[pos], None, when))
+        return events
+
+    def pollCamera(self, name, cam, commands=None):
+        """ poll one camera
+        :param commands: getters to poll, None = all
+        :returns: list of :class:`ChangeEvent`, the listeners have been called
+        """
+        when = time.time()
+        events = []
+        try:
+            for cmd in commands or self.commands:
+                events += self.diff(name, cam, cmd, cam.sendcommand(cmd, raw=True), when)
+        except Exception as err:
+            self.lastError[name] = err
+            if not (isNetworkError(err) or isinstance(err, errors.CamError)):
+                raise
+            if self.available.get(name, True):
+                events.append(ChangeEvent(name, None, AVAILABLE, True, False, when))
+            self.available[name] = False
+        else:
+            if self.available.get(name) is False:
+                events.insert(0, ChangeEvent(name, None, AVAILABLE, False, True, when))
+            self.available[name] = True
+        self.polls += 1
+        for event in events:
+            for listener in list(self.listeners):
+                listener(event)
+        return events
+
+    def poll(self):
+        """ poll all cameras once
+        :returns: list of :class:`ChangeEvent`
+        :raises: the first exception which is not a network or camera error
+        """
+        events = []
+        failure = None
+        for item, result, error in parallel(self.cams, lambda item: self.pollCamera(item[0], item[1]),
+                                            self.workers):
+            events += result or []
+            if error is not None and failure is None:
+                failure = error
+        if failure is not None:
+            raise failure
+        return events
+
+    def state(self, name, cmd="getDevState"):
+        """
+        :returns: last known state as dict (without ignored fields), None if unknown
+        """
+        last = self.states.get((name, cmd))
+        if last is None:
+            return None
+        return dict((field, value) for field, value in zip(self.fieldNames[cmd], last[1]) if value is not None)
+
+
+class PollEntry(object):
+    """
+    schedule of one camera in :class:`AdaptivePoller`
+    """
+
+    def __init__(self, name, cam, interval):
+        self.name = name
+        self.cam = cam
+        self.interval = interval
+        self.due = 0.0
+        self.latency = None  # moving average, seconds
+        self.alarmUntil = 0.0
+        self.polls = 0
+
+
+class AdaptivePoller(object):
+    """
+    polls the cameras of a :class:`StatePoller` with an interval per camera
+
+    - a camera whose state changed is polled twice as often, a quiet one less often (backoff)
+    - while an alarm is active (and alarmHold seconds after it was raised) the camera is
+      polled every minInterval
+    - a camera is not polled more often than every slowFactor * its response time
+    - cameras whose circuit breaker is open are skipped
+    - all cameras together send at most `budget` requests per second, the cameras
+      overdue the longest are polled first
+
+    A single thread keeps the schedule in a heap and hands the due cameras to
+    `workers` threads.
+
+        adaptive = AdaptivePoller(StatePoller(cams), budget=20)
+        adaptive.start()
+        ...
+        adaptive.stop()
+    """
+
+    def __init__(self, poller, minInterval=1.0, maxInterval=60.0, baseInterval=5.0, budget=50.0, workers=8,
+                 backoff=1.5, alarmHold=60.0, slowFactor=4.0, clock=None):
+        """
+        :param poller: :class:`StatePoller` with the cameras and commands
+        :param minInterval: shortest interval in seconds
+        :param maxInterval: longest interval in seconds
+        :param baseInterval: interval of the first polls
+        :param budget: max. requests per second of all cameras
+        :param workers: number of polls running at the same time
+        :param backoff: factor the interval of a quiet camera grows with each poll
+        :param alarmHold: seconds a camera stays at minInterval after an alarm was raised
+        :param slowFactor: the interval is at least the response time multiplied by this factor
+        """
+        from .resilience import monotonic
+
+        self.poller = poller
+        self.minInterval = minInterval
+        self.maxInterval = maxInterval
+        self.budget = budget
+        self.workers = workers
+        self.backoff = backoff
+        self.alarmHold = alarmHold
+        self.slowFactor = slowFactor
+        self.clock = clock or monotonic
+
+        self.entries = [PollEntry(name, cam, baseInterval) for name, cam in poller.cams]
+        self.cond = threading.Condition()
+        self.heap = []
+        self.seq = 0
+        self.tokens = float(budget)
+        self.refilled = None
+        self.running = False
+        self.threads = []
+        self.todo = None
+
+        self.requests = 0
+        self.skipped = 0  # polls skipped because the circuit breaker was open
+
+    def alarmActive(self, name):
+        state = self.poller.state(name)
+        if not state:
+            return False
+        return any(state.get(field) == value for field, value in ALARM_ACTIVE.items())
+
+    def nextInterval(self, entry, events, latency, failed=False):
+        """ adapt the interval of a camera after a poll
+        :param events: ChangeEvents of the poll
+        :param latency: seconds the poll took
+        :param failed: the camera did not answer
+        :returns: new interval
+        """
+        now = self.clock()
+        if not failed:
+            entry.latency = latency if entry.latency is None else 0.7 * entry.latency + 0.3 * latency
+        if any(event.kind == "alarmRaised" for event in events):
+            entry.alarmUntil = now + self.alarmHold
+
+        changes = [event for event in events if event.field != AVAILABLE]
+        if now < entry.alarmUntil or (changes and self.alarmActive(entry.name)):
+            interval = self.minInterval
+        elif changes:
+            interval = entry.interval / 2.0
+        else:
+            interval = entry.interval * self.backoff
+        if entry.latency is not None:
+            interval = max(interval, entry.latency * self.slowFactor)
+        entry.interval = max(self.minInterval, min(self.maxInterval, interval))
+        return entry.interval
+
+    def schedule(self, entry, delay):
+        """ put a camera into the heap, the lock must be held
+        """
+        entry.due = self.clock() + delay
+        self.seq += 1
+        heapq.heappush(self.heap, (entry.due, self.seq, entry))
+        self.cond.notify()
+
+    def takeTokens(self, count):
+        """ token bucket of the request budget, the lock must be held
+        :returns: seconds to wait until the requests may be sent, 0 = taken
+        """
+        now = self.clock()
+        if self.refilled is not None:
+            self.tokens = min(float(self.budget), self.tokens + (now - self.refilled) * self.budget)
+        self.refilled = now
+        if self.tokens >= count:
+            self.tokens -= count
+            return 0.0
+        return (count - self.tokens) / self.budget
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.todo = queue.Queue()
+        with self.cond:
+            # spread the first polls over the base interval
+            for x, entry in enumerate(self.entries):
+                self.schedule(entry, entry.interval * x / max(1, len(self.entries)))
+        self.threads = [threading.Thread(target=self.run, name="AdaptivePoller")]
+        self.threads += [threading.Thread(target=self.work, name="AdaptivePoller-%s" % x)
+                         for x in range(self.workers)]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        for x in range(self.workers):
+            self.todo.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        self.heap = []
+
+    def run(self):
+        """ timer loop: hands the due cameras to the workers
+        """
+        requests = len(self.poller.commands)
+        with self.cond:
+            while self.running:
+                if not self.heap:
+                    self.cond.wait()
+                    continue
+                wait = self.heap[0][0] - self.clock()
+                if wait <= 0:
+                    entry = self.heap[0][2]
+                    if not entry.cam.isAvailable():
+                        heapq.heappop(self.heap)
+                        self.skipped += 1
+                        self.schedule(entry, self.maxInterval)
+                        continue
+                    wait = self.takeTokens(requests)
+                    if wait <= 0:
+                        heapq.heappop(self.heap)
+                        self.requests += requests
+                        self.todo.put(entry)
+                        continue
+                self.cond.wait(wait)
+
+    def work(self):
+        while True:
+            entry = self.todo.get()
+            if entry is None:
+                return
+            start = self.clock()
+            try:
+                events = self.poller.pollCamera(entry.name, entry.cam)
+                failed = self.poller.available.get(entry.name) is False
+            except Exception:
+                # a bug, not the camera: kept in poller.lastError, the camera is polled again later
+                events, failed = [], True
+            entry.polls += 1
+            with self.cond:
+                interval = self.nextInterval(entry, events, self.clock() - start, failed)
+                if self.running:
+                    self.schedule(entry, interval)
+
+    def stats(self):
+        """
+        :returns: dict {camera name: (current interval, number of polls)}
+        """
+        return dict((entry.name, (entry.interval, entry.polls)) for entry in self.entries)
@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+
+"""
+pre-event recording: the frames of the MJPEG stream before and after a motion alarm
+
+    buffer = PreEventBuffer(cam, "/srv/events", seconds=5, after=10)
+    buffer.start()
+    poller.listeners.append(buffer.onChange)  # StatePoller of the camera
+
+The stream (MJStreamURL) is read continuously into a ring of preallocated slots of a
+fixed size, holding the frames of the last `seconds`.  The frames are read directly
+into the slots, a frame larger than a slot is skipped (counted as oversize), so the
+memory used does not depend on the size of the frames.
+
+trigger() (or onChange() with the alarmRaised event of the motion detection) starts an
+event: the frames in the ring are written to a new directory, followed by the frames
+of the next `after` seconds.  A trigger during an event extends it.  One file is written
+per frame, named by its time (milliseconds) and its number within the event.  The files are written by the thread
+reading the stream, from the slots without copying.
+"""
+
+import array
+import errno
+import math
+import os
+import socket
+import threading
+import time
+
+try:
+    from urllib.parse import urlsplit
+except ImportError:
+    from urlparse import urlsplit
+
+from . import errors
+
+SLOT_SIZE = 262144
+
+
+class FrameRing(object):
+    """
+    the last frames in preallocated slots of a fixed size
+    """
+
+    def __init__(self, slots, slotSize=SLOT_SIZE):
+        self.slots = slots
+        self.slotSize = slotSize
+        self.buffer = bytearray(slots * slotSize)
+        self.view = memoryview(self.buffer)
+        self.lengths = array.array("l", [0] * slots)
+        self.times = array.array("d", [0.0] * slots)
+        self.count = 0  # frames stored since the start
+
+    def slot(self):
+        """
+        :returns: (index, memoryview) of the slot for the next frame, it is only
+                  part of the ring after commit()
+        """
+        index = self.count % self.slots
+        start = index * self.slotSize
+        return index, self.view[start:start + self.slotSize]
+
+    def commit(self, index, length, when):
+        self.lengths[index] = length
+        self.times[index] = when
+        self.count += 1
+
+    def put(self, data, when):
+        """ copy a frame into the ring
+        :returns: False if it is larger than a slot
+        """
+        if len(data) > self.slotSize:
+            return False
+        index, view = self.slot()
+        view[:len(data)] = data
+        self.commit(index, len(data), when)
+        return True
+
+    def frames(self, since=None):
+        """
+        :param since: only frames of this time or later, None = all
+        :returns: list of (time, memoryview), oldest first
+        """
+        res = []
+        for n in range(max(0, self.count - self.slots), self.count):
+            index = n % self.slots
+            when = self.times[index]
+            if since is None or when >= since:
+                start = index * self.slotSize
+                res.append((when, self.view[start:start + self.lengths[index]]))
+        return res
+
+
+class PreEventBuffer(object):
+    """
+    keeps the last seconds of the MJPEG stream of a camera, see module description
+    """
+
+    def __init__(self, cam, directory, name=None, seconds=5.0, after=10.0, frameRate=5, slotSize=SLOT_SIZE,
+                 reconnectDelay=5.0, clock=time.time):
+        """
+        :param cam: camera object
+        :param directory: base directory of the events, a subdirectory is created per camera
+        :param name: name of the camera, default cam.target
+        :param seconds: time kept before a trigger
+        :param after: time recorded after a trigger
+        :param frameRate: frames per second of the stream, determines the number of slots
+        :param slotSize: max. size of a frame
+        :param reconnectDelay: seconds to wait before the stream is opened again after an error
+        """
+        self.cam = cam
+        self.directory = directory
+        self.name = cam.target if name is None else name
+        self.seconds = seconds
+        self.after = after
+        self.reconnectDelay = reconnectDelay
+        self.clock = clock
+        self.ring = FrameRing(int(math.ceil(seconds * frameRate)) + 1, slotSize)
+
+        self.lock = threading.Lock()
+        self.thread = None
+        self.running = False
+        self.stopped = threading.Event()  # wakes up the wait before a reconnect
+        self.sock = None
+        self.eventStart = None
+        self.eventEnd = None
+        self.eventDir = None
+        self.eventFrames = 0
+
+        self.oversize = 0  # frames skipped as they don't fit into a slot
+        self.events = []  # (directory, number of frames) of the finished events
+        self.lastError = None
+        self.listeners = []  # functions called with (directory, number of frames) when an event is complete
+
+    def start(self):
+        self.running = True
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, name="prebuffer-%s" % self.name)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self, timeout=5.0):
+        self.running = False
+        self.stopped.set()
+        sock = self.sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)  # wakes up the blocked read
+            except socket.error:
+                pass
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def trigger(self, when=None):
+        """ start an event, or extend the running one
+        :param when: time of the alarm, default now
+        """
+        if when is None:
+            when = self.clock()
+        with self.lock:
+            if self.eventStart is None:
+                self.eventStart = when
+                self.eventEnd = when + self.after
+            else:
+                self.eventEnd = max(self.eventEnd, when + self.after)
+
+    def onChange(self, event):
+        """ listener for :class:`poller.StatePoller`, triggers on motion alarms of the camera
+        """
+        if event.camera == self.name and event.field == "motionDetectAlarm" and event.kind == "alarmRaised":
+            self.trigger()
+
+    def run(self):
+        while self.running:
+            try:
+                self.stream()
+            except Exception as err:
+                self.lastError = err
+            if self.running:
+                self.stopped.wait(self.reconnectDelay)
+
+    def stream(self):
+        """ read the stream until stop() or an error
+        """
+        url = urlsplit(self.cam.MJStreamURL)
+        conn = self.cam.connection()
+        conn.connect()
+        self.sock = conn.sock
+        try:
+            conn.request("GET", "%s?%s" % (url.path, url.query))
+            resp = conn.getresponse()
+            if resp.status != 200 or not resp.getheader("Content-Type", "").startswith("multipart/"):
+                raise errors.CamError("MJPEG stream: HTTP %s %s, %s" % (resp.status, resp.reason,
+                                                                         resp.getheader("Content-Type")))
+            while self.running:
+                if not self.readFrame(resp):
+                    break
+        finally:
+            self.sock = None
+            conn.close()
+
+    def readFrame(self, resp):
+        """ read the next part of the stream into the ring
+        :returns: False at the end of the stream
+        """
+        line = resp.readline()
+        while line and not line.startswith(b"--"):
+            line = resp.readline()
+        length = None
+        while True:
+            line = resp.readline()
+            if not line:
+                return False
+            if not line.strip():
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        if length is None:
+            raise errors.CamError("MJPEG part without Content-Length")
+
+        ring = self.ring
+        if length > ring.slotSize:
+            self.oversize += 1
+            while length > 0:
+                skipped = len(resp.read(min(length, ring.slotSize)))
+                if not skipped:
+                    return False
+                length -= skipped
+            return True
+
+        index, view = ring.slot()
+        got = 0
+        while got < length:
+            n = resp.readinto(view[got:length])
+            if not n:
+                return False
+            got += n
+        when = self.clock()
+        ring.commit(index, length, when)
+        self.frameStored(when, view[:length])
+        return True
+
+    def frameStored(self, when, frame):
+        """ write the frames of a running event
+        """
+        with self.lock:
+            start = self.eventStart
+        if start is None:
+            return
+        if self.eventDir is None:
+            self.eventDir = self.makeEventDir(start)
+            for frameTime, data in self.ring.frames(since=start - self.seconds):
+                self.writeFrame(frameTime, data)
+        else:
+            self.writeFrame(when, frame)
+
+        # checked and reset together, a trigger() in between would be lost otherwise
+        with self.lock:
+            done = when >= self.eventEnd
+            if done:
+                self.eventStart = self.eventEnd = None
+        if done:
+            finished = (self.eventDir, self.eventFrames)
+            self.eventDir = None
+            self.eventFrames = 0
+            self.events.append(finished)
+            for listener in list(self.listeners):
+                listener(*finished)
+
+    def makeEventDir(self, start):
+        """ create the directory of an event, named by its start time (milliseconds)
+        :returns: path, with a suffix if an event of the same millisecond exists
+        """
+        path = os.path.join(self.directory, self.name, time.strftime("%Y%m%d_%H%M%S", time.localtime(start))
+                            + "_%03d" % (int(start * 1000) % 1000))
+        candidate = path
+        suffix = 0
+        while True:
+            try:
+                os.makedirs(candidate)
+                return candidate
+            except OSError as err:
+                if err.errno != errno.EEXIST:
+                    raise
+            suffix += 1
+            candidate = "%s-%d" % (path, suffix)
+
+    def writeFrame(self, when, data):
+        # frames of the same millisecond get different names
+        name = "%013d_%05d.jpg" % (int(when * 1000), self.eventFrames)
+        with open(os.path.join(self.eventDir, name), "wb") as fh:
+            fh.write(data)
+        self.eventFrames += 1
@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+
+"""
+low latency PTZ control, e.g. for joysticks
+
+    ptz = cam.ptzController()
+    ptz.move("ne")
+    ptz.move("e")       # replaces "ne" if that one has not been sent yet
+    ptz.stop()
+    ...
+    ptz.close()
+
+The commands are sent by a background thread over a single keep-alive connection,
+the calling thread never waits for the camera.
+
+- Only the latest move of an axis (pan/tilt or zoom) waits to be sent, a newer move
+  supersedes an older one (counted as `coalesced`).
+- ptzStopRun and zoomStop are never dropped: they discard a waiting move of their axis
+  and are sent before any move.
+- The latency is measured from the call (e.g. move()) until the answer of the camera
+  was received, i.e. including the time the command waited for the connection.
+  It is passed to the listeners and the instrumentation hooks of the camera (phase "total",
+  the wait is reported as phase "queue").
+"""
+
+import collections
+import errno
+import socket
+import threading
+import time
+
+from . import errors, instrument, resilience
+from .transport import clock, httplib
+
+PAN = "pan"
+ZOOM = "zoom"
+
+# axis of each command
+AXES = {
+    "ptzMoveUp": PAN, "ptzMoveDown": PAN, "ptzMoveLeft": PAN, "ptzMoveRight": PAN,
+    "ptzMoveTopLeft": PAN, "ptzMoveTopRight": PAN, "ptzMoveBottomLeft": PAN, "ptzMoveBottomRight": PAN,
+    "ptzReset": PAN, "ptzStopRun": PAN,
+    "zoomIn": ZOOM, "zoomOut": ZOOM, "zoomStop": ZOOM,
+}
+
+STOP_COMMANDS = {PAN: "ptzStopRun", ZOOM: "zoomStop"}
+
+
+def connectionClosed(err):
+    """
+    :returns: True if the exception means that the camera closed the kept connection
+              (reset, broken pipe, or closed before the answer)
+    """
+    if isinstance(err, httplib.BadStatusLine):
+        # includes RemoteDisconnected
+        return True
+    return isinstance(err, socket.error) and err.errno in (errno.ECONNRESET, errno.EPIPE, errno.ECONNABORTED)
+
+# see Cam.ptzMove()
+DIRECTIONS = {'n': "ptzMoveUp", 'ne': "ptzMoveTopRight", 'e': "ptzMoveRight", 'se': "ptzMoveBottomRight",
+              's': "ptzMoveDown", 'sw': "ptzMoveBottomLeft", 'w': "ptzMoveLeft", 'nw': "ptzMoveTopLeft",
+              'h': "ptzReset"}
+
+
+class PTZController(object):
+    """
+    sends PTZ commands of one camera over a warm connection, see module description
+    """
+
+    def __init__(self, cam, warm=True, history=100):
+        """
+        :param cam: :class:`CamBase` object, supplies address, credentials, timeouts and hooks
+        :param warm: open the connection at once, not with the first command
+        :param history: number of latencies kept for stats()
+        """
+        self.cam = cam
+        self.origin = "%s://%s:%s" % (cam.prot, cam.host, cam.port)
+        self.conn = None
+
+        self.cond = threading.Condition()
+        self.moves = {}  # axis: (cmd, submitted, time)
+        self.stops = {}  # axis: (cmd, submitted, time)
+        self.busy = False
+        self.closed = False
+
+        self.submitted = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.failed = 0
+        self.lastError = None
+        self.latencies = collections.deque(maxlen=history)
+        self.listeners = []  # functions called with (cmd, latency, resultObj or None, exception or None)
+
+        self.thread = threading.Thread(target=self.run, args=(warm,), name="PTZController")
+        self.thread.daemon = True
+        self.thread.start()
+
+    # commands
+
+    def send(self, cmd):
+        """ queue a PTZ command, returns immediately
+        :param cmd: one of AXES, e.g. "ptzMoveLeft"
+        """
+        axis = AXES.get(cmd)
+        if axis is None:
+            raise ValueError("not a PTZ command: %s" % cmd)
+        entry = (cmd, clock(), time.time())
+        with self.cond:
+            if self.closed:
+                raise errors.CamError("PTZ controller closed")
+            self.submitted += 1
+            if axis in self.moves:
+                # superseded before it was sent
+                del self.moves[axis]
+                self.coalesced += 1
+            if STOP_COMMANDS[axis] == cmd:
+                if axis in self.stops:
+                    self.coalesced += 1
+                self.stops[axis] = entry
+            else:
+                self.moves[axis] = entry
+            self.cond.notify()
+
+    def move(self, direction):
+        """ move into a direction or (h)ome, see :func:`Cam.ptzMove`
+        """
+        cmd = DIRECTIONS.get(direction.lower())
+        if cmd is None:
+            raise ValueError("invalid ptz direction: %s" % direction)
+        self.send(cmd)
+
+    def stop(self):
+        self.send("ptzStopRun")
+
+    def zoomIn(self):
+        self.send("zoomIn")
+
+    def zoomOut(self):
+        self.send("zoomOut")
+
+    def zoomStop(self):
+        self.send("zoomStop")
+
+    def flush(self, timeout=None):
+        """ wait until all queued commands have been sent
+        :returns: False on timeout
+        """
+        deadline = None if timeout is None else clock() + timeout
+        with self.cond:
+            while self.moves or self.stops or self.busy:
+                if deadline is None:
+                    self.cond.wait()
+                else:
+                    remaining = deadline - clock()
+                    if remaining <= 0:
+                        return False
+                    self.cond.wait(remaining)
+        return True
+
+    def close(self):
+        """ send the queued commands and close the connection
+        """
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.thread.join()
+
+    def stats(self):
+        """
+        :returns: dict with counters and the latencies (seconds) of the last commands sent,
+                  sent = commands answered by the camera, failed = the others (including
+                  error codes in strict mode)
+        """
+        values = [lat for cmd, lat in list(self.latencies)]
+        return {"submitted": self.submitted, "sent": self.sent, "coalesced": self.coalesced, "failed": self.failed,
+                "last": values[-1] if values else None,
+                "mean": sum(values) / len(values) if values else None,
+                "max": max(values) if values else None}
+
+    # background thread
+
+    def next(self):
+        """ take the next command, stops first, then the oldest move
+        """
+        for queue in (self.stops, self.moves):
+            if queue:
+                axis = min(queue, key=lambda a: queue[a][1])
+                return queue.pop(axis)
+        return None
+
+    def run(self, warm):
+        if warm:
+            try:
+                self.connect()
+            except Exception as err:
+                # tried again with the first command
+                self.lastError = err
+        while True:
+            with self.cond:
+                entry = self.next()
+                while entry is None and not self.closed:
+                    self.cond.wait()
+                    entry = self.next()
+                if entry is None:
+                    break
+                self.busy = True
+            try:
+                self.execute(*entry)
+            finally:
+                with self.cond:
+                    self.busy = False
+                    self.cond.notify_all()
+        self.disconnect()
+
+    def execute(self, cmd, submitted, started):
+        cam = self.cam
+        event = None
+        if cam.hooks or instrument.globalHooks():
+            event = instrument.CommandEvent(cmd, cam.host, cam.port)
+            event.time = started
+            event.start = submitted
+            event.timings["queue"] = clock() - submitted
+
+        result = error = None
+        try:
+            if event is not None:
+                cam.callHooks("pre", event)
+            if cam.breaker is not None:
+                cam.breaker.check(cam.target)
+            url = cam.commandUrl(cmd)
+            cam.dump(url)
+            try:
+                body = self.request(cmd, url, event)
+            except Exception as err:
+                if cam.breaker is not None:
+                    if resilience.isNetworkError(err):
+                        cam.breaker.failure()
+                    else:
+                        cam.breaker.success()
+                raise
+            if cam.breaker is not None:
+                cam.breaker.success()
+            cam.dump(body)
+            # like Cam.sendcommand, raises in strict mode
+            result = cam.makeResult(cmd, body, event=event)
+            self.sent += 1
+        except Exception as err:
+            error = err
+            self.failed += 1
+            self.lastError = err
+
+        latency = clock() - submitted
+        self.latencies.append((cmd, latency))
+        try:
+            if event is not None:
+                event.timings["total"] = latency
+                event.error = error
+                if result is not None:
+                    event.result = result.result
+                cam.callHooks("post", event)
+            for listener in list(self.listeners):
+                listener(cmd, latency, result, error)
+        except Exception as err:
+            # a broken hook or listener must not stop the background thread
+            self.lastError = err
+
+    def connect(self):
+        conn = self.cam.connection()
+        conn.connect()
+        self.conn = conn
+
+    def disconnect(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def request(self, cmd, url, event=None):
+        """ send a command over the kept connection
+        :param url: result of commandUrl()
+        :returns: body of the response
+        """
+        path = url[len(self.origin):]
+        while True:
+            fresh = self.conn is None
+            if fresh:
+                self.connect()
+            try:
+                self.conn.request("GET", path)
+                resp = self.conn.getresponse()
+                body = resp.read()
+            except (socket.error, httplib.HTTPException) as err:
+                self.disconnect()
+                if fresh or not connectionClosed(err):
+                    # e.g. a timeout: the camera may have executed the command
+                    raise
+                # the camera closed the idle connection, try once more with a new one
+                continue
+            if event is not None:
+                event.timings.update(self.conn.timings)
+                event.bytesIn = len(body)
+            self.conn.timings.clear()
+            if resp.status >= 500:
+                raise httplib.HTTPException("HTTP %s %s" % (resp.status, resp.reason))
+            if resp.status != 200:
+                raise errors.CamError("%s: HTTP %s %s" % (cmd, resp.status, resp.reason))
+            return body
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+"""
+local index of the recordings on the SD cards of many cameras (sqlite)
+
+    index = RecordIndex("/var/lib/foscam/records.db")
+    index.syncAll({"garden": cam1, "gate": cam2})
+    for camera, record in index.query(start=yesterday22h, end=today6h, recordType=1):
+        print(camera, record.path, record.start)
+
+sync() only asks the camera for the recordings starting at or after the newest one
+already in the index, a full sync (full=True) also removes recordings the camera no
+longer has (e.g. overwritten when the card was full).  The cameras must be
+:class:`foscontrol.Cam` objects (getRecordList with paging).
+"""
+
+import sqlite3
+import threading
+import time
+
+from . import Record, errors
+from .fleet import cameraItems, parallel
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    camera TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER,
+    startTime INTEGER,
+    endTime INTEGER,
+    recordType INTEGER,
+    PRIMARY KEY (camera, path)
+);
+CREATE INDEX IF NOT EXISTS records_start ON records (startTime);
+CREATE TABLE IF NOT EXISTS syncs (
+    camera TEXT PRIMARY KEY,
+    lastStart INTEGER,
+    syncTime REAL,
+    fetched INTEGER
+);
+"""
+
+
+def timestamp(value):
+    """
+    :param value: unix time stamp, datetime (local time, like the camera) or None
+    :returns: unix time stamp or None
+    """
+    if value is None or isinstance(value, (int, float)):
+        return value
+    return int(time.mktime(value.timetuple()))
+
+
+class RecordIndex(object):
+    """
+    sqlite index of the recordings, see module description
+    """
+
+    def __init__(self, filename):
+        """
+        :param filename: name of the database file, ":memory:" for a temporary index
+        """
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(filename, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def lastStart(self, camera):
+        """
+        :returns: start time of the newest recording known of the camera, None if none
+        """
+        with self.lock:
+            row = self.db.execute("SELECT lastStart FROM syncs WHERE camera = ?", (camera,)).fetchone()
+        return row[0] if row else None
+
+    def fetch(self, cam, since=None):
+        """ get the recordings from the camera (network only, no database access)
+        :returns: list of :class:`foscontrol.Record`
+        """
+        res = cam.getRecordList(startTime=since)
+        if res.result != 0:
+            raise errors.resultError("getRecordList", res.result, res)
+        return [r for r in res._record or [] if isinstance(r, Record)]
+
+    def store(self, camera, records, full=False):
+        """ write fetched recordings into the index
+        :param full: records is the complete list, remove all others of the camera
+        """
+        with self.lock:
+            db = self.db
+            if full:
+                db.execute("DELETE FROM records WHERE camera = ?", (camera,))
+            db.executemany("INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?, ?)",
+                           [(camera,) + tuple(r) for r in records])
+            row = db.execute("SELECT MAX(startTime) FROM records WHERE camera = ?", (camera,)).fetchone()
+            db.execute("INSERT OR REPLACE INTO syncs VALUES (?, ?, ?, ?)",
+                       (camera, row[0], time.time(), len(records)))
+            db.commit()
+
+    def sync(self, camera, cam, full=False):
+        """ bring the index of one camera up to date
+        :param camera: name of the camera in the index
+        :param cam: :class:`foscontrol.Cam` object
+        :param full: fetch all recordings, not only the new ones
+        :returns: number of recordings fetched
+        """
+        records = self.fetch(cam, None if full else self.lastStart(camera))
+        self.store(camera, records, full)
+        return len(records)
+
+    def syncAll(self, cams, full=False, workers=8):
+        """ sync many cameras, the recordings are fetched in parallel
+        :param cams: dict {name: camera object} or list of camera objects
+        :returns: dict {name: number of recordings fetched or exception}
+        """
+        items = cameraItems(cams)
+        since = dict((name, None if full else self.lastStart(name)) for name, cam in items)
+
+        def fetch(item):
+            return self.fetch(item[1], since[item[0]])
+
+        report = {}
+        for (name, cam), records, error in parallel(items, fetch, workers):
+            if error is not None:
+                report[name] = error
+                continue
+            self.store(name, records, full)
+            report[name] = len(records)
+        return report
+
+    def query(self, start=None, end=None, recordType=None, cameras=None):
+        """ recordings overlapping a period
+        :param start: unix time stamp or datetime, None = no limit
+        :param end: unix time stamp or datetime, None = no limit
+        :param recordType: 0 = schedule, 1 = alarm, 2 = manual, None = all
+        :param cameras: list of camera names, None = all
+        :returns: list of (camera name, :class:`foscontrol.Record`), ordered by start time
+        """
+        sql = "SELECT camera, path, size, startTime, endTime, recordType FROM records WHERE 1"
+        args = []
+        if start is not None:
+            sql += " AND endTime >= ?"
+            args.append(timestamp(start))
+        if end is not None:
+            sql += " AND startTime <= ?"
+            args.append(timestamp(end))
+        if recordType is not None:
+            sql += " AND recordType = ?"
+            args.append(recordType)
+        if cameras is not None:
+            cameras = list(cameras)
+            sql += " AND camera IN (%s)" % ",".join("?" * len(cameras))
+            args += cameras
+        sql += " ORDER BY startTime, camera"
+        with self.lock:
+            rows = self.db.execute(sql, args).fetchall()
+        return [(row[0], Record(*row[1:])) for row in rows]
+
+    def stats(self):
+        """
+        :returns: dict {camera: (number of recordings, bytes, time of the last sync)}
+        """
+        with self.lock:
+            rows = self.db.execute("SELECT r.camera, COUNT(*), SUM(r.size), s.syncTime FROM records r "
+                                   "LEFT JOIN syncs s ON s.camera = r.camera GROUP BY r.camera").fetchall()
+        return dict((row[0], (row[1], row[2], row[3])) for row in rows)
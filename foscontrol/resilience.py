@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+
+"""
+timeouts, retries and circuit breaker for the CGI requests
+
+- RetryPolicy: repeats idempotent commands (get*) after network errors, with exponential backoff
+- CircuitBreaker: after `threshold` consecutive network errors the camera is regarded as down,
+  requests fail immediately with CircuitOpen.  After resetTimeout the next request is let
+  through as trial (half-open), its result closes the breaker or opens it again with a
+  doubled interval.  Optionally a background timer probes the camera instead.
+
+Only network errors (connection refused, timeout, broken connection, HTTP 5xx) count as
+failures, error codes returned by the camera do not.
+"""
+
+import errno
+import random
+import socket
+import ssl
+import threading
+import time
+
+try:
+    from time import monotonic
+except ImportError:
+    # Python 2
+    from time import time as monotonic
+
+try:
+    from http.client import HTTPException
+    from urllib.error import HTTPError, URLError
+except ImportError:
+    from httplib import HTTPException
+    from urllib2 import HTTPError, URLError
+
+try:
+    ConnectionError
+except NameError:
+    # Python 2
+    ConnectionError = socket.error
+
+from .errors import CircuitOpen
+
+# connect and read timeout in seconds
+DEFAULT_TIMEOUT = (10.0, 30.0)
+
+# commands without side effects besides get*
+IDEMPOTENT_COMMANDS = frozenset(["ptzGetCruiseMapList", "ptzGetCruiseMapInfo", "snapPicture", "snapPicture2"])
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "halfOpen"
+
+
+def isIdempotent(cmd):
+    return cmd.startswith("get") or cmd in IDEMPOTENT_COMMANDS
+
+
+# errors of a connection which are no ConnectionError
+NETWORK_ERRNOS = frozenset([errno.EHOSTUNREACH, errno.ENETUNREACH, errno.ENETDOWN, errno.EHOSTDOWN,
+                            errno.ETIMEDOUT])
+
+
+def isNetworkError(err):
+    """
+    :returns: True if the exception means that the camera is not reachable or did not answer properly
+
+    Local errors (e.g. disk full while writing a download, permissions) are no network
+    errors, although they are OSErrors like the socket errors.
+    """
+    if isinstance(err, HTTPError):
+        return err.code >= 500
+    if isinstance(err, (URLError, HTTPException, ConnectionError, socket.timeout, socket.gaierror, ssl.SSLError)):
+        return True
+    return isinstance(err, socket.error) and err.errno in NETWORK_ERRNOS
+
+
+class RetryPolicy(object):
+    def __init__(self, attempts=3, backoff=0.2, maxBackoff=5.0, jitter=0.1, sleep=time.sleep):
+        """
+        :param attempts: max. number of attempts (1 = no retry)
+        :param backoff: seconds to wait before the first retry, doubled with each further retry
+        :param maxBackoff: upper limit of the wait
+        :param jitter: random part of the wait (fraction), spreads the retries of many cameras
+        """
+        self.attempts = attempts
+        self.backoff = backoff
+        self.maxBackoff = maxBackoff
+        self.jitter = jitter
+        self.sleep = sleep
+
+    def delay(self, attempt):
+        """
+        :param attempt: number of the failed attempt (1 = first)
+        :returns: seconds to wait before the next attempt
+        """
+        secs = min(self.maxBackoff, self.backoff * (2 ** (attempt - 1)))
+        return secs * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def attemptsFor(self, cmd):
+        return self.attempts if isIdempotent(cmd) else 1
+
+
+NO_RETRY = RetryPolicy(attempts=1)
+
+
+class CircuitBreaker(object):
+    """
+    per camera circuit breaker
+
+    States:
+    - closed:   requests pass
+    - open:     requests fail with CircuitOpen
+    - halfOpen: a single trial request passes (only without background probe)
+    """
+
+    def __init__(self, threshold=5, resetTimeout=30.0, maxResetTimeout=600.0, probe=None, clock=monotonic):
+        """
+        :param threshold: consecutive failures which open the breaker
+        :param resetTimeout: seconds until the first probe
+        :param maxResetTimeout: the interval between the probes doubles up to this value
+        :param probe: function checking the camera, raises an exception if it is still down.
+                      If None, the first request after resetTimeout is the probe.
+        """
+        self.threshold = threshold
+        self.resetTimeout = resetTimeout
+        self.maxResetTimeout = maxResetTimeout
+        self.probe = probe
+        self.clock = clock
+
+        self.lock = threading.Lock()
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.openedAt = None
+        self.retryAt = None
+        self.interval = resetTimeout
+        self.timer = None
+        self.trialRunning = False
+        self.opened = 0  # number of times the breaker opened
+        self.rejected = 0
+        self.listeners = []  # functions called with (breaker, old state, new state)
+        self.changes = []  # (old state, new state) not yet passed to the listeners
+
+    def setState(self, state):
+        """ the lock must be held, the listeners are called by notify() after it was released
+        """
+        old = self.state
+        self.state = state
+        if old != state:
+            self.changes.append((old, state))
+
+    def notify(self):
+        """ call the listeners with the state changes, without holding the lock
+        (a listener may use the breaker)
+        """
+        with self.lock:
+            changes, self.changes = self.changes, []
+        for old, state in changes:
+            for listener in list(self.listeners):
+                listener(self, old, state)
+
+    def allow(self):
+        """
+        :returns: True if a request may be sent now
+        """
+        try:
+            with self.lock:
+                if self.state == STATE_CLOSED:
+                    return True
+                if self.state == STATE_OPEN and self.probe is None and self.clock() >= self.retryAt:
+                    self.setState(STATE_HALF_OPEN)
+                if self.state == STATE_HALF_OPEN and not self.trialRunning:
+                    self.trialRunning = True
+                    return True
+                self.rejected += 1
+                return False
+        finally:
+            self.notify()
+
+    def available(self):
+        """
+        like allow(), but without side effects, e.g. for schedulers skipping unhealthy cameras
+        """
+        if self.state == STATE_CLOSED:
+            return True
+        return self.probe is None and self.state == STATE_OPEN and self.clock() >= self.retryAt
+
+    def check(self, target):
+        """
+        :raises: CircuitOpen if no request may be sent
+        """
+        if not self.allow():
+            raise CircuitOpen(target, self.retryAt)
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.trialRunning = False
+            if self.state != STATE_CLOSED:
+                self.close()
+        self.notify()
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trialRunning = False
+            if self.state == STATE_HALF_OPEN:
+                self.interval = min(self.maxResetTimeout, self.interval * 2)
+                self.open()
+            elif self.state == STATE_CLOSED and self.failures >= self.threshold:
+                self.interval = self.resetTimeout
+                self.open()
+        self.notify()
+
+    def open(self):
+        self.opened += 1
+        self.openedAt = self.clock()
+        self.retryAt = self.openedAt + self.interval
+        self.setState(STATE_OPEN)
+        if self.probe is not None:
+            self.scheduleProbe(self.interval)
+
+    def close(self):
+        self.failures = 0
+        self.interval = self.resetTimeout
+        self.openedAt = self.retryAt = None
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        self.setState(STATE_CLOSED)
+
+    def scheduleProbe(self, delay):
+        self.timer = threading.Timer(delay, self.runProbe)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def runProbe(self):
+        try:
+            self.probe()
+        except Exception:
+            with self.lock:
+                if self.state == STATE_OPEN:
+                    self.interval = min(self.maxResetTimeout, self.interval * 2)
+                    self.retryAt = self.clock() + self.interval
+                    self.scheduleProbe(self.interval)
+            return
+        with self.lock:
+            if self.state == STATE_OPEN:
+                self.close()
+        self.notify()
+
+    def cancel(self):
+        """
+        stop the background probe
+        """
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+
+"""
+simulator for Foscam HD cameras
+
+Serves the CGI interface, MJPEG stream, snapshots, and the low level protocol
+of any number of virtual cameras, e.g. for load tests without real hardware.
+
+    python -m foscontrol.simulator --cameras 100 --latency 0.01 0.1
+"""
+
+from .camera import VirtualCamera
+from .server import CamSimulator
@@ -0,0 +1,708 @@
+# -*- coding: utf-8 -*-
+
+"""
+state and CGI commands of a simulated camera
+
+The command set follows the calls implemented in :class:`foscontrol.CamBase`,
+including the deviations from the SDK documentation listed in docs/cgi-notes.txt:
+
+- values in the XML result are urlencoded
+- getLog without parameters returns the first page, IP addresses are stored little endian
+- ptzAddPresetPoint returns addResult (2: point already exists)
+- ptzDeletePresetPoint returns deleteResult (1: does not exist, 4: used in a cruise)
+- ptzDelCruiseMap returns delResult (1: cruise does not exist)
+- setOSDSetting ignores isEnableOSDMask, use the undocumented setOSDMask
+- getOSDMask returns the same as getOSDSetting
+- snapPicture2 cuts off the picture after 512,000 bytes
+- importConfig returns importResult, the camera reboots afterwards
+- fwUpgrade (multipart upload like importConfig) accepts images made by firmwareImage(),
+  the camera reboots and reports the new firmwareVer afterwards
+- setAlarmRecordConfig fails (-1) if preRecordSecs > 5 or alarmRecordSecs > 60
+- SMTP config uses the misspelled parameter "reciever", smtpTest returns errorMsg
+- getPTZSpeed: 0 = very fast, 4 = very slow
+- the recordings of getRecordList can be downloaded with their path (/mnt/sd/record/...),
+  the server honours Range headers
+"""
+
+import collections
+import datetime
+import hashlib
+import random
+import socket
+import struct
+import time
+
+try:
+    from urllib.parse import quote
+except ImportError:
+    from urllib import quote
+
+from . import jpeg
+
+RESULT_OK = 0
+RESULT_FORMAT_ERROR = -1
+RESULT_AUTH_ERROR = -2
+RESULT_ACCESS_DENIED = -3
+RESULT_EXECUTE_FAILURE = -4
+RESULT_TIMEOUT = -5
+
+SNAPPICTURE2_LIMIT = 512000
+
+
+def _schedules(prefix, count, value="0"):
+    return dict(("%s%s" % (prefix, x), value) for x in range(count))
+
+
+def _defaults():
+    """
+    :returns: settings of a camera fresh from the factory
+    """
+    d = {
+        "image": {"brightness": "50", "contrast": "50", "hue": "50", "saturation": "50",
+                  "sharpness": "50", "denoiseLevel": "50"},
+        "mirror": {"isMirror": "0", "isFlip": "0"},
+        "pwrFreq": {"freq": "1"},
+        "videoStream": {"streamType": "0", "resolution": "0", "bitRate": "2097152", "frameRate": "30",
+                        "GOP": "30", "isVBR": "0"},
+        "mainStreamType": {"streamType": "0"},
+        "subStreamType": {"streamType": "0", "format": "0"},
+        "osd": {"isEnableTimeStamp": "1", "isEnableDevName": "1", "dispPos": "0", "isEnableOSDMask": "0"},
+        "osdMaskArea": {},
+        "motion": {"isEnable": "0", "linkage": "0", "snapInterval": "2", "triggerInterval": "0",
+                   "sensitivity": "1"},
+        "ptzSpeed": {"speed": "2"},
+        "ptzSelfTest": {"mode": "0"},
+        "ptzPrePointForSelfTest": {"name": ""},
+        "rs485": {"rs485Protocol": "0", "rs485Addr": "1", "rs485Baud": "9600", "rs485DataBit": "8",
+                  "rs485StopBit": "1", "rs485Check": "0"},
+        "ip": {"isDHCP": "1", "ip": "192.168.0.100", "gate": "192.168.0.1", "mask": "255.255.255.0",
+               "dns1": "192.168.0.1", "dns2": "0.0.0.0"},
+        "snap": {"snapPicQuality": "2", "saveLocation": "0"},
+        "wifi": {"isEnable": "0", "isUseWifi": "0", "isConnected": "0", "connectedAP": "", "ssid": "",
+                 "encryptType": "0", "psk": "", "authMode": "2", "keyFormat": "0", "defaultKey": "1",
+                 "key1": "", "key2": "", "key3": "", "key4": "", "key1Len": "64", "key2Len": "64",
+                 "key3Len": "64", "key4Len": "64"},
+        "infraLed": {"mode": "0"},
+        "scheduleSnap": {"isEnable": "0", "snapInterval": "1"},
+        "alarmRecord": {"isEnablePreRecord": "1", "preRecordSecs": "5", "alarmRecordSecs": "30"},
+        "ioAlarm": {"isEnable": "0", "linkage": "0", "alarmLevel": "0", "snapInterval": "2",
+                    "triggerInterval": "0"},
+        "firewall": {"isEnable": "0", "rule": "0"},
+        "port": {"webPort": "88", "mediaPort": "88", "httpsPort": "443", "onvifPort": "888"},
+        "upnp": {"isEnable": "1"},
+        "ddns": {"isEnable": "0", "hostName": "", "ddnsServer": "0", "user": "", "password": ""},
+        "ftp": {"ftpAddr": "", "ftpPort": "21", "mode": "0", "userName": "", "password": ""},
+        "smtp": {"isEnable": "0", "server": "", "port": "25", "isNeedAuth": "0", "tls": "0", "user": "",
+                 "password": "", "sender": "", "reciever": ""},
+        "systemTime": {"timeSource": "0", "ntpServer": "time.nist.gov", "dateFormat": "0", "timeFormat": "1",
+                       "timeZone": "0", "isDst": "0", "dst": "0"},
+    }
+    for a in range(4):
+        for p in ("x1_", "y1_", "x2_", "y2_"):
+            d["osdMaskArea"]["%s%s" % (p, a)] = "0"
+    d["motion"].update(_schedules("schedule", 7))
+    d["motion"].update(_schedules("area", 10))
+    d["scheduleSnap"].update(_schedules("schedule", 7))
+    d["ioAlarm"].update(_schedules("schedule", 7))
+    d["firewall"].update(_schedules("ipList", 8))
+    return d
+
+
+# command -> settings group returned
+GETTERS = {
+    "getImageSetting": "image",
+    "getMirrorAndFlipSetting": "mirror",
+    "getVideoStreamParam": "videoStream",
+    "getMainVideoStreamType": "mainStreamType",
+    "getSubVideoStreamType": "subStreamType",
+    "getOSDSetting": "osd",
+    "getOSDMask": "osd",
+    "getOsdMaskArea": "osdMaskArea",
+    "getMotionDetectConfig": "motion",
+    "getPTZSpeed": "ptzSpeed",
+    "getPTZSelfTestMode": "ptzSelfTest",
+    "getPTZPrePointForSelfTest": "ptzPrePointForSelfTest",
+    "get485Info": "rs485",
+    "getIPInfo": "ip",
+    "getSnapConfig": "snap",
+    "getWifiConfig": "wifi",
+    "getInfraLedConfig": "infraLed",
+    "getScheduleSnapConfig": "scheduleSnap",
+    "getAlarmRecordConfig": "alarmRecord",
+    "getIOAlarmConfig": "ioAlarm",
+    "getFirewallConfig": "firewall",
+    "getPortInfo": "port",
+    "getUPnPConfig": "upnp",
+    "getDDNSConfig": "ddns",
+    "getFtpConfig": "ftp",
+    "getSMTPConfig": "smtp",
+}
+
+# command -> settings group updated with the parameters
+SETTERS = {
+    "setBrightness": "image",
+    "setContrast": "image",
+    "setHue": "image",
+    "setSaturation": "image",
+    "setSharpness": "image",
+    "mirrorVideo": "mirror",
+    "flipVideo": "mirror",
+    "setPwrFreq": "pwrFreq",
+    "setVideoStreamParam": "videoStream",
+    "setMainVideoStreamType": "mainStreamType",
+    "setSubVideoStreamType": "subStreamType",
+    "setOSDSetting": "osd",
+    "setOSDMask": "osd",
+    "setOsdMaskArea": "osdMaskArea",
+    "setMotionDetectConfig": "motion",
+    "setPTZSpeed": "ptzSpeed",
+    "setPTZSelfTestMode": "ptzSelfTest",
+    "setPTZPrePointForSelfTest": "ptzPrePointForSelfTest",
+    "set485Info": "rs485",
+    "setIpInfo": "ip",
+    "setSnapSetting": "snap",
+    "setSnapConfig": "snap",
+    "setWifiSetting": "wifi",
+    "setInfraLedConfig": "infraLed",
+    "setScheduleSnapConfig": "scheduleSnap",
+    "setAlarmRecordConfig": "alarmRecord",
+    "setIOAlarmConfig": "ioAlarm",
+    "setFirewallConfig": "firewall",
+    "setPortInfo": "port",
+    "setUPnPConfig": "upnp",
+    "setDDNSConfig": "ddns",
+    "setFtpConfig": "ftp",
+    "setSMTPConfig": "smtp",
+}
+
+# parameters a setter silently ignores
+IGNORED_PARAMS = {
+    "setOSDSetting": ("isEnableOSDMask",),
+}
+
+PTZ_COMMANDS = ("ptzMoveUp", "ptzMoveDown", "ptzMoveLeft", "ptzMoveRight", "ptzMoveTopLeft", "ptzMoveTopRight",
+                "ptzMoveBottomLeft", "ptzMoveBottomRight", "ptzStopRun", "ptzReset", "zoomIn", "zoomOut",
+                "zoomStop")
+
+
+FIRMWARE_MAGIC = b"FOSCFW01"
+
+
+def firmwareImage(version, size=1024 * 1024):
+    """
+    firmware image accepted by the simulated cameras
+    :param version: firmwareVer reported after the upgrade
+    :param size: size of the image in bytes (padded with pseudo random data)
+    """
+    head = FIRMWARE_MAGIC + version.encode("ascii") + b"\n"
+    pad = hashlib.sha256(head).digest()
+    return head + (pad * (size // len(pad) + 1))[:max(0, size - len(head))]
+
+
+def xmlResult(fields):
+    """
+    encode a result as the camera does
+    :param fields: ordered list of (name, value), the result code first
+    :returns: bytes
+    """
+    lines = ["<CGI_Result>"]
+    for name, value in fields:
+        lines.append("    <%s>%s</%s>" % (name, quote(str(value), safe=""), name))
+    lines.append("</CGI_Result>")
+    lines.append("")
+    return "\n".join(lines).encode("utf-8")
+
+
+class Response(object):
+    """
+    HTTP response produced by a virtual camera
+    """
+
+    def __init__(self, body, contentType="text/plain", status=200):
+        self.body = body
+        self.contentType = contentType
+        self.status = status
+
+
+class VirtualCamera(object):
+    """
+    simulated camera
+
+    Behaviour that can be configured per camera:
+    - latency:    seconds added to every request, either a number or a tuple (min, max)
+    - errors:     dict {command: result code} forcing a result, "*" applies to all commands
+    - errorRate:  probability (0..1) that a command fails with errorCode
+    - pageSize:   entries per page for getLog, getWifiList, getRecordList
+    - rebootTime: seconds the camera does not answer after a reboot (rebootSystem, importConfig, ...)
+    - recordDrops: list of byte offsets, the next download of a recording is cut off after the first one
+    """
+
+    def __init__(self, name="FosSim", user="admin", password="", seed=0, latency=0.0, pageSize=10,
+                 errors=None, errorRate=0.0, errorCode=RESULT_EXECUTE_FAILURE, rebootTime=0.0,
+                 firmwareVer="2.11.1.118", snapshotPadding=0, logEntries=25, recordEntries=30):
+        self.name = name
+        self.user = user
+        self.password = password
+        self.seed = seed
+        self.latency = latency
+        self.pageSize = pageSize
+        self.errors = dict(errors or {})
+        self.errorRate = errorRate
+        self.errorCode = errorCode
+        self.rebootTime = rebootTime
+        self.snapshotPadding = snapshotPadding
+
+        self.host = None
+        self.port = None
+        self.random = random.Random(seed)
+
+        self.settings = _defaults()
+        self.settings["devName"] = {"devName": name}
+        self.devInfo = {
+            "productName": "FI9821W V2",
+            "serialNo": "SIM%08d" % seed,
+            "devName": name,
+            "mac": "00626E%06X" % (seed & 0xffffff),
+            "firmwareVer": firmwareVer,
+            "hardwareVer": "1.4.1.10",
+        }
+        self.devState = {
+            "IOAlarm": "0",
+            "motionDetectAlarm": "1",
+            "soundAlarm": "0",
+            "record": "0",
+            "sdState": "1",
+            "sdFreeSpace": "7000000k",
+            "sdTotalSpace": "7500000k",
+            "ntpState": "1",
+            "ddnsState": "0",
+            "url": "",
+            "upnpState": "1",
+            "isWifiConnected": "0",
+            "wifiConnectedAP": "",
+            "infraLedState": "0",
+        }
+
+        self.ptzState = "stop"
+        self.presets = ["TopMost", "BottomMost", "LeftMost", "RightMost"]
+        self.cruises = {"Horizontal": ["LeftMost", "RightMost"], "Vertical": ["TopMost", "BottomMost"]}
+        self.accounts = {user: (password, "2")}
+        self.sessions = {}
+        self.multiDevs = {}
+        self.wifiList = ["AP%s+00:11:22:33:44:%02x+%s+1+3" % (x, x, 40 + x) for x in range(14)]
+
+        now = int(time.time())
+        self.log = ["%s+%s+%s+%s" % (now - 3600 * x, user, self._ipLittleEndian("192.168.0.%s" % (x + 2)),
+                                     [0, 3, 4, 5][x % 4]) for x in range(logEntries)]
+        self.records = self._makeRecords(recordEntries, now)
+        self.recordDrops = []
+        self.recordRequests = []  # (path, Range header or None) of the downloads
+
+        self.configBlob = self._exportBlob()
+        self.exports = {}
+        self.upgrades = 0
+        self.snapshots = collections.OrderedDict()
+        self.frame = 0
+        self.rebootUntil = 0.0
+        self.reboots = 0
+
+        self.calls = collections.Counter()  # number of calls per command
+        self.listeners = []  # functions called with (event, value), e.g. by FOSC sessions
+
+    @staticmethod
+    def _ipLittleEndian(ip):
+        return struct.unpack("<L", socket.inet_aton(ip))[0]
+
+    def _makeRecords(self, count, now):
+        """
+        recordings on the SD card, one every 20 minutes, every third one triggered by an alarm
+        format of an entry: path+size+startTime+endTime+recordType
+        """
+        records = []
+        for x in range(count):
+            start = now - (count - x) * 1200
+            recordType = 1 if x % 3 == 0 else 0
+            name = "%s_%s.avi" % ("MDalarm" if recordType else "schedule",
+                                  datetime.datetime.fromtimestamp(start).strftime("%Y%m%d_%H%M%S"))
+            path = "/mnt/sd/record/%s" % name
+            size = 100000 + self.random.randint(0, 50000)
+            records.append((path, size, start, start + 60, recordType))
+        return records
+
+    def recordContent(self, path):
+        """
+        :returns: content of a recording (deterministic filler of the listed size), None if unknown
+        """
+        for record in self.records:
+            if record[0] == path:
+                pattern = hashlib.sha256(path.encode("utf-8")).digest()
+                return (pattern * (record[1] // len(pattern) + 1))[:record[1]]
+        return None
+
+    def _exportBlob(self):
+        """
+        the exported configuration: derived from the settings, so it only changes if they change
+        """
+        parts = []
+        for group in sorted(self.settings):
+            for key in sorted(self.settings[group]):
+                parts.append("%s.%s=%s" % (group, key, self.settings[group][key]))
+        body = "\n".join(parts).encode("utf-8")
+        return b"FOSCCFG1" + hashlib.sha1(body).digest() + body
+
+    # behaviour
+
+    def delay(self):
+        """
+        :returns: seconds to wait before answering
+        """
+        if isinstance(self.latency, (tuple, list)):
+            return self.random.uniform(self.latency[0], self.latency[1])
+        return self.latency
+
+    def rebooting(self):
+        return time.time() < self.rebootUntil
+
+    def reboot(self):
+        self.reboots += 1
+        self.rebootUntil = time.time() + self.rebootTime
+        self.notify("reboot", None)
+
+    def notify(self, event, value):
+        for listener in list(self.listeners):
+            listener(event, value)
+
+    def trigger(self, alarm="motionDetectAlarm", active=True):
+        """
+        raise or clear an alarm
+        :param alarm: name of the getDevState field, e.g. "motionDetectAlarm", "IOAlarm", "soundAlarm"
+        """
+        if alarm == "IOAlarm":
+            self.devState[alarm] = "1" if active else "0"
+        else:
+            self.devState[alarm] = "2" if active else "1"
+        if active:
+            self.notify(alarm, True)
+
+    def nextPicture(self):
+        self.frame += 1
+        return jpeg.testPicture(self.frame, seed=self.seed, padding=self.snapshotPadding)
+
+    # CGI dispatcher
+
+    def handleCgi(self, params, body=None):
+        """
+        execute a CGI command
+        :param params: dict with the URL parameters
+        :param body: request body (POST)
+        :returns: Response
+        """
+        cmd = params.get("cmd", "")
+        self.calls[cmd] += 1
+
+        if params.get("usr") != self.user or params.get("pwd") != self.password:
+            return self.result(RESULT_AUTH_ERROR)
+
+        forced = self.errors.get(cmd, self.errors.get("*"))
+        if forced is not None:
+            return self.result(forced)
+        if self.errorRate and self.random.random() < self.errorRate:
+            return self.result(self.errorCode)
+
+        handler = getattr(self, "cgi_" + cmd, None)
+        if handler is not None:
+            res = handler(params, body)
+        elif cmd in GETTERS:
+            res = sorted(self.settings[GETTERS[cmd]].items())
+        elif cmd in SETTERS:
+            ignored = IGNORED_PARAMS.get(cmd, ())
+            group = self.settings.setdefault(SETTERS[cmd], {})
+            for key, value in params.items():
+                if key not in ("cmd", "usr", "pwd") and key not in ignored:
+                    group[key] = value
+            self.configBlob = self._exportBlob()
+            self.notify("settings", SETTERS[cmd])
+            res = []
+        elif cmd in PTZ_COMMANDS:
+            self.ptzState = cmd
+            res = []
+        else:
+            return self.result(RESULT_FORMAT_ERROR)
+
+        if isinstance(res, Response):
+            return res
+        if isinstance(res, int):
+            return self.result(res)
+        return self.result(RESULT_OK, res)
+
+    def result(self, code, fields=()):
+        return Response(xmlResult([("result", code)] + list(fields)), "text/plain;charset=UTF-8")
+
+    def page(self, entries, prefix, params, startparam="startNo", countparam=None):
+        """
+        return a page of a list, as getLog, getWifiList, and getRecordList do
+        """
+        try:
+            start = int(params.get(startparam) or 0)
+            count = int(params.get(countparam) or self.pageSize) if countparam else self.pageSize
+        except ValueError:
+            return RESULT_FORMAT_ERROR
+        count = min(count, self.pageSize)
+        part = entries[start:start + count]
+        res = [("totalCnt", len(entries)), ("curCnt", len(part))]
+        res += [("%s%s" % (prefix, x), v) for x, v in enumerate(part)]
+        return res
+
+    # commands with special behaviour
+
+    def cgi_getDevInfo(self, params, body):
+        return list(self.devInfo.items())
+
+    def cgi_getDevState(self, params, body):
+        return list(self.devState.items())
+
+    def cgi_getDevName(self, params, body):
+        return [("devName", self.settings["devName"]["devName"])]
+
+    def cgi_setDevName(self, params, body):
+        self.settings["devName"]["devName"] = params.get("devName", "")
+        self.devInfo["devName"] = self.settings["devName"]["devName"]
+        self.configBlob = self._exportBlob()
+        self.notify("settings", "devName")
+        return []
+
+    def cgi_setAlarmRecordConfig(self, params, body):
+        try:
+            if int(params.get("preRecordSecs", 0)) > 5 or int(params.get("alarmRecordSecs", 0)) > 60:
+                return RESULT_FORMAT_ERROR
+        except ValueError:
+            return RESULT_FORMAT_ERROR
+        for key in ("isEnablePreRecord", "preRecordSecs", "alarmRecordSecs"):
+            if key in params:
+                self.settings["alarmRecord"][key] = params[key]
+        return []
+
+    def cgi_resetImageSetting(self, params, body):
+        self.settings["image"] = _defaults()["image"]
+        return []
+
+    def cgi_getSystemTime(self, params, body):
+        now = datetime.datetime.now()
+        res = sorted(self.settings["systemTime"].items())
+        res += [("year", now.year), ("mon", now.month), ("day", now.day), ("hour", now.hour),
+                ("minute", now.minute), ("sec", now.second)]
+        return res
+
+    def cgi_setSystemTime(self, params, body):
+        for key in self.settings["systemTime"]:
+            if key in params:
+                self.settings["systemTime"][key] = params[key]
+        return []
+
+    def cgi_getLog(self, params, body):
+        return self.page(self.log, "log", params, startparam="offset", countparam="count")
+
+    def cgi_refreshWifiList(self, params, body):
+        return []
+
+    def cgi_getWifiList(self, params, body):
+        return self.page(self.wifiList, "ap", params)
+
+    def cgi_getRecordList(self, params, body):
+        try:
+            start = int(params.get("startTime") or 0)
+            end = int(params.get("endTime") or 0x7fffffff)
+            recordType = params.get("recordType")
+            recordType = int(recordType) if recordType not in (None, "") else None
+        except ValueError:
+            return RESULT_FORMAT_ERROR
+        entries = ["%s+%s+%s+%s+%s" % r for r in self.records
+                   if r[2] >= start and r[3] <= end and (recordType is None or r[4] == recordType)]
+        return self.page(entries, "record", params)
+
+    def cgi_getPTZPresetPointList(self, params, body):
+        return [("cnt", len(self.presets))] + [("point%s" % x, p) for x, p in enumerate(self.presets)]
+
+    def cgi_ptzAddPresetPoint(self, params, body):
+        name = params.get("name", "")
+        if name in self.presets:
+            return [("addResult", 2)]
+        self.presets.append(name)
+        return [("addResult", 0)]
+
+    def cgi_ptzDeletePresetPoint(self, params, body):
+        name = params.get("name", "")
+        if name not in self.presets:
+            return [("deleteResult", 1)]
+        if any(name in points for points in self.cruises.values()):
+            return [("deleteResult", 4)]
+        self.presets.remove(name)
+        return [("deleteResult", 0)]
+
+    def cgi_ptzGotoPresetPoint(self, params, body):
+        if params.get("name") not in self.presets:
+            return RESULT_EXECUTE_FAILURE
+        self.ptzState = "preset"
+        return []
+
+    def cgi_ptzGetCruiseMapList(self, params, body):
+        names = sorted(self.cruises)
+        return [("cnt", len(names))] + [("map%s" % x, names[x] if x < len(names) else "") for x in range(8)] + \
+               [("getResult", 0)]
+
+    def cgi_ptzGetCruiseMapInfo(self, params, body):
+        points = self.cruises.get(params.get("name"))
+        if points is None:
+            return [("getResult", 1)]
+        return [("point%s" % x, points[x] if x < len(points) else "") for x in range(8)] + [("getResult", 0)]
+
+    def cgi_ptzSetCruiseMap(self, params, body):
+        points = [params["point%s" % x] for x in range(8) if params.get("point%s" % x)]
+        self.cruises[params.get("name", "")] = points
+        return [("setResult", 0)]
+
+    def cgi_ptzDelCruiseMap(self, params, body):
+        if self.cruises.pop(params.get("name"), None) is None:
+            return [("delResult", 1)]
+        return [("delResult", 0)]
+
+    def cgi_ptzStartCruise(self, params, body):
+        if params.get("mapName") not in self.cruises:
+            return [("startResult", 1)]
+        self.ptzState = "cruise"
+        return [("startResult", 0)]
+
+    def cgi_ptzStopCruise(self, params, body):
+        self.ptzState = "stop"
+        return []
+
+    def cgi_openInfraLed(self, params, body):
+        self.devState["infraLedState"] = "1"
+        return []
+
+    def cgi_closeInfraLed(self, params, body):
+        self.devState["infraLedState"] = "0"
+        return []
+
+    def cgi_clearIOAlarmOutput(self, params, body):
+        self.devState["IOAlarm"] = "0"
+        return []
+
+    def cgi_exportConfig(self, params, body):
+        fileName = "%s_config.bin" % self.devInfo["serialNo"]
+        self.exports[fileName] = self.configBlob
+        return [("fileName", fileName)]
+
+    def cgi_importConfig(self, params, body):
+        if not body or b"FOSCCFG1" not in body:
+            return [("importResult", 1)]
+        self.reboot()
+        return [("importResult", 0)]
+
+    def cgi_fwUpgrade(self, params, body):
+        pos = (body or b"").find(FIRMWARE_MAGIC)
+        if pos < 0:
+            return RESULT_EXECUTE_FAILURE
+        end = body.find(b"\n", pos)
+        self.devInfo["firmwareVer"] = body[pos + len(FIRMWARE_MAGIC):end].decode("ascii")
+        self.upgrades += 1
+        self.reboot()
+        return []
+
+    def cgi_rebootSystem(self, params, body):
+        self.reboot()
+        return []
+
+    def cgi_restoreToFactorySetting(self, params, body):
+        self.settings = _defaults()
+        self.settings["devName"] = {"devName": self.name}
+        self.configBlob = self._exportBlob()
+        self.reboot()
+        return []
+
+    def cgi_setIpInfo(self, params, body):
+        for key in self.settings["ip"]:
+            if key in params:
+                self.settings["ip"][key] = params[key]
+        self.reboot()
+        return []
+
+    def cgi_snapPicture(self, params, body):
+        name = "Snap_%s-%06d.jpg" % (datetime.datetime.now().strftime("%Y%m%d-%H%M%S"), self.frame + 1)
+        self.snapshots[name] = self.nextPicture()
+        while len(self.snapshots) > 10:
+            self.snapshots.popitem(last=False)
+        return Response(('<html><body><img src="../snapPic/%s"/></body></html>' % name).encode("utf-8"),
+                        "text/html")
+
+    def cgi_snapPicture2(self, params, body):
+        return Response(self.nextPicture()[:SNAPPICTURE2_LIMIT], "image/jpeg")
+
+    def cgi_logIn(self, params, body):
+        self.sessions[params.get("usrName")] = params.get("groupId")
+        return [("logInResult", 0)]
+
+    def cgi_logOut(self, params, body):
+        self.sessions.pop(params.get("usrName"), None)
+        return []
+
+    def cgi_usrBeatHeart(self, params, body):
+        return []
+
+    def cgi_getSessionList(self, params, body):
+        return [("usrCnt", len(self.sessions))] + \
+               [("usr%s" % x, name) for x, name in enumerate(sorted(self.sessions))]
+
+    def cgi_getUserList(self, params, body):
+        return [("usrCnt", len(self.accounts))] + \
+               [("usr%s" % x, name) for x, name in enumerate(sorted(self.accounts))]
+
+    def cgi_addAccount(self, params, body):
+        name = params.get("usrName")
+        if name in self.accounts:
+            return [("addResult", 1)]
+        self.accounts[name] = (params.get("usrPwd", ""), params.get("privilege", "0"))
+        return [("addResult", 0)]
+
+    def cgi_delAccount(self, params, body):
+        if self.accounts.pop(params.get("usrName"), None) is None:
+            return [("delResult", 1)]
+        return [("delResult", 0)]
+
+    def cgi_changePassword(self, params, body):
+        name = params.get("usrName")
+        if name not in self.accounts or self.accounts[name][0] != params.get("oldPwd"):
+            return RESULT_EXECUTE_FAILURE
+        self.accounts[name] = (params.get("newPwd", ""), self.accounts[name][1])
+        if name == self.user:
+            self.password = params.get("newPwd", "")
+        return []
+
+    def cgi_changeUserName(self, params, body):
+        name = params.get("usrName")
+        if name not in self.accounts:
+            return RESULT_EXECUTE_FAILURE
+        self.accounts[params.get("newUsrName")] = self.accounts.pop(name)
+        if name == self.user:
+            self.user = params.get("newUsrName")
+        return []
+
+    def cgi_getMultiDevList(self, params, body):
+        return [("dev%s" % x, self.multiDevs.get(x, "")) for x in range(9)]
+
+    def cgi_getMultiDevDetailInfo(self, params, body):
+        return [("chnnl", params.get("chnnl")), ("info", self.multiDevs.get(int(params.get("chnnl", 0)), ""))]
+
+    def cgi_addMultiDev(self, params, body):
+        self.multiDevs[int(params.get("chnnl", 0))] = "%s+%s" % (params.get("devName", ""), params.get("ip", ""))
+        return []
+
+    def cgi_delMultiDev(self, params, body):
+        self.multiDevs.pop(int(params.get("chnnl", 0)), None)
+        return []
+
+    def cgi_testFtpServer(self, params, body):
+        return [("testResult", 0)]
+
+    def cgi_smtpTest(self, params, body):
+        return [("testResult", 0), ("errorMsg", "")]
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+"""
+minimal JPEG encoder for the simulator
+
+The images are grayscale, every 8x8 block has a single brightness value
+(only the DC coefficient is coded).  That is enough to produce valid,
+decodable test pictures of any size without an imaging library.
+"""
+
+import struct
+
+# standard luminance DC table (JPEG spec, table K.3)
+_DC_BITS = [0, 1, 5, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0]
+_DC_VALUES = list(range(12))
+
+# AC table with a single code: "0" = end of block
+_AC_BITS = [1] + [0] * 15
+_AC_VALUES = [0]
+
+# quantization: the DC coefficient of a block is 8 * (mean - 128)
+_QUANT = 8
+
+
+def _huffmanCodes(bits, values):
+    """
+    :returns: dict {value: (code, length)}
+    """
+    codes = {}
+    code = 0
+    pos = 0
+    for length in range(1, 17):
+        for x in range(bits[length - 1]):
+            codes[values[pos]] = (code, length)
+            code += 1
+            pos += 1
+        code <<= 1
+    return codes
+
+
+_DC_CODES = _huffmanCodes(_DC_BITS, _DC_VALUES)
+_EOB = _huffmanCodes(_AC_BITS, _AC_VALUES)[0]
+
+
+class _BitWriter(object):
+    def __init__(self):
+        self.data = bytearray()
+        self.acc = 0
+        self.count = 0
+
+    def write(self, code, length):
+        self.acc = (self.acc << length) | code
+        self.count += length
+        while self.count >= 8:
+            self.count -= 8
+            byte = (self.acc >> self.count) & 0xff
+            self.data.append(byte)
+            if byte == 0xff:
+                self.data.append(0)  # byte stuffing
+        self.acc &= (1 << self.count) - 1
+
+    def flush(self):
+        if self.count:
+            self.write((1 << (8 - self.count)) - 1, 8 - self.count)
+        return bytes(self.data)
+
+
+def _segment(marker, payload):
+    return struct.pack(">BBH", 0xff, marker, len(payload) + 2) + payload
+
+
+def encodeBlocks(blocks, comment=None):
+    """
+    create a JPEG picture
+    :param blocks: list of rows, each row a list of brightness values (0..255) for 8x8 pixel blocks
+    :param comment: optional bytes stored in a comment segment, may be used to pad the picture
+    :returns: JPEG data (bytes)
+    """
+    height = len(blocks) * 8
+    width = len(blocks[0]) * 8
+
+    out = [b"\xff\xd8",
+           _segment(0xdb, b"\x00" + bytes(bytearray([_QUANT] * 64))),
+           _segment(0xc0, struct.pack(">BHHBBBB", 8, height, width, 1, 1, 0x11, 0)),
+           _segment(0xc4, b"\x00" + bytes(bytearray(_DC_BITS + _DC_VALUES))),
+           _segment(0xc4, b"\x10" + bytes(bytearray(_AC_BITS + _AC_VALUES)))]
+
+    while comment:
+        out.append(_segment(0xfe, comment[:65533]))
+        comment = comment[65533:]
+
+    out.append(_segment(0xda, b"\x01\x01\x00\x00\x3f\x00"))
+
+    bits = _BitWriter()
+    prev = 0
+    eobcode, eoblen = _EOB
+    for row in blocks:
+        for value in row:
+            dc = (int(value) - 128) * 8 // _QUANT
+            diff = dc - prev
+            prev = dc
+            category = abs(diff).bit_length()
+            code, length = _DC_CODES[category]
+            bits.write(code, length)
+            if category:
+                bits.write(diff if diff > 0 else diff + (1 << category) - 1, category)
+            bits.write(eobcode, eoblen)
+    out.append(bits.flush())
+    out.append(b"\xff\xd9")
+    return b"".join(out)
+
+
+def testPicture(frame, width=320, height=240, seed=0, padding=0):
+    """
+    test picture: gradient with a bright square moving from left to right
+    :param frame: frame number, determines the position of the square
+    :param seed: varies the background (e.g. per camera)
+    :param padding: number of additional bytes (comment) to reach a certain file size
+    :returns: JPEG data
+    """
+    cols = width // 8
+    rows = height // 8
+    pos = frame % cols
+    top = rows // 3
+    blocks = []
+    for y in range(rows):
+        row = []
+        for x in range(cols):
+            if pos <= x < pos + 4 and top <= y < top + 4:
+                row.append(250)
+            else:
+                row.append((x * 4 + y * 2 + seed * 16) % 200 + 20)
+        blocks.append(row)
+    return encodeBlocks(blocks, comment=b"\x00" * padding if padding else None)
@@ -0,0 +1,560 @@
+# -*- coding: utf-8 -*-
+
+"""
+network front end of the simulator
+
+Every virtual camera listens on its own port and serves:
+
+- /cgi-bin/CGIProxy.fcgi    CGI commands (GET and POST)
+- /cgi-bin/CGIStream.cgi    MJPEG stream (cmd=GetMJStream)
+- /snapPic/<name>           pictures linked by snapPicture
+- /configs/export/<name>    files created by exportConfig
+- /mnt/sd/record/<name>     recordings listed by getRecordList (with Range requests)
+- SERVERPUSH                the low level protocol (see lowlevel/LowlevelProtocol.md)
+
+All cameras of a simulator share one asyncio event loop running in a background
+thread, so a single process can serve thousands of cameras.  Each camera needs
+one file descriptor for its listening socket (plus one per open connection),
+the limit may have to be raised (ulimit -n).
+
+Requires Python 3.
+"""
+
+import asyncio
+import itertools
+import math
+import struct
+import threading
+
+from urllib.parse import urlsplit, parse_qsl
+
+from .camera import VirtualCamera
+
+FOSC_HEADER = struct.Struct("<I4sI")
+
+# H.264 NAL units used for the synthetic video stream, see lowlevel/FoscVideo.py
+_SPS = b"\x00\x00\x00\x01\x67\x42\x00\x1e\xab\x40\x50\x1e\xc8"
+_PPS = b"\x00\x00\x00\x01\x68\xce\x38\x80"
+_IDR = b"\x00\x00\x00\x01\x65\x88\x84"
+_SLICE = b"\x00\x00\x00\x01\x41\x9a"
+
+MJPEG_BOUNDARY = "ipcamera"
+
+_STATUS = {200: "OK", 206: "Partial Content", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found",
+           405: "Method Not Allowed", 416: "Range Not Satisfiable"}
+
+
+def foscPacket(cmd, data=b""):
+    return FOSC_HEADER.pack(cmd, b"FOSC", len(data)) + data
+
+
+def _filler(size, seed):
+    """
+    payload for the synthetic slices, never contains a start code
+    """
+    return bytes(bytearray((0x10 + (x * 7 + seed) % 0xe0) for x in range(size)))
+
+
+class HttpRequest(object):
+    def __init__(self, method, target, version, headers, body):
+        self.method = method
+        self.target = target
+        self.version = version
+        self.headers = headers
+        self.body = body
+        parts = urlsplit(target)
+        self.path = parts.path
+        self.params = dict(parse_qsl(parts.query, keep_blank_values=True))
+
+    def keepAlive(self):
+        connection = self.headers.get("connection", "").lower()
+        if self.version == "HTTP/1.0":
+            return connection == "keep-alive"
+        return connection != "close"
+
+
+class CameraServer(object):
+    """
+    connection handler of a single virtual camera
+    """
+
+    def __init__(self, camera, videoFrameRate=15, gop=30, mjpegFrameRate=5):
+        self.camera = camera
+        self.videoFrameRate = videoFrameRate
+        self.gop = gop
+        self.mjpegFrameRate = mjpegFrameRate
+        self.server = None
+        self.connections = 0
+        self.requests = 0
+        self.talkBytes = 0
+
+    async def start(self, host, port=0):
+        self.server = await asyncio.start_server(self.handle, host, port)
+        self.camera.host = host
+        self.camera.port = self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                request = await self.readRequest(reader)
+                if request is None:
+                    break
+                self.requests += 1
+                if self.camera.rebooting():
+                    break  # not reachable
+                if request.method == "SERVERPUSH":
+                    await FoscSession(self, reader, writer).run()
+                    break
+                keep = await self.dispatch(request, writer)
+                if not keep or not request.keepAlive():
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def readRequest(self, reader):
+        """
+        :returns: HttpRequest or None if the connection has been closed
+        """
+        line = await reader.readline()
+        while line in (b"\r\n", b"\n"):
+            line = await reader.readline()  # tolerate empty lines between requests
+        if not line:
+            return None
+        method, target, version = line.decode("latin-1").split()
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        body = b""
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            parts = []
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await reader.readline()
+                    break
+                parts.append(await reader.readexactly(size))
+                await reader.readline()
+            body = b"".join(parts)
+        elif "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        return HttpRequest(method, target, version, headers, body)
+
+    async def respond(self, writer, status, body, contentType="text/plain", headers=None, keepAlive=True):
+        lines = ["HTTP/1.1 %s %s" % (status, _STATUS.get(status, "")),
+                 "Content-Type: %s" % contentType,
+                 "Content-Length: %s" % len(body),
+                 "Connection: %s" % ("keep-alive" if keepAlive else "close")]
+        for name, value in (headers or {}).items():
+            lines.append("%s: %s" % (name, value))
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    async def dispatch(self, request, writer):
+        """
+        answer a HTTP request
+        :returns: False if the connection has to be closed
+        """
+        delay = self.camera.delay()
+        if delay:
+            await asyncio.sleep(delay)
+
+        path = request.path
+        keep = request.keepAlive()
+        if path == "/cgi-bin/CGIProxy.fcgi":
+            res = self.camera.handleCgi(request.params, request.body)
+            await self.respond(writer, res.status, res.body, res.contentType, keepAlive=keep)
+        elif path == "/cgi-bin/CGIStream.cgi":
+            return await self.mjpeg(request, writer)
+        elif path.startswith("/snapPic/"):
+            data = self.camera.snapshots.get(path[len("/snapPic/"):])
+            await self.sendFile(writer, data, "image/jpeg", keep)
+        elif path.startswith("/configs/export/"):
+            data = self.camera.exports.get(path[len("/configs/export/"):])
+            await self.sendFile(writer, data, "application/octet-stream", keep)
+        elif path.startswith("/mnt/sd/"):
+            return await self.sendRecording(request, writer, keep)
+        else:
+            await self.respond(writer, 404, b"", keepAlive=keep)
+        return True
+
+    async def sendFile(self, writer, data, contentType, keepAlive):
+        if data is None:
+            await self.respond(writer, 404, b"", keepAlive=keepAlive)
+        else:
+            await self.respond(writer, 200, data, contentType, keepAlive=keepAlive)
+
+    async def sendRecording(self, request, writer, keepAlive):
+        """
+        file of the SD card, supports "Range: bytes=first-last" (also "first-" and "-suffix")
+        :returns: False if the connection has to be closed
+        """
+        camera = self.camera
+        params = request.params
+        rangeHeader = request.headers.get("range")
+        camera.recordRequests.append((request.path, rangeHeader))
+        if params.get("usr") != camera.user or params.get("pwd") != camera.password:
+            await self.respond(writer, 401, b"", keepAlive=keepAlive)
+            return True
+        data = camera.recordContent(request.path)
+        if data is None:
+            await self.respond(writer, 404, b"", keepAlive=keepAlive)
+            return True
+
+        size = len(data)
+        status, first, last = 200, 0, size - 1
+        if rangeHeader:
+            unit, _, spec = rangeHeader.partition("=")
+            start, _, end = spec.partition("-")
+            try:
+                if unit.strip() != "bytes" or "," in spec:
+                    raise ValueError
+                if start:
+                    first, last = int(start), min(int(end), size - 1) if end else size - 1
+                else:
+                    first, last = max(size - int(end), 0), size - 1
+            except ValueError:
+                first, last = 0, -1
+            if first > last or first >= size:
+                await self.respond(writer, 416, b"", headers={"Content-Range": "bytes */%s" % size},
+                                   keepAlive=keepAlive)
+                return True
+            status = 206
+
+        headers = {"Accept-Ranges": "bytes"}
+        if status == 206:
+            headers["Content-Range"] = "bytes %s-%s/%s" % (first, last, size)
+        body = data[first:last + 1]
+        if camera.recordDrops:
+            # simulated network failure: announce the whole body, send only a part of it
+            drop = camera.recordDrops.pop(0)
+            lines = ["HTTP/1.1 %s %s" % (status, _STATUS[status]), "Content-Type: video/x-msvideo",
+                     "Content-Length: %s" % len(body), "Connection: close"]
+            lines += ["%s: %s" % item for item in headers.items()]
+            writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body[:drop])
+            await writer.drain()
+            return False
+        await self.respond(writer, status, body, "video/x-msvideo", headers=headers, keepAlive=keepAlive)
+        return True
+
+    async def mjpeg(self, request, writer):
+        """
+        MJPEG stream, runs until the client disconnects
+        """
+        params = request.params
+        if params.get("cmd") != "GetMJStream":
+            await self.respond(writer, 400, b"", keepAlive=False)
+            return False
+        if params.get("usr") != self.camera.user or params.get("pwd") != self.camera.password:
+            res = self.camera.result(-2)
+            await self.respond(writer, 200, res.body, res.contentType, keepAlive=False)
+            return False
+
+        writer.write(("HTTP/1.1 200 OK\r\n"
+                      "Content-Type: multipart/x-mixed-replace;boundary=%s\r\n"
+                      "Connection: close\r\n\r\n" % MJPEG_BOUNDARY).encode("latin-1"))
+        interval = 1.0 / self.mjpegFrameRate
+        while self.server is not None:
+            picture = self.camera.nextPicture()
+            writer.write(("--%s\r\nContent-Type: image/jpeg\r\nContent-Length: %s\r\n\r\n"
+                          % (MJPEG_BOUNDARY, len(picture))).encode("latin-1"))
+            writer.write(picture)
+            writer.write(b"\r\n")
+            await writer.drain()
+            await asyncio.sleep(interval)
+        return False
+
+
+class FoscSession(object):
+    """
+    low level protocol on a SERVERPUSH connection
+    """
+
+    def __init__(self, server, reader, writer):
+        self.server = server
+        self.camera = server.camera
+        self.reader = reader
+        self.writer = writer
+        self.loggedIn = False
+        self.tasks = {}
+
+    def send(self, cmd, data=b""):
+        self.writer.write(foscPacket(cmd, data))
+
+    def credentials(self, data, offset):
+        """
+        :returns: (user, password) from the char64 fields at offset
+        """
+        user, password = struct.unpack_from("<64s64s", data, offset)
+        return user.rstrip(b"\x00").decode("utf-8"), password.rstrip(b"\x00").decode("utf-8")
+
+    def checkLogin(self, data, offset=1):
+        if len(data) < offset + 128:
+            return False
+        return self.credentials(data, offset) == (self.camera.user, self.camera.password)
+
+    def ptzInfo(self):
+        """
+        packet 100: preset points and cruises
+        """
+        presets = [p.encode("utf-8")[:31] for p in self.camera.presets[:16]]
+        cruises = [c.encode("utf-8")[:31] for c in sorted(self.camera.cruises)[:8]]
+        data = b"\x00" * 8 + struct.pack("<B", len(presets))
+        data += b"".join(struct.pack("32s", p) for p in presets + [b""] * (16 - len(presets)))
+        data += b"\x00" * 4 + struct.pack("<B", len(cruises))
+        data += b"".join(struct.pack("32s", c) for c in cruises + [b""] * (8 - len(cruises)))
+        data += b"\x00" * 4 + b"\x00" * 92 + struct.pack("12s", self.camera.devInfo["serialNo"].encode("ascii"))
+        return data
+
+    def event(self, event, value):
+        """
+        listener for changes of the camera state
+        """
+        if event == "motionDetectAlarm":
+            self.send(111, b"\x01\x00\x00\x1e")
+        elif event == "settings" and value == "mirror":
+            mirror = self.camera.settings["mirror"]
+            self.send(108, struct.pack("<II", int(mirror["isMirror"]), int(mirror["isFlip"])))
+        elif event == "settings" and value == "image":
+            image = self.camera.settings["image"]
+            self.send(110, struct.pack("<6B", *[int(image[k]) for k in
+                                                ("brightness", "contrast", "hue", "saturation", "sharpness",
+                                                 "denoiseLevel")]))
+        elif event == "settings" and value == "pwrFreq":
+            self.send(112, struct.pack("<I", int(self.camera.settings["pwrFreq"]["freq"])))
+        elif event == "reboot":
+            self.writer.close()
+
+    async def run(self):
+        self.camera.listeners.append(self.event)
+        try:
+            header = await self.reader.readexactly(FOSC_HEADER.size)
+            while header[:2] == b"\r\n":
+                # the SERVERPUSH request ends with an additional empty line
+                header = header[2:] + await self.reader.readexactly(2)
+            while True:
+                cmd, magic, size = FOSC_HEADER.unpack(header)
+                if magic != b"FOSC":
+                    break
+                data = await self.reader.readexactly(size)
+                if not self.command(cmd, data):
+                    break
+                await self.writer.drain()
+                header = await self.reader.readexactly(FOSC_HEADER.size)
+        finally:
+            self.camera.listeners.remove(self.event)
+            for task in self.tasks.values():
+                task.cancel()
+
+    def command(self, cmd, data):
+        """
+        process a command of the client
+        :returns: False if the connection has to be closed
+        """
+        self.camera.calls["fosc%s" % cmd] += 1
+        if cmd == 12:
+            self.loggedIn = self.checkLogin(data)
+            self.send(100, self.ptzInfo() if self.loggedIn else b"")
+        elif cmd == 15:
+            self.send(29, struct.pack("<I", 0 if self.loggedIn else 1))
+        elif cmd == 1:
+            return False
+        elif cmd == 0 and self.checkLogin(data):
+            self.startTask("video", self.video())
+        elif cmd == 2 and self.checkLogin(data):
+            self.startTask("audio", self.audio())
+        elif cmd == 3:
+            self.stopTask("audio")
+        elif cmd == 4:
+            self.send(20, b"\x00" * 36)
+        elif cmd == 5:
+            self.send(21, b"\x00" * 36)
+        elif cmd == 6:
+            self.server.talkBytes += max(0, len(data) - 4)
+        return True
+
+    def startTask(self, name, coro):
+        self.stopTask(name)
+        self.tasks[name] = asyncio.ensure_future(coro)
+
+    def stopTask(self, name):
+        task = self.tasks.pop(name, None)
+        if task is not None:
+            task.cancel()
+
+    async def video(self):
+        """
+        command 26 packets, one access unit each: SPS + PPS + IDR every gop frames, slices otherwise
+        """
+        interval = 1.0 / self.server.videoFrameRate
+        for frame in itertools.count():
+            if frame % self.server.gop == 0:
+                au = _SPS + _PPS + _IDR + _filler(8000, frame)
+            else:
+                au = _SLICE + _filler(1500, frame)
+            self.send(26, b"\x00" * 36 + au)
+            await self.writer.drain()
+            await asyncio.sleep(interval)
+
+    async def audio(self):
+        """
+        command 27 packets with a 440 Hz tone, 960 bytes (60 ms) each
+        """
+        samples = 480
+        period = [int(8000 * math.sin(2 * math.pi * 440 * x / 8000.0)) for x in range(8000)]
+        for block in itertools.count():
+            start = (block * samples) % 8000
+            pcm = struct.pack("<%sh" % samples, *[period[(start + x) % 8000] for x in range(samples)])
+            self.send(27, b"\x00" * 36 + pcm)
+            await self.writer.drain()
+            await asyncio.sleep(samples / 8000.0)
+
+
+class CamSimulator(object):
+    """
+    runs virtual cameras in a background thread
+
+    with CamSimulator() as sim:
+        cams = sim.addCameras(100, latency=(0.01, 0.05))
+        cam = sim.client(cams[0])
+        print(cam.getDevInfo())
+    """
+
+    def __init__(self, host="127.0.0.1", **serverOptions):
+        """
+        :param host: address to listen on
+        :param serverOptions: passed to CameraServer (videoFrameRate, gop, mjpegFrameRate)
+        """
+        self.host = host
+        self.serverOptions = serverOptions
+        self.servers = []
+        self.loop = None
+        self.thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    @property
+    def cameras(self):
+        return [s.camera for s in self.servers]
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.loop.call_soon(ready.set)
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=run, name="CamSimulator")
+        self.thread.daemon = True
+        self.thread.start()
+        ready.wait()
+
+    def run(self, coro):
+        """
+        execute a coroutine in the event loop of the simulator and wait for the result
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def addCamera(self, camera=None, port=0, **kwargs):
+        """
+        :param camera: VirtualCamera, created with kwargs if None
+        :param port: port to listen on, 0 = choose a free one
+        :returns: the VirtualCamera, its address is in camera.host, camera.port
+        """
+        self.start()
+        if camera is None:
+            camera = VirtualCamera(**kwargs)
+        server = CameraServer(camera, **self.serverOptions)
+        self.run(server.start(self.host, port))
+        self.servers.append(server)
+        return camera
+
+    def addCameras(self, count, **kwargs):
+        """
+        create several cameras with the same settings, they differ by name and seed
+        :returns: list of VirtualCamera
+        """
+        first = len(self.servers)
+        return [self.addCamera(name="FosSim%04d" % x, seed=x, **kwargs) for x in range(first, first + count)]
+
+    def client(self, camera, cls=None, **options):
+        """
+        :param options: passed to the interface class, e.g. breaker or retry
+        :returns: interface object (foscontrol.Cam by default) connected to the camera
+        """
+        if cls is None:
+            from foscontrol import Cam as cls
+        return cls("http", camera.host, camera.port, camera.user, camera.password, **options)
+
+    def stop(self):
+        if self.thread is None:
+            return
+
+        async def shutdown():
+            for server in self.servers:
+                await server.close()
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        self.run(shutdown())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.thread = None
+        self.loop = None
+        self.servers = []
+
+
+def main(argv=None):
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="simulate Foscam HD cameras")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="port of the first camera (default: any free port)")
+    parser.add_argument("--cameras", type=int, default=1)
+    parser.add_argument("--user", default="admin")
+    parser.add_argument("--password", default="")
+    parser.add_argument("--latency", type=float, nargs="+", default=[0.0], help="seconds, or min and max")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--page-size", type=int, default=10)
+    parser.add_argument("--reboot-time", type=float, default=5.0)
+    args = parser.parse_args(argv)
+
+    latency = args.latency[0] if len(args.latency) == 1 else tuple(args.latency[:2])
+    with CamSimulator(args.host) as sim:
+        for x in range(args.cameras):
+            camera = VirtualCamera(name="FosSim%04d" % x, seed=x, user=args.user, password=args.password,
+                                   latency=latency, errorRate=args.error_rate, pageSize=args.page_size,
+                                   rebootTime=args.reboot_time)
+            sim.addCamera(camera, port=args.port + x if args.port else 0)
+            print("%s http://%s:%s" % (camera.name, camera.host, camera.port))
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+
+"""
+declarative configuration of many cameras
+
+The desired state is a dict {section: {field: value}} with the raw CGI fields, e.g.
+
+    spec = {
+        "smtp": {"isEnable": True, "server": "mail.example.com", "port": 587, "tls": 1},
+        "systemTime": {"timeSource": 0, "ntpServer": "pool.ntp.org"},
+        "motion": {"isEnable": True, "sensitivity": 2},
+    }
+    sync = ConfigSync(spec, overrides={"gate": {"motion": {"sensitivity": 4}}})
+    report = sync.reconcile({"garden": cam1, "gate": cam2}, dryRun=True)
+    print(formatReport(report))
+
+For each section in the spec the current state is read with the getter of the section.
+The setter is only sent if at least one field differs, with all fields of the section
+(the current values completed by the desired ones), as the cameras expect complete
+parameter sets.  Values are compared as strings, True/False are "1"/"0".
+
+Most cameras return passwords and keys empty or masked.  Such a secret field only counts
+as a difference if the camera returns a readable value, or always with secrets=True
+(the secret is then sent on every reconcile).  It is always sent with its section.
+
+The cameras are processed in parallel (see :func:`fleet.parallel`), the sections of
+one camera one after the other.
+"""
+
+from . import errors
+from .debuglog import REDACTED
+from .fleet import cameraItems, parallel
+
+
+class Section(object):
+    """
+    settings read with one getter and written with one setter
+    """
+
+    def __init__(self, getter, setter, fields, copied=None):
+        """
+        :param fields: fields of the getter and the setter which can be part of a spec
+        :param copied: dict {setter parameter: getter field}, parameters the setter requires
+                       which are copied from the current state and not part of a spec
+        """
+        self.getter = getter
+        self.setter = setter
+        self.fields = tuple(fields)
+        self.copied = copied or {}
+
+
+def _numbered(prefix, count):
+    return ["%s%s" % (prefix, x) for x in range(count)]
+
+
+SECTIONS = {
+    "motion": Section("getMotionDetectConfig", "setMotionDetectConfig",
+                      ["isEnable", "linkage", "snapInterval", "triggerInterval", "sensitivity"]
+                      + _numbered("schedule", 7) + _numbered("area", 10)),
+    "ioAlarm": Section("getIOAlarmConfig", "setIOAlarmConfig",
+                       ["isEnable", "linkage", "alarmLevel", "snapInterval", "triggerInterval"]
+                       + _numbered("schedule", 7)),
+    "alarmRecord": Section("getAlarmRecordConfig", "setAlarmRecordConfig",
+                           ["isEnablePreRecord", "preRecordSecs", "alarmRecordSecs"]),
+    "scheduleSnap": Section("getScheduleSnapConfig", "setScheduleSnapConfig",
+                            ["isEnable", "snapInterval"] + _numbered("schedule", 7)),
+    "snap": Section("getSnapConfig", "setSnapConfig", ["snapPicQuality", "saveLocation"]),
+    "infraLed": Section("getInfraLedConfig", "setInfraLedConfig", ["mode"]),
+    "osd": Section("getOSDSetting", "setOSDSetting", ["isEnableTimeStamp", "isEnableDevName", "dispPos"]),
+    "ptzSpeed": Section("getPTZSpeed", "setPTZSpeed", ["speed"]),
+    "upnp": Section("getUPnPConfig", "setUPnPConfig", ["isEnable"]),
+    "ddns": Section("getDDNSConfig", "setDDNSConfig", ["isEnable", "hostName", "ddnsServer", "user", "password"]),
+    "ftp": Section("getFtpConfig", "setFtpConfig", ["ftpAddr", "ftpPort", "mode", "userName", "password"]),
+    "smtp": Section("getSMTPConfig", "setSMTPConfig",
+                    ["isEnable", "server", "port", "isNeedAuth", "tls", "user", "password", "sender", "reciever"]),
+    # the clock itself is not a desired state, only the way it is set: the setter gets the
+    # time just read from the camera (the getter names the fields differently)
+    "systemTime": Section("getSystemTime", "setSystemTime",
+                          ["timeSource", "ntpServer", "dateFormat", "timeFormat", "timeZone", "isDst", "dst"],
+                          copied={"year": "year", "month": "mon", "day": "day", "hour": "hour",
+                                  "min": "minute", "sec": "sec"}),
+}
+
+# fields whose values are not shown in reports
+SECRET_FIELDS = frozenset(["password", "psk", "key1", "key2", "key3", "key4"])
+
+
+def isReadable(value):
+    """
+    :returns: False for a secret the camera does not reveal (empty or masked)
+    """
+    return bool(value) and value.strip("*") != ""
+
+
+def normalize(value):
+    """ convert a value of the spec into the string the camera returns
+    """
+    if value is True:
+        return "1"
+    if value is False:
+        return "0"
+    return str(value)
+
+
+def mergeSpecs(*specs):
+    """
+    :returns: spec with the sections of all specs, later specs override single fields
+    """
+    res = {}
+    for spec in specs:
+        for section, fields in (spec or {}).items():
+            res.setdefault(section, {}).update(fields)
+    return res
+
+
+class Change(object):
+    """
+    a setter to be sent to a camera
+
+    - section: name of the section
+    - command: setter
+    - diff:    dict {field: (current value, desired value)}
+    - params:  all parameters of the setter
+    - result:  result code of the setter, None if not (yet) sent
+    """
+
+    def __init__(self, section, command, diff, params):
+        self.section = section
+        self.command = command
+        self.diff = diff
+        self.params = params
+        self.result = None
+
+    def lines(self):
+        res = []
+        for field in sorted(self.diff):
+            current, desired = self.diff[field]
+            if field in SECRET_FIELDS:
+                current, desired = REDACTED, REDACTED
+            res.append("%s.%s: %r -> %r" % (self.section, field, current, desired))
+        return res
+
+    def __repr__(self):
+        return "<Change %s %s>" % (self.command, ", ".join(self.lines()))
+
+
+class ConfigSync(object):
+    """
+    brings cameras into a desired state, see module description
+    """
+
+    def __init__(self, spec, overrides=None, workers=8, sections=SECTIONS, secrets=False):
+        """
+        :param spec: desired state of all cameras {section: {field: value}}
+        :param overrides: dict {camera name: spec}, merged into the spec for single cameras
+        :param workers: number of cameras processed at the same time
+        :param sections: available sections, see SECTIONS
+        :param secrets: compare secret fields even if the camera returns them empty or masked
+        :raises: ValueError for unknown sections or fields
+        """
+        self.spec = spec
+        self.overrides = overrides or {}
+        self.workers = workers
+        self.sections = sections
+        self.secrets = secrets
+        for s in [spec] + list(self.overrides.values()):
+            self.validate(s)
+
+    def validate(self, spec):
+        for section, fields in spec.items():
+            if section not in self.sections:
+                raise ValueError("unknown section: %s" % section)
+            unknown = set(fields) - set(self.sections[section].fields)
+            if unknown:
+                raise ValueError("unknown fields in section %s: %s" % (section, ", ".join(sorted(unknown))))
+
+    def specFor(self, name):
+        return mergeSpecs(self.spec, self.overrides.get(name))
+
+    def plan(self, cam, spec):
+        """ read the current state and compare it with the spec
+        :returns: list of :class:`Change`, empty if the camera is in the desired state
+        :raises: :class:`errors.ResultError` if a getter fails
+        """
+        changes = []
+        for name in sorted(spec):
+            section = self.sections[name]
+            current = cam.sendcommand(section.getter)
+            if current.result != 0:
+                raise errors.resultError(section.getter, current.result, current)
+            desired = dict((field, normalize(value)) for field, value in spec[name].items())
+            diff = {}
+            params = []
+            for field in section.fields:
+                value = current.get(field)
+                if field in desired:
+                    compare = self.secrets or field not in SECRET_FIELDS or isReadable(value)
+                    if compare and value != desired[field]:
+                        diff[field] = (value, desired[field])
+                    value = desired[field]
+                if value is not None:
+                    params.append((field, value))
+            for param, field in section.copied.items():
+                if current.get(field) is not None:
+                    params.append((param, current.get(field)))
+            if diff:
+                changes.append(Change(name, section.setter, diff, dict(params)))
+        return changes
+
+    def apply(self, cam, changes):
+        """ send the setters
+        :raises: :class:`errors.ResultError` if a setter fails, the following ones are not sent
+        """
+        for change in changes:
+            res = cam.sendcommand(change.command, change.params)
+            change.result = res.result
+            if res.result != 0:
+                raise errors.resultError(change.command, res.result, res)
+
+    def reconcile(self, cams, dryRun=False):
+        """ bring the cameras into the desired state
+        :param cams: dict {name: camera object} or list of camera objects
+        :param dryRun: only compare, do not send any setter
+        :returns: dict {name: {"changes": list of :class:`Change`, "error": message or None, "dryRun": dryRun}}
+        """
+        changesOf = {}
+
+        def reconcileItem(item):
+            name, cam = item
+            changes = changesOf[name] = self.plan(cam, self.specFor(name))
+            if not dryRun:
+                self.apply(cam, changes)
+            return changes
+
+        report = {}
+        for (name, cam), changes, error in parallel(cameraItems(cams), reconcileItem, self.workers):
+            report[name] = {"changes": changesOf.get(name, []),
+                            "error": None if error is None else "%s: %s" % (type(error).__name__, error),
+                            "dryRun": dryRun}
+        return report
+
+
+def formatReport(report):
+    """
+    :param report: result of :func:`ConfigSync.reconcile`
+    :returns: text, one line per changed field
+    """
+    lines = []
+    for name in sorted(report):
+        entry = report[name]
+        if entry["error"] is not None:
+            lines.append("%s: ERROR %s" % (name, entry["error"]))
+        if not entry["changes"] and entry["error"] is None:
+            lines.append("%s: ok" % name)
+        for change in entry["changes"]:
+            if entry["dryRun"] or change.result is None:
+                state = "would set" if entry["dryRun"] else "not sent"
+            else:
+                state = "set" if change.result == 0 else "failed (%s)" % change.result
+            for line in change.lines():
+                lines.append("%s: %s %s" % (name, state, line))
+    return "\n".join(lines)
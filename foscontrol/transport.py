@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+"""
+HTTP(S) transport with timing of the connection phases
+
+The connection classes measure (in seconds):
+
+- dns:       name resolution
+- connect:   TCP handshake
+- tls:       TLS handshake (https only)
+- firstByte: from sending the request until the response header has been received
+
+The timings are attached to the response as attribute `timings` (dict).
+
+The connections accept a separate connect timeout, the timeout of the request
+(urlopen(..., timeout=x)) applies to the TLS handshake and each read.
+"""
+
+import socket
+
+try:
+    from time import perf_counter as clock
+except ImportError:
+    # Python 2
+    from time import time as clock
+
+try:
+    import http.client as httplib
+    from urllib.request import HTTPHandler, HTTPSHandler, build_opener
+except ImportError:
+    import httplib
+    from urllib2 import HTTPHandler, HTTPSHandler, build_opener
+
+
+def _connectTimed(conn):
+    """
+    replacement for HTTPConnection.connect() which records dns and connect times
+    """
+    start = clock()
+    infos = socket.getaddrinfo(conn.host, conn.port, 0, socket.SOCK_STREAM)
+    resolved = clock()
+    conn.timings["dns"] = resolved - start
+
+    connectTimeout = conn.connectTimeout if conn.connectTimeout is not None else conn.timeout
+    error = None
+    for family, socktype, proto, canonname, address in infos:
+        sock = socket.socket(family, socktype, proto)
+        try:
+            if connectTimeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                sock.settimeout(connectTimeout)
+            if conn.source_address:
+                sock.bind(conn.source_address)
+            sock.connect(address)
+        except socket.error as err:
+            error = err
+            sock.close()
+            continue
+        if conn.timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+            sock.settimeout(conn.timeout)
+        else:
+            sock.settimeout(socket.getdefaulttimeout())
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn.sock = sock
+        conn.timings["connect"] = clock() - resolved
+        return
+    if error is None:
+        error = socket.error("getaddrinfo returns an empty list")
+    raise error
+
+
+class TimedHTTPConnection(httplib.HTTPConnection):
+    def __init__(self, *args, **kwargs):
+        self.connectTimeout = kwargs.pop("connectTimeout", None)
+        httplib.HTTPConnection.__init__(self, *args, **kwargs)
+        self.timings = {}
+        self.requestStart = None
+
+    def connect(self):
+        if getattr(self, "_tunnel_host", None):
+            # proxy tunnel, not worth to be split up
+            start = clock()
+            httplib.HTTPConnection.connect(self)
+            self.timings["connect"] = clock() - start
+        else:
+            _connectTimed(self)
+
+    def putrequest(self, *args, **kwargs):
+        self.requestStart = clock()
+        return httplib.HTTPConnection.putrequest(self, *args, **kwargs)
+
+    def getresponse(self, *args, **kwargs):
+        resp = httplib.HTTPConnection.getresponse(self, *args, **kwargs)
+        if self.requestStart is not None:
+            self.timings["firstByte"] = clock() - self.requestStart
+        return resp
+
+
+class TimedHTTPSConnection(httplib.HTTPSConnection):
+    def __init__(self, *args, **kwargs):
+        self.connectTimeout = kwargs.pop("connectTimeout", None)
+        httplib.HTTPSConnection.__init__(self, *args, **kwargs)
+        self.timings = {}
+        self.requestStart = None
+
+    def connect(self):
+        if getattr(self, "_tunnel_host", None):
+            start = clock()
+            httplib.HTTPSConnection.connect(self)
+            self.timings["connect"] = clock() - start
+            return
+        _connectTimed(self)
+        start = clock()
+        self.sock = self._context.wrap_socket(self.sock, server_hostname=self.host)
+        self.timings["tls"] = clock() - start
+
+    def putrequest(self, *args, **kwargs):
+        self.requestStart = clock()
+        return httplib.HTTPSConnection.putrequest(self, *args, **kwargs)
+
+    def getresponse(self, *args, **kwargs):
+        resp = httplib.HTTPSConnection.getresponse(self, *args, **kwargs)
+        if self.requestStart is not None:
+            self.timings["firstByte"] = clock() - self.requestStart
+        return resp
+
+
+def _timedOpen(handler, connclass, req, **kwargs):
+    """
+    open the request with a timed connection and attach the timings to the response
+    :param kwargs: passed to the constructor of the connection
+    """
+    conns = []
+
+    def factory(host, **kw):
+        conn = connclass(host, **kw)
+        conns.append(conn)
+        return conn
+
+    resp = handler.do_open(factory, req, **kwargs)
+    resp.timings = conns[-1].timings if conns else {}
+    return resp
+
+
+class TimedHTTPHandler(HTTPHandler):
+    def __init__(self, connectTimeout=None):
+        HTTPHandler.__init__(self)
+        self.connectTimeout = connectTimeout
+
+    def http_open(self, req):
+        return _timedOpen(self, TimedHTTPConnection, req, connectTimeout=self.connectTimeout)
+
+
+class TimedHTTPSHandler(HTTPSHandler):
+    def __init__(self, context=None, connectTimeout=None):
+        HTTPSHandler.__init__(self, context=context)
+        self.connectTimeout = connectTimeout
+
+    def https_open(self, req):
+        return _timedOpen(self, TimedHTTPSConnection, req, context=self._context,
+                          connectTimeout=self.connectTimeout)
+
+
+def buildOpener(context=None, connectTimeout=None):
+    """
+    :param context: SSL context for https connections
+    :param connectTimeout: timeout for establishing the TCP connection in seconds,
+                           None = same as the timeout of the request
+    :returns: urllib opener whose responses carry the attribute `timings`
+    """
+    return build_opener(TimedHTTPHandler(connectTimeout=connectTimeout),
+                        TimedHTTPSHandler(context=context, connectTimeout=connectTimeout))
@@ -0,0 +1,401 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    audio handling for the low level protocol
+
+    The camera sends audio in command 27 packets (after command 2 "audio on"):
+
+    int32  command (27)
+    char4  FOSC
+    int32  size
+    char36 header (not decoded yet)
+           audio data, size - 36 bytes
+
+    Format of the audio data: raw, 8000 Hz, signed 16 bit PCM, mono, little endian
+
+    The incoming audio is put into a ring buffer of fixed size (AudioSink).
+    Consumers either read it as a generator of chunks or let a writer
+    (WavWriter, RawWriter) store it, e.g. in a background thread (AudioRecorder).
+    If the consumer is too slow the oldest audio data is overwritten, so the
+    memory used stays constant no matter how long the capture runs.
+
+    Talk data is sent to the camera with command 6 (after command 4 "speaker on"):
+
+    int32  command (6)
+    char4  FOSC
+    int32  size
+    int32  audio data size (size - 4)
+           audio data, max. 960 bytes
+
+    The camera has little to no buffer, so the data has to be sent in real time
+    (TalkPacer).
+"""
+
+from __future__ import print_function
+
+import struct
+import threading
+import time
+import wave
+
+try:
+    from time import monotonic
+except ImportError:
+    # Python 2
+    from time import time as monotonic
+
+
+TALK_CHUNK_SIZE = 960
+
+SAMPLE_RATE = 8000
+SAMPLE_WIDTH = 2
+CHANNELS = 1
+BYTES_PER_SECOND = SAMPLE_RATE * SAMPLE_WIDTH * CHANNELS
+
+FOSC_HEADER_SIZE = 12
+AUDIO_HEADER_SIZE = 36
+
+
+def audioPayload(packet):
+    """
+    extract the PCM data from a command 27 packet
+    :param packet: complete packet including the FOSC header
+    :returns: memoryview of the audio data (no copy)
+    """
+    cmd, magic, size = struct.unpack_from("<I4sI", packet)
+    start = FOSC_HEADER_SIZE + AUDIO_HEADER_SIZE
+    return memoryview(packet)[start:start + size - AUDIO_HEADER_SIZE]
+
+
+class PCMRingBuffer(object):
+    """
+    thread safe ring buffer of fixed size
+
+    If a write does not fit into the buffer, the oldest data is dropped.
+    The number of dropped bytes is counted in `overrun`.
+    """
+
+    def __init__(self, capacity):
+        """
+        :param capacity: size of the buffer in bytes (rounded down to full samples)
+        """
+        capacity -= capacity % SAMPLE_WIDTH
+        if capacity <= 0:
+            raise ValueError("capacity too small")
+        self.capacity = capacity
+        self.buffer = bytearray(capacity)
+        self.start = 0  # position of the oldest byte
+        self.used = 0
+        self.overrun = 0
+        self.closed = False
+        self.cond = threading.Condition()
+
+    def __len__(self):
+        return self.used
+
+    def write(self, data):
+        """
+        append data to the buffer
+        :param data: bytes, bytearray or memoryview
+        """
+        data = memoryview(data)
+        with self.cond:
+            dlen = len(data)
+            if dlen > self.capacity:
+                # only the newest part fits
+                self.overrun += dlen - self.capacity
+                data = data[dlen - self.capacity:]
+                dlen = self.capacity
+            free = self.capacity - self.used
+            if dlen > free:
+                drop = dlen - free
+                self.start = (self.start + drop) % self.capacity
+                self.used -= drop
+                self.overrun += drop
+
+            end = (self.start + self.used) % self.capacity
+            first = min(dlen, self.capacity - end)
+            self.buffer[end:end + first] = data[:first]
+            if first < dlen:
+                self.buffer[:dlen - first] = data[first:]
+            self.used += dlen
+            self.cond.notify_all()
+
+    def read(self, maxsize, timeout=None):
+        """
+        remove data from the buffer
+        :param maxsize: max. number of bytes to return
+        :param timeout: seconds to wait for data, None = wait until data arrives or the buffer is closed
+        :returns: bytes, empty if the timeout expired or the buffer has been closed and is empty
+        """
+        with self.cond:
+            deadline = None if timeout is None else monotonic() + timeout
+            # a single byte is no sample yet, wait for the rest of it
+            while self.used < SAMPLE_WIDTH and not self.closed:
+                remaining = None if deadline is None else deadline - monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+            count = min(maxsize, self.used)
+            count -= count % SAMPLE_WIDTH
+            if count == 0 and self.closed:
+                # no complete sample will follow
+                count = self.used
+            first = min(count, self.capacity - self.start)
+            res = bytes(self.buffer[self.start:self.start + first])
+            if first < count:
+                res += bytes(self.buffer[:count - first])
+            self.start = (self.start + count) % self.capacity
+            self.used -= count
+            return res
+
+    def close(self):
+        """
+        signal readers that no more data will be written
+        """
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+class AudioSink(object):
+    """
+    receiver for the audio data of command 27 packets
+    """
+
+    def __init__(self, seconds=10):
+        """
+        :param seconds: size of the ring buffer in seconds of audio
+        """
+        self.ring = PCMRingBuffer(int(seconds * BYTES_PER_SECOND))
+        self.packets = 0
+        self.received = 0
+
+    def feedPacket(self, packet):
+        """
+        put the audio content of a complete command 27 packet into the buffer
+        """
+        self.feed(audioPayload(packet))
+
+    def feed(self, pcm):
+        """
+        put raw PCM data into the buffer
+        """
+        self.packets += 1
+        self.received += len(pcm)
+        self.ring.write(pcm)
+
+    def overrun(self):
+        """
+        :returns: number of bytes lost because the consumer was too slow
+        """
+        return self.ring.overrun
+
+    def chunks(self, size=BYTES_PER_SECOND // 10, timeout=None):
+        """
+        generator for live consumers
+        :param size: max. size of the chunks in bytes
+        :param timeout: stop if no data arrived within this number of seconds, None = wait until closed
+        :returns: chunks of PCM data
+        """
+        while True:
+            data = self.ring.read(size, timeout)
+            if not data:
+                return
+            yield data
+
+    def record(self, writer, timeout=None):
+        """
+        write the incoming audio into a writer until the sink is closed
+        :param writer: object with write(pcm) and close() methods, e.g. WavWriter or RawWriter
+        :param timeout: see chunks()
+        """
+        try:
+            for data in self.chunks(timeout=timeout):
+                writer.write(data)
+        finally:
+            writer.close()
+
+    def close(self):
+        """
+        end of input, consumers will stop after reading the remaining data
+        """
+        self.ring.close()
+
+
+class RawWriter(object):
+    """
+    stores the PCM data as is
+    """
+
+    def __init__(self, target):
+        """
+        :param target: filename or binary file object
+        """
+        if hasattr(target, "write"):
+            self.fh = target
+            self.ownfile = False
+        else:
+            self.fh = open(target, "wb")
+            self.ownfile = True
+
+    def write(self, pcm):
+        self.fh.write(pcm)
+
+    def close(self):
+        if self.ownfile:
+            self.fh.close()
+        else:
+            self.fh.flush()
+
+
+class WavWriter(object):
+    """
+    stores the PCM data as WAV file
+
+    The data is written as it arrives, the header is updated when the file is closed.
+    """
+
+    def __init__(self, target):
+        """
+        :param target: filename or seekable binary file object
+        """
+        self.wav = wave.open(target, "wb")
+        self.wav.setnchannels(CHANNELS)
+        self.wav.setsampwidth(SAMPLE_WIDTH)
+        self.wav.setframerate(SAMPLE_RATE)
+
+    def write(self, pcm):
+        self.wav.writeframesraw(pcm)
+
+    def close(self):
+        self.wav.close()
+
+
+class AudioRecorder(threading.Thread):
+    """
+    background thread storing the content of an AudioSink with a writer
+    """
+
+    def __init__(self, sink, writer):
+        super(AudioRecorder, self).__init__()
+        self.daemon = True
+        self.sink = sink
+        self.writer = writer
+
+    def run(self):
+        self.sink.record(self.writer)
+
+    def stop(self):
+        """
+        close the sink and wait until the remaining data has been written
+        """
+        self.sink.close()
+        self.join()
+
+
+def pcmChunks(source, chunksize=TALK_CHUNK_SIZE):
+    """
+    split PCM data into chunks
+    :param source: bytes/bytearray/memoryview, a binary file object, or an iterable (e.g. generator) of byte strings
+    :param chunksize: size of the chunks in bytes
+    :returns: generator of chunks, all except the last one have the size chunksize
+
+    Buffers are sliced as memoryview (no copy), files are read chunk by chunk,
+    so even long files are never loaded completely.
+    """
+    chunksize -= chunksize % SAMPLE_WIDTH
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        data = memoryview(source)
+        for start in range(0, len(data), chunksize):
+            yield data[start:start + chunksize]
+        return
+
+    if hasattr(source, "read"):
+        while True:
+            data = source.read(chunksize)
+            if not data:
+                return
+            # pipes and sockets may return less, fill the chunk until the end of the file
+            while len(data) < chunksize:
+                more = source.read(chunksize - len(data))
+                if not more:
+                    break
+                data += more
+            yield memoryview(data)
+
+    # iterable of blocks with arbitrary sizes
+    pending = bytearray()
+    for block in source:
+        pending += block
+        if len(pending) >= chunksize:
+            data = memoryview(bytes(pending))
+            full = len(data) - len(data) % chunksize
+            for start in range(0, full, chunksize):
+                yield data[start:start + chunksize]
+            del pending[:full]
+    if pending:
+        yield memoryview(bytes(pending))
+
+
+class TalkPacer(object):
+    """
+    send audio chunks with the speed they are played back
+
+    The pacer stays `jitter` seconds ahead of real time, i.e. the first `jitter`
+    seconds are sent at once and fill the buffer of the camera, every following
+    chunk is sent when the camera is about to play its predecessor.
+    The schedule is based on the monotonic clock, so the delays of the
+    individual sends do not add up.
+
+    If the source does not deliver fast enough (underrun), the schedule
+    restarts with the next chunk.
+    """
+
+    def __init__(self, send, jitter=0.1, clock=monotonic, sleep=time.sleep):
+        """
+        :param send: function called with each chunk (memoryview)
+        :param jitter: seconds of audio sent ahead of real time
+        :param clock: clock function returning seconds
+        :param sleep: sleep function
+        """
+        self.send = send
+        self.jitter = jitter
+        self.clock = clock
+        self.sleep = sleep
+        self.stopflag = False
+        self.sent = 0
+        self.underruns = 0
+
+    def run(self, source, chunksize=TALK_CHUNK_SIZE):
+        """
+        send the PCM data of a source, returns after the source is exhausted or stop() has been called
+        :param source: see pcmChunks()
+        :param chunksize: bytes per chunk
+        :returns: number of bytes sent
+        """
+        self.stopflag = False
+        start = self.clock()
+        position = 0.0  # seconds of audio sent since start
+        for chunk in pcmChunks(source, chunksize):
+            if self.stopflag:
+                break
+            now = self.clock()
+            if position > 0 and now > start + position:
+                # the camera has run out of data, restart the schedule
+                self.underruns += 1
+                start = now - position
+            due = start + position - self.jitter
+            if due > now:
+                self.sleep(due - now)
+            self.send(chunk)
+            self.sent += len(chunk)
+            position += float(len(chunk)) / BYTES_PER_SECOND
+        return self.sent
+
+    def stop(self):
+        """
+        stop sending, can be called from another thread
+        """
+        self.stopflag = True
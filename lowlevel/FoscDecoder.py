@@ -4,58 +4,116 @@
 from __future__ import print_function
 
 import struct
+import sys
 
+try:
+    from . import FoscAudio
+except (ImportError, ValueError):
+    # started as a script from this directory
+    import FoscAudio
 
-def printhex(data, info="", highlight=None):
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+HL_ON = '\033[43m'
+HL_OFF = '\033[0m'
+
+# translation table for the ASCII column: non printable chars are shown as '.'
+_ASCII_TABLE = bytes(bytearray(c if 32 <= c < 128 else ord('.') for c in range(256)))
+
+
+def hexdump(data, info="", highlight=None):
     """
-    output string as hex and ASCII dump
+    create hex and ASCII dump of a string
     :param data: binary data
     :param info: info string to print in header
-    :param highlight: if position (starting with 0) is in this array, print highlight
-    """
-    HL_ON = '\033[43m'
-    HL_OFF = '\033[0m'
-
-    if type(highlight) != list:
-        highlight = []
+    :param highlight: iterable with positions (starting with 0) to highlight
+    :returns: the dump as string, one line per 16 bytes, each line terminated by a newline
 
-    start = 0
+    The whole buffer is converted with a single hex and translate call,
+    the lines are cut out of the results afterwards.
+    """
+    data = toBytes(data)
     dlen = len(data)
     if info != "":
         info += " - "
-    print("%slength: %s" % (info, dlen))
-    while start < dlen:
-        sub = data[start:start + 16]
-        slen = len(sub)
+    lines = ["%slength: %s" % (info, dlen)]
+
+    # every byte occupies 3 chars: "01 02 ..."
+    spaced = spacedHex(data)
+    ascii = data.translate(_ASCII_TABLE).decode("ascii")
+
+    marks = highlightRanges(highlight, dlen)
+
+    for start in range(0, dlen, 16):
+        slen = min(16, dlen - start)
+        xc = spaced[start * 3:start * 3 + slen * 3 - 1]
+        row = marks.get(start)
+        if row is not None:
+            # insert escape sequences from right to left, so that the positions stay valid
+            for first, last in reversed(row):
+                xc = "%s%s%s%s%s" % (xc[:first * 3], HL_ON, xc[first * 3:last * 3 + 2], HL_OFF, xc[last * 3 + 2:])
+        padding = ((16 - slen) * 3) * " "
+        lines.append("%04x: %s%s  %s" % (start, xc, padding, ascii[start:start + slen]))
 
-        if not highlight:
-            xc = " ".join([c.encode("hex") for c in sub])
-        else:
-            pos = 0
-            w = []
-            ison = False
-            for c in sub:
-                st = ""
-                hx = c.encode("hex")
-                if (start + pos) in highlight:
-                    if not ison:
-                        st += HL_ON
-                        ison = True
-                    st += hx
-                    if (pos == 15) or not (start + 1 + pos) in highlight:
-                        st += HL_OFF
-                        ison = False
-                    w.append(st)
-                else:
-                    w.append(hx)
-                pos += 1
-            xc = " ".join(w)
+    lines.append("")
+    return "\n".join(lines)
 
-        padding = ((16 - slen) * 3) * " "
-        cs = "".join(c if (ord(c) >= 32) and (ord(c) < 128) else '.' for c in sub)
-        print("%04x: %s%s  %s" % (start, xc, padding, cs))
 
-        start += 16
+_HEX_BYTES = ["%02x" % c for c in range(256)]
+
+
+def spacedHex(data):
+    """
+    :param data: bytes
+    :returns: hex representation with a blank between the bytes
+    """
+    try:
+        return data.hex(" ")
+    except (AttributeError, TypeError):
+        # Python < 3.8
+        return " ".join([_HEX_BYTES[c] for c in bytearray(data)])
+
+
+def highlightRanges(highlight, dlen):
+    """
+    convert positions to highlight into ranges per output line
+    :param highlight: iterable with positions, or None
+    :param dlen: length of the data
+    :returns: dict {line offset: [(first, last), ...]} with first and last position relative to the line
+    """
+    marks = {}
+    if highlight is None:
+        return marks
+
+    positions = sorted(set(p for p in highlight if 0 <= p < dlen))
+    runstart = None
+    prev = None
+    for p in positions + [None]:
+        if p is not None and prev is not None and p == prev + 1 and p % 16 != 0:
+            prev = p
+            continue
+        if runstart is not None:
+            line = runstart - runstart % 16
+            marks.setdefault(line, []).append((runstart - line, prev - line))
+        runstart = prev = p
+    return marks
+
+
+def printhex(data, info="", highlight=None, out=None):
+    """
+    output string as hex and ASCII dump
+    :param data: binary data
+    :param info: info string to print in header
+    :param highlight: if position (starting with 0) is in this array, print highlight
+    :param out: text stream to write to (default: sys.stdout)
+    """
+    if out is None:
+        out = sys.stdout
+    out.write(hexdump(data, info, highlight))
 
 
 class DataCompare(object):
@@ -67,29 +125,118 @@ class DataCompare(object):
     dc.put( datablock2 )
     dc.put( datablock3 )
     dc.stats()
+
+    Besides the offsets returned by put() the object keeps per offset statistics
+    over all blocks with the same length as the first one:
+
+    - basechanges[x]: number of blocks in which byte x differs from the first block
+    - prevchanges[x]: number of blocks in which byte x differs from the previous block
+
+    A byte that changes in (nearly) every block is most likely a counter or timestamp,
+    a byte that never changes is a constant.
     """
 
     def __init__(self):
         self.basedata = None
+        self.prevdata = None
         self.allequal = True
         self.count = 0
+        self.mismatches = 0
+        self.basechanges = None
+        self.prevchanges = None
+        self.vectorized = False  # numpy arrays instead of loops, for large blocks
+        self.basearray = None
+        self.prevarray = None
 
     def put(self, data):
+        """
+        compare data block with the first block
+        :param data: binary data
+        :returns: list of differing offsets, or -1 if the block length differs from the first block
+        """
         self.count += 1
+        data = toBytes(data)
         if self.basedata is None:
             self.basedata = data
+            self.prevdata = data
+            self.vectorized = numpy is not None and len(data) >= VECTORIZE_LENGTH
+            if self.vectorized:
+                self.basearray = self.prevarray = asArray(data)
+                self.basechanges = numpy.zeros(len(data), dtype=numpy.uint32)
+                self.prevchanges = numpy.zeros(len(data), dtype=numpy.uint32)
+            else:
+                self.basechanges = [0] * len(data)
+                self.prevchanges = [0] * len(data)
             return []
         if len(self.basedata) != len(data):
             self.allequal = False
+            self.mismatches += 1
             return -1
+        if self.vectorized:
+            return self.putArray(data)
+
+        # one loop over the bytes for the offsets and both counters
+        prev, base = self.prevdata, self.basedata
+        self.prevdata = data
+        basechanges, prevchanges = self.basechanges, self.prevchanges
+        diff = []
+        if base == data:
+            if prev != data:
+                for x in range(len(data)):
+                    if data[x] != prev[x]:
+                        prevchanges[x] += 1
+            return diff
+        self.allequal = False
+        if prev == base:
+            for x in range(len(data)):
+                if data[x] != base[x]:
+                    diff.append(x)
+                    basechanges[x] += 1
+                    prevchanges[x] += 1
+        else:
+            for x in range(len(data)):
+                c = data[x]
+                if c != base[x]:
+                    diff.append(x)
+                    basechanges[x] += 1
+                if c != prev[x]:
+                    prevchanges[x] += 1
+        return diff
+
+    def putArray(self, data):
+        """
+        put() with numpy: the counters are incremented by the comparison arrays,
+        the offsets are only determined for the result
+        """
+        array = asArray(data)
+        if self.prevdata != data:
+            self.prevchanges += array != self.prevarray
+        self.prevdata = data
+        self.prevarray = array
+
         if self.basedata == data:
             return []
         self.allequal = False
-        diff = []
-        for x in range(len(data)):
-            if data[x] != self.basedata[x]:
-                diff.append(x)
-        return diff
+        changed = array != self.basearray
+        self.basechanges += changed
+        return numpy.flatnonzero(changed).tolist()
+
+    def variability(self):
+        """
+        :returns: list of (offset, number of changes from previous block) for all offsets that ever changed
+        """
+        if self.prevchanges is None:
+            return []
+        return [(x, int(self.prevchanges[x])) for x in nonZeroOffsets(self.prevchanges)]
+
+    def constants(self):
+        """
+        :returns: list of offsets whose content never changed
+        """
+        if self.prevchanges is None:
+            return []
+        changed = set(nonZeroOffsets(self.prevchanges))
+        return [x for x in range(len(self.basedata)) if x not in changed]
 
     def stats(self):
         if self.count > 0:
@@ -97,6 +244,47 @@ class DataCompare(object):
             if self.basedata is not None:
                 if self.allequal:
                     print("*** All data blocks were identical")
+                else:
+                    if self.mismatches > 0:
+                        print("Blocks with different length (ignored): {}".format(self.mismatches))
+                    compared = self.count - self.mismatches - 1
+                    print("Changes per offset (compared to previous block, {} blocks):".format(compared))
+                    for x, cnt in self.variability():
+                        kind = "counter?" if cnt == compared else ""
+                        print("%04x: %s %s" % (x, cnt, kind))
+
+
+def toBytes(data):
+    """
+    convert data to a byte string
+    :param data: str (Python 2), bytes, bytearray or memoryview
+    :returns: bytes
+    .. note:: Python 3 strings are converted using latin-1, i.e. each char becomes one byte
+    """
+    if isinstance(data, bytes):
+        return data
+    if isinstance(data, (bytearray, memoryview)):
+        return bytes(data)
+    return data.encode("latin-1")
+
+
+# blocks from this length on are compared with numpy (if available),
+# below the overhead of the numpy calls is larger than a loop
+VECTORIZE_LENGTH = 256
+
+
+def asArray(data):
+    return numpy.frombuffer(data, dtype=numpy.uint8)
+
+
+def nonZeroOffsets(counter):
+    """
+    :param counter: list or numpy array
+    :returns: offsets of all non zero counters
+    """
+    if isinstance(counter, list):
+        return [x for x, cnt in enumerate(counter) if cnt]
+    return numpy.flatnonzero(counter).tolist()
 
 
 # The following functions test a value and raise a ValueError
@@ -400,6 +588,29 @@ class FossCmd21(FossCmdDecode):
         cmd, magic, size, rdata = struct.unpack("<I4sI36s", data)
 
 
+class FossCmd26(FossCmdDecode):
+    """
+    int32 command
+    char4 FOSC
+    int32 size
+    res36 header
+          H.264 data
+
+    The video data is handed to the sink (see FoscVideo.VideoDemuxer), if one is set.
+    """
+
+    def __init__(self):
+        super(FossCmd26, self).__init__(26, "video in")
+        self.sink = None
+
+    def decode(self, data):
+        cmd, magic, size = unpack("<I4sI", data)
+        if len(data) < 12 + size:
+            raise ValueError("video packet truncated")
+        if self.sink is not None:
+            self.sink.feedPacket(data)
+
+
 class FossCmd27(FossCmdDecode):
     """
     int32 command
@@ -409,23 +620,19 @@ class FossCmd27(FossCmdDecode):
     char24 audiohd2
     char1914 audiodata
 
+    The audio data is handed to the sink (see FoscAudio.AudioSink), if one is set.
     """
 
     def __init__(self):
         super(FossCmd27, self).__init__(27, "audio in")
+        self.sink = None
 
     def decode(self, data):
-        cmd, magic, size, hd1, hd2, audiopart = unpack("<I4sI12s24s32s", data)
-        printhex(hd1, "audio-in hd1")
-        printhex(hd2, "audio-in hd2")
-        asize = size - 36
-        print("asize: {}".format(asize))
-
-        if audiodump is not None:
-            audiodump.write(data[48:48 + asize])
-        if len(data) > 48 + asize:
-            print("MORE")
-            printhex(data[48 + asize:])
+        cmd, magic, size = unpack("<I4sI", data)
+        if len(data) < 12 + size:
+            raise ValueError("audio packet truncated")
+        if self.sink is not None:
+            self.sink.feedPacket(data)
 
 
 class FossCmd29(FossCmdDecode):
@@ -649,20 +856,47 @@ class FossCmd113(FossCmdDecode):
         print("Stream: %s" % stream)
 
 
-audiodump = None
+audiorecorder = None
+
+
+def setVideoSink(sink):
+    """
+    route the video data of command 26 packets into a sink
+    :param sink: FoscVideo.VideoDemuxer or None
+    """
+    decoder_cmd26.sink = sink
+
+
+def setAudioSink(sink):
+    """
+    route the audio data of command 27 packets into a sink
+    :param sink: FoscAudio.AudioSink or None
+    """
+    decoder_cmd27.sink = sink
 
 
 def openAudioDumpFile(fnm):
-    global audiodump
-    audiodump = open(fnm, "wb")
+    """
+    dump incoming audio into a raw file (8000 Hz, signed 16 bit, mono)
+    """
+    global audiorecorder
+    closeAudioDumpFile()
+    sink = FoscAudio.AudioSink()
+    audiorecorder = FoscAudio.AudioRecorder(sink, FoscAudio.RawWriter(fnm))
+    audiorecorder.start()
+    setAudioSink(sink)
 
 
 def closeAudioDumpFile():
-    global audiodump
-    if audiodump is not None:
-        audiodump.close()
-    audiodump = None
+    global audiorecorder
+    if audiorecorder is not None:
+        setAudioSink(None)
+        audiorecorder.stop()
+    audiorecorder = None
+
 
+decoder_cmd26 = FossCmd26()
+decoder_cmd27 = FossCmd27()
 
 decoder_list = [
     FossCmd0(),
@@ -672,7 +906,8 @@ decoder_list = [
     FossCmd12(),
     FossCmd15(),
     FossCmd21(),
-    FossCmd27(),
+    decoder_cmd26,
+    decoder_cmd27,
     FossCmd29(),
     FossCmd100(),
     FossCmd106(),
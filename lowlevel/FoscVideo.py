@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    video handling for the low level protocol
+
+    After command 0 "video on" the camera sends the selected stream in command 26 packets:
+
+    int32  command (26)
+    char4  FOSC
+    int32  size
+    res36  header (not decoded yet)
+           H.264 data, Annex B byte stream (NAL units separated by start codes)
+
+    The header has not been decoded yet.  It is assumed to have the same size as
+    the header of the audio packets (command 27), see VIDEO_HEADER_SIZE.
+    The demuxer does not rely on the packet boundaries: the payloads are joined
+    and split at the start codes again, so a NAL unit may span several packets
+    and a packet may contain several NAL units.
+"""
+
+from __future__ import print_function
+
+import struct
+from collections import namedtuple
+
+
+FOSC_HEADER_SIZE = 12
+VIDEO_HEADER_SIZE = 36
+
+START_CODE = b"\x00\x00\x01"
+
+# NAL unit types
+NAL_SLICE = 1
+NAL_IDR = 5
+NAL_SEI = 6
+NAL_SPS = 7
+NAL_PPS = 8
+NAL_AUD = 9
+
+# NAL unit types which start a new access unit if they follow a slice (H.264, 7.4.1.2.3)
+_AU_START_TYPES = frozenset([NAL_SEI, NAL_SPS, NAL_PPS, NAL_AUD, 14, 15, 16, 17, 18])
+
+AccessUnit = namedtuple("AccessUnit", "data keyframe naltypes")
+"""
+one picture with all its NAL units
+:param data: Annex B data of the NAL units, including the start codes
+:param keyframe: True, if the access unit contains an IDR slice
+:param naltypes: list with the types of the contained NAL units
+"""
+
+
+def videoPayload(packet, headersize=VIDEO_HEADER_SIZE):
+    """
+    extract the H.264 data from a command 26 packet
+    :param packet: complete packet including the FOSC header
+    :returns: memoryview of the video data (no copy)
+    """
+    cmd, magic, size = struct.unpack_from("<I4sI", packet)
+    return memoryview(packet)[FOSC_HEADER_SIZE + headersize:FOSC_HEADER_SIZE + size]
+
+
+class VideoDemuxer(object):
+    """
+    reassemble access units from command 26 packets
+
+    demux = VideoDemuxer()
+    for packet in packets:
+        for au in demux.feedPacket(packet):
+            ...
+    rest = demux.flush()
+
+    The payloads are collected in one buffer. Completed access units are cut out of
+    it, the consumed part of the buffer is released from time to time, not after
+    every access unit.
+    """
+
+    def __init__(self, callback=None, headersize=VIDEO_HEADER_SIZE):
+        """
+        :param callback: function called with each completed AccessUnit (optional)
+        :param headersize: size of the header after the FOSC header
+        """
+        self.callback = callback
+        self.headersize = headersize
+        self.buffer = bytearray()
+        self.scanpos = 0  # position to continue the search for start codes
+        self.nalstart = None  # start of the NAL unit in progress (position of its start code)
+        self.austart = None  # start of the access unit in progress
+        self.autypes = []
+        self.auvcl = False  # access unit in progress contains a slice
+        self.packets = 0
+        self.units = 0
+        self.keyframes = 0
+        self.discarded = 0  # bytes before the first start code
+
+    def feedPacket(self, packet):
+        """
+        process a complete command 26 packet
+        :returns: list of completed access units
+        """
+        self.packets += 1
+        return self.feed(videoPayload(packet, self.headersize))
+
+    def feed(self, data):
+        """
+        process H.264 data (Annex B)
+        :returns: list of completed access units
+        """
+        buf = self.buffer
+        buf += data
+        completed = []
+
+        while True:
+            pos = buf.find(START_CODE, self.scanpos)
+            if pos == -1:
+                if self.nalstart is None and len(buf) > 3:
+                    # no start code yet: keep only the bytes which may begin one
+                    drop = len(buf) - 3
+                    self.discarded += drop
+                    del buf[:drop]
+                    self.scanpos = 0
+                    break
+                # a start code might be split between this and the next payload
+                self.scanpos = max(self.scanpos, len(buf) - 2)
+                break
+            self.scanpos = pos + 3
+            if pos > 0 and buf[pos - 1] == 0:
+                pos -= 1  # 4 byte start code
+
+            if self.nalstart is None:
+                # first start code, drop everything before
+                self.discarded += pos
+                del buf[:pos]
+                self.scanpos -= pos
+                self.nalstart = 0
+                self.austart = 0
+                continue
+
+            self.endNal(self.nalstart, pos, completed)
+            self.nalstart = pos
+
+        # release the consumed part of the buffer
+        if self.austart is not None and self.austart > 0 and self.austart * 2 >= len(buf):
+            cut = self.austart
+            del buf[:cut]
+            self.scanpos -= cut
+            self.nalstart -= cut
+            self.austart = 0
+
+        return completed
+
+    def endNal(self, start, end, completed):
+        """
+        a NAL unit is complete, check whether it starts a new access unit
+        """
+        buf = self.buffer
+        hdr = start + 3 if buf[start + 2] == 1 else start + 4
+        if hdr >= end:
+            return  # empty NAL unit
+        naltype = buf[hdr] & 0x1f
+
+        if self.auvcl:
+            if naltype in _AU_START_TYPES:
+                newau = True
+            elif naltype in (NAL_SLICE, NAL_IDR):
+                # first_mb_in_slice == 0 (ue(v) coded: first bit set) starts a new picture
+                newau = hdr + 1 < end and (buf[hdr + 1] & 0x80) != 0
+            else:
+                newau = False
+            if newau:
+                completed.append(self.emit(start))
+
+        self.autypes.append(naltype)
+        if naltype in (NAL_SLICE, NAL_IDR):
+            self.auvcl = True
+
+    def emit(self, end):
+        """
+        cut the access unit in progress out of the buffer
+        """
+        au = AccessUnit(bytes(self.buffer[self.austart:end]), NAL_IDR in self.autypes, self.autypes)
+        self.austart = end
+        self.autypes = []
+        self.auvcl = False
+        self.units += 1
+        if au.keyframe:
+            self.keyframes += 1
+        if self.callback is not None:
+            self.callback(au)
+        return au
+
+    def flush(self):
+        """
+        end of stream, complete the access unit in progress
+        :returns: list of completed access units
+        """
+        completed = []
+        if self.nalstart is None:
+            return completed
+        end = len(self.buffer)
+        self.endNal(self.nalstart, end, completed)
+        if self.autypes:
+            completed.append(self.emit(end))
+        del self.buffer[:]
+        self.scanpos = 0
+        self.nalstart = self.austart = None
+        return completed
+
+
+def demux(packets, headersize=VIDEO_HEADER_SIZE):
+    """
+    generator for access units
+    :param packets: iterable with complete command 26 packets
+    :returns: AccessUnit objects
+    """
+    demuxer = VideoDemuxer(headersize=headersize)
+    for packet in packets:
+        for au in demuxer.feedPacket(packet):
+            yield au
+    for au in demuxer.flush():
+        yield au
+
+
+class AnnexBWriter(object):
+    """
+    write access units as H.264 elementary stream (Annex B), e.g. for ffmpeg or vlc
+
+    writer = AnnexBWriter("/tmp/video.h264")
+    demuxer = VideoDemuxer(callback=writer.write)
+    """
+
+    def __init__(self, target, waitkeyframe=True):
+        """
+        :param target: filename or binary file object
+        :param waitkeyframe: skip access units until the first keyframe
+        """
+        if hasattr(target, "write"):
+            self.fh = target
+            self.ownfile = False
+        else:
+            self.fh = open(target, "wb")
+            self.ownfile = True
+        self.started = not waitkeyframe
+        self.written = 0
+
+    def write(self, au):
+        if not self.started:
+            if not au.keyframe:
+                return
+            self.started = True
+        self.fh.write(au.data)
+        self.written += 1
+
+    def close(self):
+        if self.ownfile:
+            self.fh.close()
+        else:
+            self.fh.flush()
@@ -398,10 +398,8 @@ if __name__ == '__main__':
             print("reading from: {}".format(playfile))
 
     # open a file for the content of packet 27
-    if audiodumpfilename is None:
-        audiodump = None
-    else:
-        audiodump = open(audiodumpfilename, "wb")
+    if audiodumpfilename is not None:
+        FoscDecoder.openAudioDumpFile(audiodumpfilename)
 
     if live:
         # note: live_source usually needs root permissions
@@ -419,5 +417,4 @@ if __name__ == '__main__':
 
     FoscDecoder.datacomp.stats()
 
-    if audiodump is not None:
-        audiodump.close()
+    FoscDecoder.closeAudioDumpFile()
@@ -9,7 +9,9 @@ import sys
 import time
 from threading import Thread
 
+import FoscAudio
 import FoscDecoder
+import FoscVideo
 
 sys.path.append("..")  # only for pyFosControl in parent directory
 import pyFosControl
@@ -38,6 +40,8 @@ class ReadThread(Thread):
         self.resync_count = 0
         self.read_sequence = []
         self.decodeerror = []
+        # receivers for media packets, see CamHandler.start_audio_capture/start_video_capture
+        self.media_sinks = {}
 
     def run(self):
         # Mode:
@@ -46,7 +50,7 @@ class ReadThread(Thread):
         # 2: try to resync
         mode = 0
         remaining = 0
-        body = ""
+        parts = []
 
         while not self.endflag:
             try:
@@ -64,18 +68,21 @@ class ReadThread(Thread):
                         mode = 2
                         self.resync_count += 1
                     else:
-                        self.read_sequence.append(cmd)
-                        body = ""
+                        if cmd not in self.media_sinks:
+                            self.read_sequence.append(cmd)
+                        parts = []
                         remaining = size
                         mode = 1
                 elif mode == 1:
                     incoming = self.socket.recv(remaining)
-                    body += incoming
+                    # join the parts once the packet is complete (video packets arrive in many parts)
+                    parts.append(incoming)
                     remaining -= len(incoming)
-                    print("remaining {}".format( remaining))
+                    if cmd not in self.media_sinks:
+                        print("remaining {}".format(remaining))
                     if remaining == 0:
                         mode = 0
-                        self.proc(cmd, size, body)
+                        self.proc(cmd, size, "".join(parts))
                 else:
                     data = self.socket.recv(2000)  # clear incoming buffer
                     if len(data) == 0:
@@ -99,6 +106,15 @@ class ReadThread(Thread):
         """ try to use decoder subroutines
         """
 
+        sink = self.media_sinks.get(cmd)
+        if sink is not None:
+            # no output per packet, media data arrives several times per second
+            try:
+                sink.feedPacket(struct.pack("<I4sI", cmd, "FOSC", size) + body)
+            except Exception as e:
+                self.decodeerror.append("cmd %s: %s" % (cmd, e))
+            return
+
         print("Incoming cmd: %s, size %s" % (cmd, size))
 
         # Let's check all
@@ -108,7 +124,7 @@ class ReadThread(Thread):
                 FoscDecoder.printhex(body)
             else:
                 decoder(struct.pack("<I4sI", cmd, "FOSC", size) + body)
-        except BaseException as e:
+        except Exception as e:
             msg = "cmd %s: %s" % (cmd, e.message)
             self.decodeerror.append(msg)
             print("** DECODE ERROR: {}".format(msg))
@@ -168,6 +184,8 @@ class CamHandler(TCPHandler):
     """ class to send commands to the cam
     """
 
+    talk_pacer = None
+
     def send_command(self, command, data, verbose=True):
         dt = struct.pack("<I4sI", command, "FOSC", len(data)) + data
         print("%s: Sending data" % self.name)
@@ -260,31 +278,87 @@ class CamHandler(TCPHandler):
         data = struct.pack("<64s64s32x", name, password)
         self.send_command(5, data)
 
-    def send_cmd6(self, audiodata, chunksize):
+    def start_audio_capture(self, name, password, sink=None):
+        """ switch audio from the camera on and collect it in a sink
+
+        :param sink: FoscAudio.AudioSink, None = create one with the default buffer size
+        :returns: the sink, use sink.chunks() or sink.record(writer) to consume the audio
+        """
+        if sink is None:
+            sink = FoscAudio.AudioSink()
+        self.reader.media_sinks[27] = sink
+        self.send_cmd2(name, password)
+        return sink
+
+    def start_video_capture(self, name, password, uid, demuxer=None):
+        """ switch video on and reassemble the H.264 stream
+
+        :param demuxer: FoscVideo.VideoDemuxer, None = create one
+        :returns: the demuxer, e.g. VideoDemuxer(callback=FoscVideo.AnnexBWriter("video.h264").write)
+        """
+        if demuxer is None:
+            demuxer = FoscVideo.VideoDemuxer()
+        self.reader.media_sinks[26] = demuxer
+        self.send_cmd0(name, password, uid)
+        return demuxer
+
+    def stop_video_capture(self):
+        """ stop collecting video data
+        :returns: the demuxer, if one was active
+        .. note:: there is no "video off" command yet, the camera keeps sending until the connection is closed
+        """
+        demuxer = self.reader.media_sinks.pop(26, None)
+        if demuxer is not None:
+            demuxer.flush()
+        return demuxer
+
+    def stop_audio_capture(self, name, password):
+        """ switch audio from the camera off and close the sink
+        """
+        self.send_cmd3(name, password)
+        sink = self.reader.media_sinks.pop(27, None)
+        if sink is not None:
+            sink.close()
+
+    def send_cmd6(self, audiodata, chunksize=FoscAudio.TALK_CHUNK_SIZE, jitter=0.1):
         """
         int32  command
         char4  FOSC
         int32  size
         int32  audiodatasize = size-4
                audiodata
+
+        :param audiodata: PCM source: buffer, file object or generator (see FoscAudio.pcmChunks)
+        :param chunksize: bytes per packet (max. 960)
+        :param jitter: seconds of audio sent ahead of real time
+        :returns: number of bytes sent
+
+        The data is sent in real time, i.e. the call blocks until the source
+        is exhausted or stop_talk() is called from another thread.
+        The audio format is presumed to be the same as in command 27.
         """
 
         print("Sending audio data to cam")
 
-        # not working correctly!!
-
-        seg = 0
-        alen = len(audiodata)
-        while True:
-            part = audiodata[seg * chunksize: (seg + 1) * chunksize]
-            plen = len(part)
-            print(seg, plen)
-            if plen == 0:
-                break
-            data = struct.pack("<I", plen) + part
-            self.send_command(6, data, verbose=False)
-            # time.sleep((0.0 + plen) / 8000)
-            seg += 1
+        # one send buffer for all packets
+        packet = bytearray(16 + chunksize)
+
+        def send_chunk(chunk):
+            plen = len(chunk)
+            struct.pack_into("<I4sII", packet, 0, 6, "FOSC", plen + 4, plen)
+            packet[16:16 + plen] = chunk
+            self.con.sendall(memoryview(packet)[:16 + plen])
+
+        self.talk_pacer = FoscAudio.TalkPacer(send_chunk, jitter=jitter)
+        sent = self.talk_pacer.run(audiodata, chunksize)
+        print("%s bytes sent, %s underrun(s)" % (sent, self.talk_pacer.underruns))
+        return sent
+
+    def stop_talk(self):
+        """ stop sending audio data (see send_cmd6)
+        """
+        if self.talk_pacer is not None:
+            self.talk_pacer.stop()
 
     def send_cmd12(self, name, password, uid):
         """
@@ -439,7 +513,7 @@ cgictrl = pyFosControl.cam("http", camera_ip, camera_port, username, password)
 cgictrl.setConsoleDump(True)
 
 # Audio data to send to camera (cmd6), only partially successful yet
-# playme = open("music8000s.raw","rb").read()
+# playme = open("music8000s.raw","rb")
 
 # Dump incoming audio into file
 # FoscDecoder.openAudioDumpFile("/tmp/audio2.raw")
@@ -0,0 +1,32 @@
+# coding=utf-8
+
+"""
+shared fixtures and helpers of the tests
+"""
+
+import sys
+import time
+
+import pytest
+
+# the simulator (asyncio) runs on Python 3 only
+requiresSimulator = pytest.mark.skipif(sys.version_info < (3, 5), reason="simulator requires Python 3")
+
+
+@pytest.fixture
+def sim():
+    from foscontrol.simulator import CamSimulator
+
+    simulator = CamSimulator()
+    simulator.start()
+    yield simulator
+    simulator.stop()
+
+
+def waitFor(condition, timeout=5.0):
+    """ wait until condition() returns a true value, fails after timeout seconds
+    """
+    end = time.time() + timeout
+    while not condition():
+        assert time.time() < end, "timeout"
+        time.sleep(0.01)
@@ -0,0 +1,160 @@
+# coding=utf-8
+
+import os
+
+import pytest
+
+
+def picture(camera, x):
+    return ("%s-%s-" % (camera, x)).encode("ascii") * (10 + x % 7)
+
+
+class TestSnapshotArchive(object):
+    def test_append_find(self, tmpdir):
+        from foscontrol.archive import SnapshotArchive
+
+        archive = SnapshotArchive(str(tmpdir), segmentSize=2000)
+        keys = {}
+        for x in range(30):
+            for camera in ("garden", "gate"):
+                keys[camera, x] = archive.append(camera, picture(camera, x), 1000.0 + x)
+        stats = archive.stats()
+        assert stats["snapshots"] == 60 and stats["segments"] > 3
+        assert all(os.path.getsize(str(name)) <= 2000 for name in tmpdir.listdir() if name.ext == ".dat")
+
+        found = archive.find("garden", start=1005, end=1010.5)
+        assert [when for when, data in found] == [1005.0 + x for x in range(6)]
+        assert isinstance(found[0][1], memoryview)
+        assert [bytes(data) for when, data in found] == [picture("garden", x) for x in range(5, 11)]
+        assert len(archive.find("gate")) == 30
+        assert archive.find("porch") == []
+
+        assert bytes(archive.get("gate", 1029.0)) == picture("gate", 29)
+        assert archive.get("gate", 1029.5) is None
+        assert bytes(archive.read(keys["gate", 3])) == picture("gate", 3)
+        with pytest.raises(ValueError):
+            archive.append("x" * 33, b"data")
+        archive.close()
+
+        # reopened: sealed segments from their index, the last one from its log
+        archive = SnapshotArchive(str(tmpdir), segmentSize=2000)
+        assert archive.stats() == stats
+        assert [bytes(data) for when, data in archive.find("gate", 1028)] == [picture("gate", 28), picture("gate", 29)]
+        archive.append("gate", b"new", 2000.0)
+        assert bytes(archive.get("gate", 2000.0)) == b"new"
+        archive.close()
+
+    def test_crash(self, tmpdir):
+        from foscontrol.archive import SnapshotArchive
+
+        archive = SnapshotArchive(str(tmpdir))
+        archive.append("garden", b"first", 1.0)
+        archive.append("garden", b"second", 2.0)
+        archive.close()
+        # data written without its index entry, and half an index entry
+        with open(str(tmpdir.join("seg-000001.dat")), "ab") as fh:
+            fh.write(b"lost snapshot")
+        with open(str(tmpdir.join("seg-000001.log")), "ab") as fh:
+            fh.write(b"\x01\x02")
+
+        archive = SnapshotArchive(str(tmpdir))
+        assert [bytes(data) for when, data in archive.find("garden")] == [b"first", b"second"]
+        archive.append("garden", b"third", 3.0)
+        assert [bytes(data) for when, data in archive.find("garden")] == [b"first", b"second", b"third"]
+        archive.close()
+
+    def test_crash_lost_data(self, tmpdir):
+        from foscontrol.archive import ENTRY, HEADER, SnapshotArchive
+
+        archive = SnapshotArchive(str(tmpdir))
+        for x in range(3):
+            archive.append("garden", b"snapshot %d" % x, float(x))
+        archive.close()
+        # the log was written to disk, the data of the last two snapshots only partly
+        name = str(tmpdir.join("seg-000001.dat"))
+        with open(name, "r+b") as fh:
+            fh.seek(HEADER.size + 10)
+            fh.write(b"\x00" * 10)
+            fh.truncate(2 * (HEADER.size + 10) + 5)
+
+        archive = SnapshotArchive(str(tmpdir))
+        assert [bytes(data) for when, data in archive.find("garden")] == [b"snapshot 0"]
+        assert os.path.getsize(name) == HEADER.size + 10
+        assert os.path.getsize(str(tmpdir.join("seg-000001.log"))) == ENTRY.size
+        archive.append("garden", b"snapshot 3", 3.0)
+        archive.close()
+        archive = SnapshotArchive(str(tmpdir))
+        assert [when for when, data in archive.find("garden")] == [0.0, 3.0]
+        archive.close()
+
+    def test_compact(self, tmpdir):
+        from foscontrol.archive import SnapshotArchive
+
+        archive = SnapshotArchive(str(tmpdir), segmentSize=1000)
+        for x in range(40):
+            archive.append("garden" if x % 2 else "gate", picture("cam", x), float(x))
+        archive.rotate()
+        before = archive.stats()
+
+        dropped, freed = archive.compact(lambda camera, when, length: camera == "garden" or when >= 30)
+        assert dropped == 15 and freed > 0
+        after = archive.stats()
+        assert after["snapshots"] == 25 and after["bytes"] == before["bytes"] - freed
+        assert [when for when, data in archive.find("gate")] == [30.0, 32.0, 34.0, 36.0, 38.0]
+        assert [bytes(data) for when, data in archive.find("garden")] == [picture("cam", x) for x in range(1, 40, 2)]
+
+        # merging only, nothing dropped
+        assert archive.compact()[0] == 0
+        archive.close()
+        archive = SnapshotArchive(str(tmpdir), segmentSize=1000)
+        assert archive.stats()["snapshots"] == 25
+        assert bytes(archive.get("gate", 38.0)) == picture("cam", 38)
+        archive.close()
+
+    def test_compact_crash(self, tmpdir):
+        from foscontrol.archive import SnapshotArchive
+
+        def fill():
+            archive = SnapshotArchive(str(tmpdir), segmentSize=1000)
+            for x in range(40):
+                archive.append("garden", picture("cam", x), float(x))
+            archive.rotate()
+            return archive
+
+        class Crash(Exception):
+            pass
+
+        def crashAfter(func, calls):
+            def wrapper(*args):
+                func(*args)
+                calls[0] -= 1
+                if not calls[0]:
+                    raise Crash()
+            return wrapper
+
+        keep = lambda camera, when, length: when >= 10
+        for method, calls, expected in (("seal", 2, range(40)), ("writeCompaction", 2, range(10, 40))):
+            for name in tmpdir.listdir():
+                name.remove()
+            archive = fill()
+            setattr(archive, method, crashAfter(getattr(archive, method), [calls]))
+            with pytest.raises(Crash):
+                archive.compact(keep)
+            archive.close()
+
+            # rolled back while sealing the new segments, completed after they were done
+            archive = SnapshotArchive(str(tmpdir), segmentSize=1000)
+            assert [when for when, data in archive.find("garden")] == [float(x) for x in expected]
+            assert not tmpdir.join("compaction").exists()
+            archive.close()
+
+    def test_dedup_store(self, tmpdir):
+        from foscontrol.archive import SnapshotArchive
+        from foscontrol.dedup import SnapshotDedup
+
+        archive = SnapshotArchive(str(tmpdir))
+        dedup = SnapshotDedup(archive.append, decoder=lambda data, size: data[:1] * (size * size))
+        key, stored = dedup.ingest("garden", b"\x10jpeg", 5.0)
+        assert stored and bytes(archive.read(key)) == b"\x10jpeg"
+        assert dedup.ingest("garden", b"\x10other", 6.0) == (key, False)
+        archive.close()
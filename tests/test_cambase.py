@@ -0,0 +1,28 @@
+# coding=utf-8
+
+try:
+    from urllib.parse import urlsplit, parse_qsl
+except ImportError:
+    from urlparse import urlsplit, parse_qsl
+
+
+class TestCommandUrl(object):
+    def test_cached(self):
+        from foscontrol import CamBase
+
+        cam = CamBase("http", "localhost", 88, "admin", "p&w d", breaker=False)
+        url = cam.commandUrl("getDevState")
+        assert cam.commandUrl("getDevState") is url
+        assert parse_qsl(urlsplit(url).query) == [("cmd", "getDevState"), ("usr", "admin"), ("pwd", "p&w d")]
+
+        cam.password = "new"
+        assert "pwd=new" in cam.commandUrl("getDevState")
+
+    def test_params(self):
+        from foscontrol import CamBase
+
+        cam = CamBase("http", "localhost", 88, "admin", "pw", breaker=False)
+        url = cam.commandUrl("setDevName", [("devName", "a b")])
+        assert parse_qsl(urlsplit(url).query) == [("cmd", "setDevName"), ("usr", "admin"), ("pwd", "pw"),
+                                                  ("devName", "a b")]
+        assert "setDevName" not in cam.urlCache
@@ -0,0 +1,77 @@
+# coding=utf-8
+
+import gzip
+import os
+
+
+class TestDebugWriter(object):
+    def test_redact(self):
+        from foscontrol.debuglog import redact
+
+        url = "http://cam:88/cgi-bin/CGIProxy.fcgi?cmd=changePassword&usrName=admin&oldPwd=a%26b&newPwd=x&usr=admin&pwd=s3"
+        assert redact(url) == ("http://cam:88/cgi-bin/CGIProxy.fcgi?cmd=changePassword&usrName=admin"
+                               "&oldPwd=***&newPwd=***&usr=***&pwd=***")
+        xml = "<CGI_Result><user>ftp</user><password>geheim</password><psk></psk></CGI_Result>"
+        assert redact(xml) == "<CGI_Result><user>ftp</user><password>***</password><psk>***</psk></CGI_Result>"
+
+    def test_rotation(self, tmpdir):
+        from foscontrol.debuglog import DebugWriter
+
+        fnm = str(tmpdir.join("debug.log"))
+        writer = DebugWriter(fnm, maxBytes=100, backupCount=2, compress=True)
+        for x in range(10):
+            writer.write("?cmd=getDevInfo&usr=admin&pwd=secret&n=%s" % x)
+        writer.write(b"<password>secret</password>")
+        writer.close()
+
+        assert writer.written == 11 and writer.rotations == 3
+        assert sorted(os.listdir(str(tmpdir))) == ["debug.log", "debug.log.1.gz", "debug.log.2.gz"]
+        assert open(fnm).read() == "?cmd=getDevInfo&usr=***&pwd=***&n=9\n\n<password>***</password>\n\n"
+        content = gzip.open(fnm + ".1.gz").read().decode("utf-8")
+        assert content.split() == ["?cmd=getDevInfo&usr=***&pwd=***&n=%s" % x for x in (6, 7, 8)]
+
+    def test_secret_at_cut(self, tmpdir):
+        from foscontrol.debuglog import DebugWriter
+
+        fnm = str(tmpdir.join("debug.log"))
+        writer = DebugWriter(fnm, maxRecord=28)
+        # the limit falls into the secrets
+        writer.write("<user>a</user><password>topsecret</password>" + "x" * 100)
+        writer.write("?cmd=getDevInfo&pwd=topsecret&usr=admin")
+        writer.close()
+        content = open(fnm).read()
+        assert "topsec" not in content
+        assert content.split("\n\n")[:2] == ["<user>a</user><password>***<... [138 characters]",
+                                                "?cmd=getDevInfo&pwd=***&usr=... [31 characters]"]
+
+    def test_drop(self, tmpdir):
+        from foscontrol.debuglog import DebugWriter
+
+        writer = DebugWriter(str(tmpdir.join("debug.log")), queueSize=2)
+        with writer.lock:
+            # the writer thread is blocked, at most one record leaves the queue
+            for x in range(10):
+                writer.write("record %s" % x)
+        writer.close()
+        assert writer.dropped >= 7
+        assert writer.written + writer.dropped == 10
+
+    def test_errors(self, tmpdir):
+        from foscontrol.debuglog import DebugWriter
+
+        writer = DebugWriter(str(tmpdir.join("debug.log")), queueSize=2)
+        writer.write(object())  # cannot be formatted
+        writer.write("ok")
+        writer.close()
+        assert writer.errors == 1 and writer.written == 1
+        assert isinstance(writer.lastError, TypeError)
+
+    def test_close_dead_writer(self, tmpdir):
+        from foscontrol.debuglog import DebugWriter, _STOP
+
+        writer = DebugWriter(str(tmpdir.join("debug.log")), queueSize=1)
+        writer.queue.put(_STOP)  # the thread ends, as if killed
+        writer.thread.join(5)
+        writer.write("record")  # the queue is full now
+        writer.close()  # must not block
+        assert writer.thread is None
@@ -0,0 +1,143 @@
+# coding=utf-8
+
+import math
+import threading
+
+import pytest
+
+from .conftest import requiresSimulator
+
+
+def picture(offset=0, noise=0, flip=False):
+    """ raw 32 x 32 gray "picture": waves, optional noise and an inverted left half """
+    pixels = bytearray()
+    for y in range(32):
+        for x in range(32):
+            value = 120 + 60 * math.sin(x / 4.0) * math.cos(y / 6.0) + x * 2 + offset
+            if (x * 7 + y) % 5 == 0:
+                value += noise
+            if flip and x < 16:
+                value = 255 - value
+            pixels.append(max(0, min(255, int(value))))
+    return bytes(pixels)
+
+
+def rawDecoder(data, size):
+    """ reduces the raw pictures by averaging blocks """
+    block = 32 // size
+    return bytes(bytearray(sum(data[(y * block + dy) * 32 + x * block + dx]
+                               for dy in range(block) for dx in range(block)) // (block * block)
+                           for y in range(size) for x in range(size)))
+
+
+class Store(object):
+    def __init__(self):
+        self.items = []
+
+    def __call__(self, camera, data, when):
+        self.items.append((camera, data, when))
+        return len(self.items) - 1
+
+
+class TestDedup(object):
+    def test_hashes(self):
+        from foscontrol.dedup import averageHash, dctHash, hamming
+
+        assert hamming(0b1011, 0b0001) == 2
+        for size, func in [(8, averageHash), (32, dctHash)]:
+            plain = func(bytearray(rawDecoder(picture(), size)))
+            assert 0 < plain < 1 << 64
+            assert hamming(plain, func(bytearray(rawDecoder(picture(offset=20, noise=3), size)))) <= 4
+            assert hamming(plain, func(bytearray(rawDecoder(picture(flip=True), size)))) > 10
+
+    def test_dct_without_numpy(self, monkeypatch):
+        pytest.importorskip("numpy")
+        from foscontrol import dedup
+
+        pictures = [bytearray(picture(offset=x * 7, noise=x, flip=x % 2)) for x in range(4)]
+        hashes = [dedup.dctHash(pixels) for pixels in pictures]
+        monkeypatch.setattr(dedup, "numpy", None)
+        assert [dedup.dctHash(pixels) for pixels in pictures] == hashes
+
+    def test_concurrent_ingest(self):
+        from foscontrol.dedup import SnapshotDedup
+
+        storing = threading.Event()
+        proceed = threading.Event()
+
+        stored = []
+
+        def store(camera, data, when):
+            storing.set()
+            proceed.wait(5)
+            stored.append(camera)
+            return len(stored) - 1
+
+        dedup = SnapshotDedup(store, decoder=rawDecoder)
+        results = []
+        first = threading.Thread(target=lambda: results.append(dedup.ingest("garden", picture())))
+        first.start()
+        assert storing.wait(5)
+        # the same picture while the first one is stored
+        second = threading.Thread(target=lambda: results.append(dedup.ingest("garden", picture(noise=3))))
+        second.start()
+        second.join(0.2)
+        assert second.is_alive()
+        proceed.set()
+        first.join(5)
+        second.join(5)
+        assert results == [(0, True), (0, False)] and stored == ["garden"]
+
+    @pytest.mark.parametrize("method", ["average", "dct"])
+    def test_ingest(self, method):
+        from foscontrol.dedup import SnapshotDedup
+
+        store = Store()
+        dedup = SnapshotDedup(store, threshold=4, thresholds={"gate": -1}, method=method, decoder=rawDecoder,
+                              clock=lambda: 100.0)
+        assert dedup.ingest("garden", picture()) == (0, True)
+        assert dedup.ingest("garden", picture(noise=3)) == (0, False)
+        assert dedup.ingest("garden", picture(offset=10)) == (0, False)
+        assert dedup.ingest("garden", picture(flip=True)) == (1, True)
+        assert dedup.ingest("garden", picture()) == (2, True)
+        # cameras are compared with their own last snapshot, threshold -1 stores all
+        assert dedup.ingest("gate", picture()) == (3, True)
+        assert dedup.ingest("gate", picture()) == (4, True)
+
+        assert [item[0] for item in store.items] == ["garden"] * 3 + ["gate"] * 2
+        assert store.items[0][2] == 100.0
+        assert dedup.references(0) == 3
+        stats = dedup.stats()
+        assert stats["garden"] == {"snapshots": 5, "stored": 3, "duplicates": 2, "hitRate": 0.4}
+        assert stats["gate"]["hitRate"] == 0.0
+
+        assert dedup.release(0) == 2
+        assert dedup.release(2) == 0
+        # the last stored one is gone, the next snapshot is stored again
+        assert dedup.ingest("garden", picture()) == (5, True)
+
+        with pytest.raises(ValueError):
+            SnapshotDedup(store, method="md5")
+
+    @requiresSimulator
+    def test_snap(self):
+        pytest.importorskip("PIL")
+        from foscontrol.dedup import SnapshotDedup
+        from foscontrol.simulator import CamSimulator
+
+        store = Store()
+        dedup = SnapshotDedup(store, threshold=4)
+        with CamSimulator() as sim:
+            garden, gate = sim.addCameras(2)
+            cams = {"garden": sim.client(garden), "gate": sim.client(gate)}
+            for x in range(3):
+                dedup.snap("garden", cams["garden"])
+            # the padding changes the file, not the picture
+            gate.snapshotPadding = 1000
+            for x in range(3):
+                dedup.snap("gate", cams["gate"])
+        stats = dedup.stats()
+        # the small moving square of the test pictures is below the threshold
+        assert stats["garden"] == {"snapshots": 3, "stored": 1, "duplicates": 2, "hitRate": 2 / 3.0}
+        assert stats["gate"]["stored"] == 1
+        assert len(store.items) == 2 and dedup.references(1) == 3
@@ -0,0 +1,104 @@
+# coding=utf-8
+
+import pytest
+
+from .conftest import requiresSimulator
+
+pytestmark = requiresSimulator
+
+
+def readFile(path):
+    with open(str(path), "rb") as fh:
+        return fh.read()
+
+
+class TestRecordDownloader(object):
+    def test_range_requests(self, sim):
+        from foscontrol.transport import httplib
+
+        camera = sim.addCamera(recordEntries=3)
+        cam = sim.client(camera)
+        path, size = camera.records[0][:2]
+        content = camera.recordContent(path)
+        assert len(content) == size
+
+        conn = cam.connection()
+        url = cam.recordUrl(path)
+        target = url[url.index(path):]
+        for header, status, body in [(None, 200, content), ("bytes=10-19", 206, content[10:20]),
+                                     ("bytes=%s-" % (size - 5), 206, content[-5:]), ("bytes=-7", 206, content[-7:]),
+                                     ("bytes=%s-" % size, 416, b"")]:
+            conn.request("GET", target, headers={"Range": header} if header else {})
+            resp = conn.getresponse()
+            assert (resp.status, resp.read()) == (status, body)
+        conn.close()
+
+    def test_download(self, sim, tmpdir):
+        from foscontrol.download import RecordDownloader, DONE, SKIPPED
+
+        garden, gate = sim.addCameras(2, recordEntries=4)
+        cams = {"garden": sim.client(garden), "gate": sim.client(gate)}
+        records = dict((name, cam.getRecordList()._record) for name, cam in cams.items())
+
+        downloader = RecordDownloader(str(tmpdir), perCamera=2, workers=3, chunkSize=4096)
+        maxActive = {}
+
+        def listener(task, received):
+            counters = downloader.counters[task.camera]
+            maxActive[task.camera] = max(maxActive.get(task.camera, 0), counters.active)
+
+        downloader.listeners.append(listener)
+        tasks = downloader.download(cams, records)
+        assert [t.status for t in tasks] == [DONE] * 8
+        for task in tasks:
+            camera = garden if task.camera == "garden" else gate
+            assert readFile(task.filename) == camera.recordContent(task.record.path)
+            assert not tmpdir.join(task.camera).join(task.record.path.rsplit("/", 1)[1] + ".part").exists()
+        assert max(maxActive.values()) <= 2
+
+        progress = downloader.progress()
+        assert progress["gate"]["done"] == 4
+        assert progress["gate"]["bytes"] == sum(r[1] for r in gate.records)
+        assert progress["gate"]["throughput"] > 0
+        # kept connections: not more than the concurrency per camera
+        assert downloader.pools["gate"].created <= 2
+
+        # files with the listed size are not fetched again
+        requests = len(gate.recordRequests)
+        again = RecordDownloader(str(tmpdir)).download(cams, records)
+        assert [t.status for t in again] == [SKIPPED] * 8
+        assert len(gate.recordRequests) == requests
+        downloader.close()
+
+    def test_resume(self, sim, tmpdir):
+        from foscontrol.download import RecordDownloader, DONE, FAILED
+        from foscontrol.resilience import RetryPolicy
+
+        camera = sim.addCamera(recordEntries=1)
+        cam = sim.client(camera)
+        record = cam.getRecordList()._record[0]
+        content = camera.recordContent(record.path)
+
+        # two interrupted transfers, each attempt continues where the last one stopped
+        camera.recordDrops = [30000, 20000]
+        downloader = RecordDownloader(str(tmpdir), retry=RetryPolicy(attempts=3, sleep=lambda secs: None))
+        task, = downloader.download([cam], {cam.target: [record]})
+        assert task.status == DONE
+        assert (task.attempts, task.resumed, task.received) == (2, 2, record.size)
+        assert readFile(task.filename) == content
+        assert [r[1] for r in camera.recordRequests] == [None, "bytes=30000-", "bytes=50000-"]
+
+        # a partial file of an earlier run is continued
+        tmpdir.join(cam.target).join(record.path.rsplit("/", 1)[1]).remove()
+        tmpdir.join(cam.target).join(record.path.rsplit("/", 1)[1] + ".part").write_binary(content[:1000])
+        task, = downloader.download([cam], {cam.target: [record]})
+        assert (task.status, task.received) == (DONE, record.size - 1000)
+        assert camera.recordRequests[-1][1] == "bytes=1000-"
+        assert readFile(task.filename) == content
+
+        camera.recordDrops = [10, 10]
+        tmpdir.join(cam.target).join(record.path.rsplit("/", 1)[1]).remove()
+        downloader = RecordDownloader(str(tmpdir), retry=RetryPolicy(attempts=2, sleep=lambda secs: None))
+        task, = downloader.download([cam], {cam.target: [record]})
+        assert task.status == FAILED and task.attempts == 2
+        assert downloader.progress()[cam.target]["failed"] == 1
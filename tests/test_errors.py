@@ -0,0 +1,54 @@
+# coding=utf-8
+
+import pytest
+
+from .conftest import requiresSimulator
+
+
+class TestResultObj(object):
+    def test_result(self):
+        from foscontrol import ResultObj
+
+        res = ResultObj({"result": "0", "addResult": "2"})
+        assert res.result == 0 and res._result == "Success"
+        assert "_result" not in res.data
+        res.extendedResult("addResult")
+        assert res.result == 2 and res.get("result") == 2
+        assert res._result == "sub error (addResult) 2"
+
+        assert ResultObj({}).result is None
+        assert ResultObj({}).get("_result") == "Missing result parameter"
+
+    def test_strict_subresult(self):
+        from foscontrol import ResultObj
+        from foscontrol.errors import SubResultError
+
+        ResultObj({"result": "0", "addResult": "0"}, strict=True).extendedResult("addResult")
+        with pytest.raises(SubResultError) as info:
+            ResultObj({"result": "0", "addResult": "2"}, strict=True, cmd="ptzAddPresetPoint").extendedResult("addResult")
+        assert (info.value.cmd, info.value.name, info.value.code) == ("ptzAddPresetPoint", "addResult", "2")
+
+
+@requiresSimulator
+class TestStrictMode(object):
+    def test_exceptions(self):
+        from foscontrol.simulator import CamSimulator
+        from foscontrol import errors
+
+        with CamSimulator() as sim:
+            camera = sim.addCamera(errors={"getDevState": -3, "getLog": -5})
+            cam = sim.client(camera)
+            cam.setStrict(True)
+
+            assert cam.getDevInfo().result == 0
+            with pytest.raises(errors.AccessDenied):
+                cam.getDevState()
+            with pytest.raises(errors.CamTimeout):
+                cam.getLog()
+            with pytest.raises(errors.SubResultError):
+                cam.ptzAddPresetPoint("TopMost")
+
+            cam.password = "wrong"
+            with pytest.raises(errors.AuthError) as info:
+                cam.getDevInfo()
+            assert isinstance(info.value, errors.CamError) and info.value.code == -2
@@ -0,0 +1,112 @@
+# coding=utf-8
+
+import pytest
+
+from .conftest import requiresSimulator
+
+pytestmark = requiresSimulator
+
+
+class TestParallel(object):
+    def test_order_and_errors(self):
+        from foscontrol.fleet import parallel
+
+        def func(x):
+            if x == 3:
+                raise ValueError(x)
+            return x * 2
+
+        results = parallel(range(10), func, workers=4)
+        assert [r[1] for r in results] == [0, 2, 4, None, 8, 10, 12, 14, 16, 18]
+        assert isinstance(results[3][2], ValueError)
+
+
+class TestConfigBackup(object):
+    def test_backup_restore(self, sim, tmpdir):
+        from foscontrol.fleet import ConfigStore, ConfigBackup
+
+        cameras = sim.addCameras(3, rebootTime=0.2)
+        cams = dict((camera.name, sim.client(camera)) for camera in cameras)
+        broken = sim.addCamera(name="broken", errors={"exportConfig": -4})
+        store = ConfigStore(str(tmpdir))
+        backup = ConfigBackup(store, workers=2)
+
+        report = backup.backup(dict(cams, broken=sim.client(broken)), run="r1")
+        assert all(report[name]["new"] for name in cams)
+        assert "error" in report["broken"]
+        assert len(store.blobs()) == 3
+
+        # unchanged configs are not stored again
+        cams["FosSim0001"].setDevName("renamed")
+        report = backup.backup(cams, run="r2")
+        assert [name for name in sorted(cams) if report[name]["new"]] == ["FosSim0001"]
+        assert len(store.blobs()) == 4
+        assert store.runs("FosSim0000") == ["r1", "r2"]
+        assert store.manifest("broken") is None
+
+        assert store.get(report["FosSim0001"]["blob"]) == cameras[1].configBlob
+        assert store.manifest("FosSim0001", "r1")["blob"] != report["FosSim0001"]["blob"]
+
+        report = backup.restore(dict(cams, broken=sim.client(broken)), maxRebooting=1, pollInterval=0.05)
+        assert "no backup" in report["broken"]["error"]
+        for camera in cameras:
+            assert report[camera.name]["run"] == "r2"
+            assert report[camera.name]["downtime"] >= 0.2
+            assert camera.reboots == 1
+
+        assert store.prune(keep=1) == 1
+        assert len(store.blobs()) == 3
+
+    def test_wait_for_reboot(self):
+        from foscontrol.fleet import ConfigBackup
+
+        now = [0.0]
+
+        class Cam(object):
+            # answers for 3 seconds after the import, is down until 8
+            def probe(self):
+                if 3 <= now[0] < 8:
+                    raise IOError("connection refused")
+
+        def sleep(secs):
+            now[0] += secs
+
+        backup = ConfigBackup(None, sleep=sleep, clock=lambda: now[0])
+        assert backup.waitForCamera(Cam(), 60, 1, minDowntime=20) == 8
+        # never seen down
+        now[0] = 100.0
+        assert backup.waitForCamera(Cam(), 60, 1, minDowntime=20) == 20
+
+
+class TestFirmwareRollout(object):
+    def test_waves(self, sim, tmpdir):
+        from foscontrol.fleet import FirmwareRollout
+        from foscontrol.simulator.camera import firmwareImage
+
+        path = tmpdir.join("fw.bin")
+        path.write_binary(firmwareImage("2.11.2.10", size=300000))
+        cameras = sim.addCameras(6, rebootTime=0.1)
+        cameras[5].devInfo["firmwareVer"] = "2.11.2.10"
+        cams = dict((camera.name, sim.client(camera)) for camera in cameras)
+
+        rollout = FirmwareRollout(str(path), "2.11.2.10", waves=(1, 2), maxParallel=2, pollInterval=0.02,
+                                  rebootWindow=5)
+        assert [len(wave) for wave in rollout.plan(sorted(cams.items()))] == [1, 2, 2, 1]
+        report = rollout.run(cams)
+
+        assert [report[c.name]["status"] for c in cameras] == ["upgraded"] * 5 + ["current"]
+        assert [report[c.name]["wave"] for c in cameras] == [0, 1, 1, 2, 2, 3]
+        assert all(c.devInfo["firmwareVer"] == "2.11.2.10" for c in cameras)
+        assert [c.upgrades for c in cameras] == [1, 1, 1, 1, 1, 0]
+        assert report[cameras[0].name]["duration"] >= 0.1
+
+    def test_stop_on_failure(self, sim, tmpdir):
+        from foscontrol.fleet import FirmwareRollout
+
+        path = tmpdir.join("fw.bin")
+        path.write_binary(b"not a firmware image")
+        cams = [sim.client(camera) for camera in sim.addCameras(3)]
+
+        report = FirmwareRollout(str(path), "9.9", waves=(1,), pollInterval=0.01).run(cams)
+        assert sorted(r["status"] for r in report.values()) == ["failed", "skipped", "skipped"]
+        assert "CgiExecuteError" in report[cams[0].target]["error"]
@@ -1,12 +1,15 @@
 # coding=utf-8
 
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
 
 
 class TestPrinthex(object):
     def test_basic(self):
         import sys
         from lowlevel.FoscDecoder import printhex
-        from StringIO import StringIO
 
         saved_stdout = sys.stdout
         try:
@@ -24,7 +27,6 @@ class TestPrinthex(object):
     def test_multiline(self):
         import sys
         from lowlevel.FoscDecoder import printhex
-        from StringIO import StringIO
 
         saved_stdout = sys.stdout
         try:
@@ -46,7 +48,6 @@ class TestPrinthex(object):
     def test_highlight_single_character(self):
         import sys
         from lowlevel.FoscDecoder import printhex
-        from StringIO import StringIO
 
         saved_stdout = sys.stdout
         try:
@@ -64,7 +65,6 @@ class TestPrinthex(object):
     def test_multicharacter_highlight(self):
         import sys
         from lowlevel.FoscDecoder import printhex
-        from StringIO import StringIO
 
         saved_stdout = sys.stdout
         try:
@@ -86,7 +86,6 @@ class TestPrinthex(object):
     def test_multiline_highlight(self):
         import sys
         from lowlevel.FoscDecoder import printhex
-        from StringIO import StringIO
 
         saved_stdout = sys.stdout
         try:
@@ -103,3 +102,37 @@ class TestPrinthex(object):
             assert output_lines[3] == '0020: 20 68 6f 6c 64                                    hold'
         finally:
             sys.stdout = saved_stdout
+
+    def test_bytes_to_stream(self):
+        from lowlevel.FoscDecoder import printhex
+
+        out = StringIO()
+        printhex(b"\x00FOSC\xff", info="cmd", highlight=set([1, 2, 3, 4]), out=out)
+        output_lines = out.getvalue().split("\n")
+
+        assert len(output_lines) == 3
+        assert output_lines[0] == 'cmd - length: 6'
+        assert output_lines[1] == '0000: 00 \x1b[43m46 4f 53 43\x1b[0m ff                                .FOSC.'
+        assert output_lines[2] == ''
+
+
+class TestDataCompare(object):
+    def test_offsets(self):
+        from lowlevel.FoscDecoder import DataCompare
+
+        dc = DataCompare()
+        assert dc.put(b"\x1b\x00FOSC\x01\x00") == []
+        assert dc.put(b"\x1b\x00FOSC\x02\x00") == [6]
+        assert dc.put(b"\x1b\x01FOSC\x01\x00") == [1]
+        assert dc.put(b"\x1b\x00FOSC\x01") == -1
+
+    def test_variability(self):
+        import struct
+        from lowlevel.FoscDecoder import DataCompare
+
+        dc = DataCompare()
+        for counter in range(10):
+            dc.put(struct.pack("<I4sHB", 27, b"FOSC", counter, 7))
+
+        assert dc.variability() == [(8, 9)]
+        assert dc.constants() == [0, 1, 2, 3, 4, 5, 6, 7, 9, 10]
@@ -0,0 +1,94 @@
+# coding=utf-8
+
+import struct
+
+
+def audio_packet(pcm):
+    return struct.pack("<I4sI", 27, b"FOSC", 36 + len(pcm)) + b"\x00" * 36 + pcm
+
+
+class TestAudioSink(object):
+    def test_payload(self):
+        from lowlevel.FoscAudio import audioPayload
+
+        pcm = b"\x01\x02\x03\x04"
+        assert bytes(audioPayload(audio_packet(pcm) + b"next")) == pcm
+
+    def test_ring_overrun(self):
+        from lowlevel.FoscAudio import PCMRingBuffer
+
+        ring = PCMRingBuffer(8)
+        ring.write(b"abcdef")
+        ring.write(b"ghij")
+        assert ring.overrun == 2
+        assert ring.read(4) == b"cdef"
+        ring.write(b"klmnop")
+        assert len(ring) == 8
+        assert ring.overrun == 4
+        assert ring.read(100) == b"ijklmnop"
+        ring.close()
+        assert ring.read(100) == b""
+
+    def test_half_sample(self):
+        import threading
+        from lowlevel.FoscAudio import AudioSink
+
+        sink = AudioSink(seconds=1)
+        sink.feed(b"\x01")
+        timer = threading.Timer(0.05, lambda: (sink.feed(b"\x02\x03\x04"), sink.close()))
+        timer.start()
+        # the odd byte alone must not end the generator
+        assert b"".join(sink.chunks(timeout=2)) == b"\x01\x02\x03\x04"
+        timer.join()
+
+    def test_wav_recording(self):
+        import io
+        import wave
+        from lowlevel.FoscAudio import AudioSink, AudioRecorder, WavWriter
+
+        out = io.BytesIO()
+        sink = AudioSink(seconds=1)
+        recorder = AudioRecorder(sink, WavWriter(out))
+        recorder.start()
+        for x in range(100):
+            sink.feedPacket(audio_packet(struct.pack("<160h", *([x] * 160))))
+        recorder.stop()
+
+        wav = wave.open(io.BytesIO(out.getvalue()))
+        assert wav.getframerate() == 8000
+        assert wav.getsampwidth() == 2
+        assert wav.getnframes() + sink.overrun() // 2 == 100 * 160
+
+
+class TestTalkPacer(object):
+    def test_chunks(self):
+        import io
+        from lowlevel.FoscAudio import pcmChunks
+
+        class ShortReads(io.BytesIO):
+            def read(self, size=-1):
+                return io.BytesIO.read(self, min(size, 3))
+
+        data = bytes(bytearray(range(200))) * 10
+        for source in [data, io.BytesIO(data), ShortReads(data), (data[x:x + 7] for x in range(0, len(data), 7))]:
+            chunks = list(pcmChunks(source, 960))
+            assert [len(c) for c in chunks] == [960, 960, 80]
+            assert b"".join(bytes(c) for c in chunks) == data
+
+    def test_cadence(self):
+        from lowlevel.FoscAudio import TalkPacer
+
+        clock = [100.0]
+        sendtimes = []
+
+        def sleep(secs):
+            clock[0] += secs
+
+        pacer = TalkPacer(lambda chunk: sendtimes.append(clock[0]), jitter=0.12,
+                          clock=lambda: clock[0], sleep=sleep)
+        # 10 chunks of 960 bytes = 60 ms each
+        assert pacer.run(b"\x00" * 9600, 960) == 9600
+
+        offsets = [round(t - 100.0, 3) for t in sendtimes]
+        assert offsets == [0.0, 0.0, 0.0, 0.06, 0.12, 0.18, 0.24, 0.3, 0.36, 0.42]
+        assert pacer.underruns == 0
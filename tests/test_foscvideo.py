@@ -0,0 +1,66 @@
+# coding=utf-8
+
+import struct
+
+SPS = b"\x00\x00\x00\x01\x67\x42\x00\x1e"
+PPS = b"\x00\x00\x00\x01\x68\xce\x38\x80"
+IDR = b"\x00\x00\x00\x01\x65\x88\x84\x21\xa0"
+SLICE = b"\x00\x00\x00\x01\x41\x9a\x02\x03"
+SLICE_PART2 = b"\x00\x00\x01\x41\x20\x05\x06"  # first_mb_in_slice != 0
+
+
+def video_packets(stream, size):
+    """ split a stream into command 26 packets with `size` bytes of video data """
+    for x in range(0, len(stream), size):
+        part = stream[x:x + size]
+        yield struct.pack("<I4sI", 26, b"FOSC", 36 + len(part)) + b"\xee" * 36 + part
+
+
+class TestVideoDemuxer(object):
+    def test_access_units(self):
+        from lowlevel.FoscVideo import demux
+
+        stream = SPS + PPS + IDR + SLICE + SLICE_PART2 + SLICE
+        for size in [1, 5, 1000]:
+            units = list(demux(video_packets(stream, size)))
+
+            assert [au.data for au in units] == [SPS + PPS + IDR, SLICE + SLICE_PART2, SLICE]
+            assert [au.keyframe for au in units] == [True, False, False]
+            assert units[0].naltypes == [7, 8, 5]
+
+    def test_garbage_before_start_code(self):
+        from lowlevel.FoscVideo import VideoDemuxer
+
+        demuxer = VideoDemuxer()
+        assert demuxer.feed(b"\x12\x34" + IDR) == []
+        units = demuxer.feed(IDR) + demuxer.flush()
+        assert [au.data for au in units] == [IDR, IDR]
+        assert demuxer.discarded == 2
+
+    def test_no_start_code(self):
+        from lowlevel.FoscVideo import VideoDemuxer
+
+        demuxer = VideoDemuxer()
+        for x in range(100):
+            assert demuxer.feed(b"\x12" * 997 + b"\x00") == []
+        assert len(demuxer.buffer) <= 3
+        # the start code split between two payloads is still found
+        assert demuxer.feed(b"\x00") == []
+        units = demuxer.feed(b"\x00\x01" + IDR[4:]) + demuxer.flush()
+        assert [au.data for au in units] == [IDR]
+        assert demuxer.discarded == 100 * 998 - 1
+
+    def test_annexb_writer(self):
+        import io
+        from lowlevel.FoscVideo import VideoDemuxer, AnnexBWriter
+
+        out = io.BytesIO()
+        writer = AnnexBWriter(out)
+        demuxer = VideoDemuxer(callback=writer.write)
+        for packet in video_packets(SLICE + SPS + PPS + IDR + SLICE, 3):
+            demuxer.feedPacket(packet)
+        demuxer.flush()
+        writer.close()
+
+        # the stream starts with the keyframe
+        assert out.getvalue() == SPS + PPS + IDR + SLICE
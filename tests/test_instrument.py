@@ -0,0 +1,113 @@
+# coding=utf-8
+
+import socket
+
+import pytest
+
+from .conftest import requiresSimulator
+
+
+class TestHistogram(object):
+    def test_aggregator_threads(self):
+        import threading
+        from foscontrol.instrument import HistogramAggregator
+
+        agg = HistogramAggregator(bounds=(0.01, 0.1, 1.0))
+
+        def work():
+            for x in range(1000):
+                agg.observe(("cam", "getDevState", "total"), 0.05)
+
+        threads = [threading.Thread(target=work) for x in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        agg.observe(("cam", "getDevState", "total"), 5.0)
+
+        histograms, counters = agg.snapshot()
+        h = histograms[("cam", "getDevState", "total")]
+        assert h.count == 4001
+        assert h.cumulative() == [(0.01, 0), (0.1, 4000), (1.0, 4000), (float("inf"), 4001)]
+        assert 0.01 < h.quantile(0.5) < 0.1
+        # the shards of the ended threads have been merged, only the main thread's is left
+        assert len(agg.shards) == 1
+
+    def test_aggregator_short_threads(self):
+        import threading
+        from foscontrol.instrument import HistogramAggregator
+
+        agg = HistogramAggregator(bounds=(1.0,))
+        for run in range(50):
+            threads = [threading.Thread(target=agg.count, args=(("cam", "getDevState", "result=0"),))
+                       for x in range(4)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        assert len(agg.shards) <= 4
+        assert agg.snapshot()[1] == {("cam", "getDevState", "result=0"): 200}
+        assert agg.shards == []
+
+    def test_prometheus_render(self):
+        from foscontrol.instrument import HistogramAggregator, PrometheusExporter, CommandEvent
+
+        agg = HistogramAggregator(bounds=(0.1, 1.0))
+        event = CommandEvent("getDevInfo", "10.0.0.1", 88, bytesOut=100)
+        event.timings = {"total": 0.2}
+        event.bytesIn = 500
+        event.result = 0
+        agg.post(event)
+
+        text = PrometheusExporter(agg).render()
+        labels = 'camera="10.0.0.1:88",cmd="getDevInfo"'
+        assert 'foscam_command_duration_seconds_bucket{%s,phase="total",le="1.0"} 1' % labels in text
+        assert 'foscam_command_duration_seconds_bucket{%s,phase="total",le="+Inf"} 1' % labels in text
+        assert 'foscam_commands_total{%s,result="0"} 1' % labels in text
+        assert 'foscam_command_bytes_total{%s,direction="in"} 500' % labels in text
+
+
+@requiresSimulator
+class TestSendcommandHooks(object):
+    def test_hooks(self):
+        from foscontrol.instrument import HistogramAggregator, Hook, StatsDExporter
+        from foscontrol.simulator import CamSimulator
+
+        class Recorder(Hook):
+            def __init__(self):
+                self.events = []
+
+            def post(self, event):
+                self.events.append(event)
+
+        receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        receiver.bind(("127.0.0.1", 0))
+        receiver.settimeout(5)
+
+        with CamSimulator() as sim:
+            cam = sim.client(sim.addCamera(errors={"getDevState": -3}))
+            rec = Recorder()
+            agg = HistogramAggregator()
+            statsd = StatsDExporter(port=receiver.getsockname()[1])
+            for hook in (rec, agg, statsd):
+                cam.addHook(hook)
+
+            cam.getDevInfo()
+            cam.getDevState()
+            cam.removeHook(rec)
+            cam.getDevInfo()
+            statsd.close()
+
+        assert [(e.cmd, e.result) for e in rec.events] == [("getDevInfo", 0), ("getDevState", -3)]
+        event = rec.events[0]
+        assert set(["dns", "connect", "firstByte", "total", "decode"]) <= set(event.timings)
+        assert event.bytesIn > 0 and event.bytesOut > 0
+
+        histograms, counters = agg.snapshot()
+        assert histograms[(event.target, "getDevInfo", "total")].count == 2
+        assert counters[(event.target, "getDevState", "result=-3")] == 1
+
+        datagram = receiver.recv(4096).decode("utf-8")
+        assert "foscam.127_0_0_1_%s.getDevInfo.total:" % cam.port in datagram
+        assert "getDevInfo.result.0:1|c" in datagram
+        receiver.close()
@@ -0,0 +1,71 @@
+# coding=utf-8
+
+import pytest
+
+numpy = pytest.importorskip("numpy")
+
+
+def frameWithSquare(x, y, height=240, width=320, rgb=False):
+    frame = numpy.full((height, width), 60, dtype=numpy.uint8)
+    frame[y:y + 24, x:x + 32] = 250
+    if rgb:
+        frame = numpy.repeat(frame[:, :, None], 3, axis=2)
+    return frame
+
+
+class TestMotion(object):
+    def test_areas(self):
+        from foscontrol.motion import toAreas, fromAreas
+
+        cells = numpy.zeros((10, 10), dtype=bool)
+        cells[0, 0] = cells[0, 9] = cells[9, 3] = True
+        areas = toAreas(cells)
+        assert areas == [1 + 512, 0, 0, 0, 0, 0, 0, 0, 0, 8]
+        assert (fromAreas(areas) == cells).all()
+        config = dict(("area%s" % row, str(value)) for row, value in enumerate(areas))
+        assert (fromAreas(config) == cells).all()
+        assert toAreas(fromAreas([1023] * 10)) == [1023] * 10
+
+    def test_thumbnail(self):
+        from foscontrol.motion import thumbnail
+
+        frame = frameWithSquare(0, 0, height=243, width=325)
+        thumb = thumbnail(frame, 10)
+        assert thumb.shape == (10, 10) and thumb.dtype == numpy.float32
+        assert thumb[0, 0] == pytest.approx(250) and thumb[5, 5] == pytest.approx(60)
+        assert numpy.allclose(thumbnail(frameWithSquare(0, 0, rgb=True), 10), thumb, atol=0.01)
+        with pytest.raises(ValueError):
+            thumbnail(numpy.zeros((5, 5)), 10)
+
+    @pytest.mark.parametrize("rgb", [False, True])
+    def test_score(self, rgb):
+        from foscontrol.motion import MotionScorer
+
+        scorer = MotionScorer(threshold=20, areas=[0, 0, 0, 0, 0, 0, 0, 0, 0, 1023])
+        assert not scorer.score(frameWithSquare(0, 24, rgb=rgb)).any()
+        scores = scorer.score(frameWithSquare(64, 24, rgb=rgb))
+        assert scores.shape == (10, 10)
+        assert [tuple(c) for c in numpy.argwhere(scorer.active(scores))] == [(1, 0), (1, 2)]
+        assert scores[1, 0] == pytest.approx(190)
+        # only the bottom row counts for motion()
+        assert not scorer.motion(scores)
+        assert scorer.motion(scorer.score(frameWithSquare(64, 216, rgb=rgb)))
+
+        scorer.score(frameWithSquare(64, 216, rgb=rgb))
+        ratio = scorer.activeRatio()
+        assert scorer.frames == 3
+        assert ratio[1, 0] == pytest.approx(1 / 3.0) and ratio[9, 2] == pytest.approx(1 / 3.0)
+        assert ratio[5, 5] == 0
+
+    def test_jpeg(self):
+        pytest.importorskip("PIL")
+        from foscontrol.motion import MotionScorer, decodeJpeg
+        from foscontrol.simulator.jpeg import testPicture
+
+        frame = decodeJpeg(testPicture(0), size=(80, 60))
+        assert frame.ndim == 2 and frame.shape[0] < 240
+        scorer = MotionScorer(threshold=20, cellSize=2)
+        scorer.score(frame)
+        # the bright square moves from the first to the second column of the grid
+        active = scorer.active(scorer.score(decodeJpeg(testPicture(4), size=(80, 60))))
+        assert active[:, :2].any() and not active[:, 3:].any()
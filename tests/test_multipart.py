@@ -0,0 +1,67 @@
+# coding=utf-8
+
+import io
+
+import pytest
+
+from .conftest import requiresSimulator
+
+
+class TestMultipartEncoder(object):
+    def test_sources(self, tmpdir):
+        from foscontrol.multipart import MultipartEncoder
+
+        content = bytes(bytearray(range(256))) * 1000
+        path = tmpdir.join("cfg.bin")
+        path.write_binary(content)
+
+        fromBytes = MultipartEncoder({"submit": "import"}, {"file": {"filename": "cfg.bin", "content": content}},
+                                     boundary="XyZ", chunkSize=1000)
+        with open(str(path), "rb") as fh:
+            fromFile = MultipartEncoder({"submit": "import"}, {"file": {"filename": "cfg.bin", "file": fh}},
+                                        boundary="XyZ", chunkSize=1000)
+            body = b"".join(bytes(chunk) for chunk in fromFile)
+            assert max(len(chunk) for chunk in fromFile) <= 1000
+            # read() in odd sizes
+            pieces = []
+            while True:
+                piece = fromFile.read(777)
+                if not piece:
+                    break
+                pieces.append(piece)
+            assert b"".join(bytes(piece) for piece in pieces) == body
+            # reads inside one chunk are slices of it
+            fromFile.rewind()
+            fromFile.read(body.index(content) + 500)
+            piece = fromFile.read(10)
+            assert isinstance(piece, memoryview) and piece == content[500:510]
+            assert fromFile.read(1000) == content[510:1510]
+            fromFile.rewind()
+            assert fromFile.read() == body
+
+        assert b"".join(bytes(chunk) for chunk in fromBytes) == body
+        assert len(fromBytes) == len(body) == int(fromBytes.headers["Content-Length"])
+        assert body.startswith(b'--XyZ\r\nContent-Disposition: form-data; name="submit"\r\n\r\nimport\r\n')
+        assert body.endswith(content + b"\r\n--XyZ--\r\n")
+
+    def test_encode_multipart(self):
+        from foscontrol import encode_multipart
+
+        body, headers = encode_multipart({}, {"file": {"filename": "a.bin", "content": b"\x00\xff"}}, "B")
+        assert body == (b'--B\r\nContent-Disposition: form-data; name="file"; filename="a.bin"\r\n'
+                        b'Content-Type: application/octet-stream\r\n\r\n\x00\xff\r\n--B--\r\n')
+        assert headers["Content-Length"] == str(len(body))
+
+
+@requiresSimulator
+def test_import_config_file(tmpdir):
+    from foscontrol.simulator import CamSimulator
+
+    with CamSimulator() as sim:
+        camera = sim.addCamera()
+        cam = sim.client(camera)
+        path = tmpdir.join("backup.bin")
+        path.write_binary(camera.configBlob + b"\x00" * 300000)
+        res = cam.importConfigFile(str(path))
+        assert res.result == 0 and res.importResult == "0"
+        assert camera.reboots == 1
@@ -0,0 +1,140 @@
+# coding=utf-8
+
+import pytest
+
+from .conftest import requiresSimulator, waitFor
+
+pytestmark = requiresSimulator
+
+
+class TestStatePoller(object):
+    def test_changes(self, sim):
+        from foscontrol.poller import StatePoller
+
+        cameras = sim.addCameras(2)
+        cams = dict((camera.name, sim.client(camera)) for camera in cameras)
+        poller = StatePoller(cams, commands=("getDevState", "getSystemTime"), workers=2)
+        received = []
+        poller.listeners.append(received.append)
+
+        assert poller.poll() == []
+        assert poller.poll() == []
+        assert poller.unchanged >= 2  # getDevState did not change
+
+        cameras[0].trigger("motionDetectAlarm")
+        cameras[1].devState["sdState"] = "0"
+        events = sorted(poller.poll(), key=lambda e: e.camera)
+        assert [(e.camera, e.field, e.kind, e.old, e.new) for e in events] == [
+            ("FosSim0000", "motionDetectAlarm", "alarmRaised", "1", "2"),
+            ("FosSim0001", "sdState", "changed", "1", "0")]
+        assert poller.poll() == []
+        assert len(received) == 2
+
+        cameras[0].trigger("motionDetectAlarm", False)
+        assert [e.kind for e in poller.poll()] == ["alarmCleared"]
+        assert poller.state("FosSim0001")["sdState"] == "0"
+        assert "sec" not in poller.state("FosSim0001", "getSystemTime")
+
+    def test_available(self, sim):
+        from foscontrol import Cam, resilience
+        from foscontrol.poller import StatePoller
+
+        camera = sim.addCamera(rebootTime=60)
+        cam = Cam("http", camera.host, camera.port, camera.user, camera.password, breaker=False,
+                  retry=resilience.NO_RETRY)
+        poller = StatePoller([cam])
+        poller.poll()
+        camera.reboot()
+        assert [e.kind for e in poller.poll()] == ["unavailable"]
+        assert poller.poll() == []
+        camera.rebootUntil = 0
+        assert [e.kind for e in poller.poll()] == ["available"]
+        assert isinstance(poller.lastError[cam.target], IOError)
+
+    def test_programming_error(self, sim):
+        from foscontrol.poller import StatePoller
+
+        cam = sim.client(sim.addCamera())
+        poller = StatePoller([cam])
+        poller.poll()
+        cam.decodeResult = None  # broken
+        cam.sendcommand = lambda cmd, raw: b"changed"
+        with pytest.raises(TypeError):
+            poller.poll()
+        assert isinstance(poller.lastError[cam.target], TypeError)
+        assert poller.available[cam.target] is True
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestAdaptivePoller(object):
+    def test_intervals(self, sim):
+        from foscontrol.poller import StatePoller, AdaptivePoller, ChangeEvent
+
+        camera = sim.addCamera()
+        poller = StatePoller({"cam": sim.client(camera)})
+        clock = FakeClock()
+        adaptive = AdaptivePoller(poller, minInterval=1, maxInterval=60, baseInterval=8, alarmHold=30,
+                                  slowFactor=4, clock=clock)
+        entry = adaptive.entries[0]
+
+        assert adaptive.nextInterval(entry, [], 0.01) == 12
+        assert adaptive.nextInterval(entry, [ChangeEvent("cam", "getDevState", "sdState", "1", "0")], 0.01) == 6
+        raised = ChangeEvent("cam", "getDevState", "motionDetectAlarm", "1", "2")
+        assert adaptive.nextInterval(entry, [raised], 0.01) == 1
+        clock.now += 20
+        assert adaptive.nextInterval(entry, [], 0.01) == 1
+        clock.now += 20
+        assert adaptive.nextInterval(entry, [], 0.01) == 1.5
+        # slow camera
+        assert adaptive.nextInterval(entry, [], 2.0) >= 2.0 * 0.3 * 4
+        for x in range(20):
+            adaptive.nextInterval(entry, [], 0.01)
+        assert entry.interval == 60
+
+    def test_budget(self):
+        from foscontrol.poller import AdaptivePoller, StatePoller
+
+        clock = FakeClock()
+        adaptive = AdaptivePoller(StatePoller([]), budget=10, clock=clock)
+        assert adaptive.takeTokens(10) == 0
+        assert adaptive.takeTokens(2) == pytest.approx(0.2)
+        clock.now += 0.5
+        assert adaptive.takeTokens(2) == 0
+        clock.now += 100
+        assert adaptive.takeTokens(10) == 0
+        assert adaptive.takeTokens(1) > 0
+
+    def test_run(self, sim):
+        import time
+        from foscontrol.poller import StatePoller, AdaptivePoller
+
+        busy, quiet = sim.addCameras(2)
+        poller = StatePoller(dict((camera.name, sim.client(camera)) for camera in (busy, quiet)))
+        events = []
+        poller.listeners.append(events.append)
+        adaptive = AdaptivePoller(poller, minInterval=0.01, maxInterval=0.2, baseInterval=0.05, budget=100,
+                                  workers=2, alarmHold=10, slowFactor=0)  # response times vary under load
+        start = time.time()
+        adaptive.start()
+        try:
+            waitFor(lambda: poller.state(busy.name) is not None)
+            busy.trigger("motionDetectAlarm")
+            waitFor(lambda: events)
+            polls = adaptive.stats()[quiet.name][1]
+            # the busy camera is polled every minInterval, the quiet one at most every 0.2 seconds
+            waitFor(lambda: adaptive.stats()[busy.name][1] > 2 * adaptive.stats()[quiet.name][1]
+                    and adaptive.stats()[quiet.name][1] > polls)
+        finally:
+            adaptive.stop()
+        elapsed = time.time() - start
+
+        assert [e.kind for e in events] == ["alarmRaised"]
+        assert adaptive.stats()[busy.name][0] == 0.01
+        assert adaptive.requests <= 100 * elapsed + 100
@@ -0,0 +1,97 @@
+# coding=utf-8
+
+import os
+import time
+
+import pytest
+
+from .conftest import requiresSimulator, waitFor
+
+pytestmark = requiresSimulator
+
+
+def test_ring():
+    from foscontrol.prebuffer import FrameRing
+
+    ring = FrameRing(3, slotSize=8)
+    size = len(ring.buffer)
+    for x in range(5):
+        assert ring.put(b"%d" % x * (x + 1), float(x))
+    assert not ring.put(b"x" * 9, 5.0)
+    assert [(when, bytes(data)) for when, data in ring.frames()] == [(2.0, b"222"), (3.0, b"3333"), (4.0, b"44444")]
+    assert [when for when, data in ring.frames(since=3.0)] == [3.0, 4.0]
+    assert len(ring.buffer) == size
+
+
+class TestPreEventBuffer(object):
+    def test_event(self, tmpdir):
+        from foscontrol.poller import ChangeEvent
+        from foscontrol.prebuffer import PreEventBuffer
+        from foscontrol.simulator import CamSimulator
+
+        with CamSimulator(mjpegFrameRate=20) as sim:
+            camera = sim.addCamera()
+            buffer = PreEventBuffer(sim.client(camera), str(tmpdir), name="gate", seconds=0.5, after=0.3,
+                                    frameRate=20)
+            assert buffer.ring.slots == 11
+            buffer.start()
+            try:
+                waitFor(lambda: buffer.ring.count > buffer.ring.slots)
+                buffer.onChange(ChangeEvent("garden", "getDevState", "motionDetectAlarm", "1", "2"))
+                buffer.onChange(ChangeEvent("gate", "getDevState", "motionDetectAlarm", "2", "1"))
+                assert buffer.eventStart is None
+
+                buffer.onChange(ChangeEvent("gate", "getDevState", "motionDetectAlarm", "1", "2"))
+                # the file names have milliseconds
+                start = int(buffer.eventStart * 1000) / 1000.0
+                waitFor(lambda: buffer.events)
+            finally:
+                buffer.stop()
+            assert buffer.thread is None
+
+        directory, count = buffer.events[0]
+        names = sorted(os.listdir(directory))
+        assert len(names) == count
+        times = [int(name[:13]) / 1000.0 for name in names]
+        # frames of the last 0.5 seconds before the alarm and 0.3 seconds after it
+        before = [t for t in times if t < start]
+        assert 5 <= len(before) <= 11 and min(times) >= start - 0.501
+        assert max(times) >= start + 0.299 and len(times) - len(before) >= 3
+        with open(os.path.join(directory, names[0]), "rb") as fh:
+            data = fh.read()
+        assert data[:2] == b"\xff\xd8" and data[-2:] == b"\xff\xd9"
+
+    def test_stop_during_reconnect(self, tmpdir):
+        from foscontrol.prebuffer import PreEventBuffer
+        from foscontrol.simulator import CamSimulator
+
+        with CamSimulator() as sim:
+            camera = sim.addCamera(rebootTime=60)
+            camera.reboot()
+            buffer = PreEventBuffer(sim.client(camera), str(tmpdir), reconnectDelay=60)
+            buffer.start()
+            waitFor(lambda: buffer.lastError is not None)
+            start = time.time()
+            buffer.stop()
+            assert buffer.thread is None and time.time() - start < 2
+
+    def test_same_millisecond(self, tmpdir):
+        from foscontrol.prebuffer import PreEventBuffer
+
+        buffer = PreEventBuffer(None, str(tmpdir), name="gate", seconds=1, after=0.5)
+
+        def frame(when):
+            buffer.ring.put(b"jpeg", when)
+            buffer.frameStored(when, b"jpeg")
+
+        for x in range(2):
+            buffer.trigger(1000.0)
+            frame(1000.2)
+            buffer.trigger(1000.3)  # extends the event to 1000.8
+            frame(1000.6)
+            assert buffer.eventStart == 1000.0
+            frame(1000.8)
+            assert buffer.eventStart is None
+        (first, count), (second, _) = buffer.events
+        assert second == first + "-1" and count == 3
+        assert len(os.listdir(first)) == 3
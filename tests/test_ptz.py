@@ -0,0 +1,121 @@
+# coding=utf-8
+
+import socket
+
+import pytest
+
+from .conftest import requiresSimulator
+
+pytestmark = requiresSimulator
+
+
+class TestPTZController(object):
+    def test_coalescing(self, sim):
+        from foscontrol.instrument import HistogramAggregator
+
+        camera = sim.addCamera(latency=0.05)
+        cam = sim.client(camera)
+        agg = HistogramAggregator()
+        cam.addHook(agg)
+        received = []
+
+        ptz = cam.ptzController()
+        ptz.listeners.append(lambda cmd, latency, result, error: received.append((cmd, result.result, error)))
+        try:
+            for direction in ("n", "ne", "e", "se", "s", "sw", "w", "nw"):
+                ptz.move(direction)
+            ptz.stop()
+            ptz.move("e")
+            assert ptz.flush(5)
+        finally:
+            ptz.close()
+
+        stats = ptz.stats()
+        assert stats["submitted"] == 10
+        assert stats["sent"] + stats["coalesced"] == 10
+        assert stats["coalesced"] >= 7
+        assert stats["failed"] == 0 and stats["max"] >= 0.05
+        # the stop is sent before the last move, never dropped
+        assert [cmd for cmd, result, error in received][-2:] == ["ptzStopRun", "ptzMoveRight"]
+        assert all(result == 0 and error is None for cmd, result, error in received)
+        assert camera.ptzState == "ptzMoveRight"
+        assert camera.calls["ptzStopRun"] == 1
+
+        histograms, counters = agg.snapshot()
+        assert histograms[(camera.host + ":%s" % camera.port, "ptzStopRun", "queue")].count == 1
+
+    def test_reconnect(self, sim):
+        camera = sim.addCamera()
+        cam = sim.client(camera)
+        ptz = cam.ptzController()
+        try:
+            ptz.zoomIn()
+            assert ptz.flush(5)
+            ptz.conn.sock.shutdown(socket.SHUT_RDWR)  # as if closed by the camera while idle
+            ptz.zoomStop()
+            assert ptz.flush(5)
+        finally:
+            ptz.close()
+        assert ptz.stats()["failed"] == 0
+        assert camera.ptzState == "zoomStop"
+
+    def test_failing_hook(self, sim):
+        class Hook(object):
+            def pre(self, event):
+                if event.cmd == "zoomIn":
+                    raise RuntimeError("broken hook")
+
+            def post(self, event):
+                pass
+
+        camera = sim.addCamera()
+        cam = sim.client(camera)
+        cam.addHook(Hook())
+        ptz = cam.ptzController()
+        try:
+            ptz.zoomIn()
+            assert ptz.flush(5)
+            ptz.zoomStop()  # the background thread is still running
+            assert ptz.flush(5)
+        finally:
+            ptz.close()
+        stats = ptz.stats()
+        assert stats["sent"] == 1 and stats["failed"] == 1
+        assert str(ptz.lastError) == "broken hook"
+        assert camera.ptzState == "zoomStop"
+
+    def test_strict(self, sim):
+        from foscontrol.errors import ResultError
+
+        camera = sim.addCamera(errors={"zoomIn": -1})
+        cam = sim.client(camera, strict=True)
+        ptz = cam.ptzController()
+        try:
+            ptz.zoomIn()
+            assert ptz.flush(5)
+        finally:
+            ptz.close()
+        assert ptz.stats()["failed"] == 1 and isinstance(ptz.lastError, ResultError)
+
+    def test_timeout_not_repeated(self, sim):
+        camera = sim.addCamera(latency=0.5)
+        cam = sim.client(camera, timeout=(1, 0.2))
+        ptz = cam.ptzController()
+        try:
+            ptz.zoomIn()
+            assert ptz.flush(5)
+        finally:
+            ptz.close()
+        # the camera may have executed the command, it is not sent again
+        assert ptz.stats()["failed"] == 1 and sim.servers[-1].requests == 1
+
+    def test_invalid(self, sim):
+        from foscontrol.errors import CamError
+
+        cam = sim.client(sim.addCamera())
+        ptz = cam.ptzController(warm=False)
+        with pytest.raises(ValueError):
+            ptz.move("up")
+        ptz.close()
+        with pytest.raises(CamError):
+            ptz.stop()
@@ -0,0 +1,52 @@
+# coding=utf-8
+
+import pytest
+
+from .conftest import requiresSimulator
+
+pytestmark = requiresSimulator
+
+
+def test_decode_record():
+    from foscontrol import decodeRecord
+
+    rec = decodeRecord("/mnt/sd/record/MDalarm_20150203_101010.avi+123456+1422954610+1422954670+1")
+    assert rec.path == "/mnt/sd/record/MDalarm_20150203_101010.avi"
+    assert (rec.size, rec.startTime, rec.endTime, rec.typeName) == (123456, 1422954610, 1422954670, "alarm")
+    assert decodeRecord("") is None
+    assert decodeRecord("garbage") == "garbage"
+
+
+class TestRecordIndex(object):
+    def test_paging(self, sim):
+        camera = sim.addCamera(recordEntries=35, pageSize=10)
+        res = sim.client(camera).getRecordList()
+        assert [r.path for r in res._record] == [r[0] for r in camera.records]
+        assert camera.calls["getRecordList"] == 4
+        assert len(sim.client(camera).getRecordList(recordType=1)._record) == 12
+
+    def test_incremental(self, sim, tmpdir):
+        from foscontrol.recordindex import RecordIndex
+
+        garden, gate = sim.addCameras(2, recordEntries=30)
+        cams = {"garden": sim.client(garden), "gate": sim.client(gate)}
+        index = RecordIndex(str(tmpdir.join("records.db")))
+
+        assert index.syncAll(cams) == {"garden": 30, "gate": 30}
+        # only the newest known recording is fetched again
+        assert index.syncAll(cams) == {"garden": 1, "gate": 1}
+
+        last = gate.records[-1]
+        gate.records.append(("/mnt/sd/record/MDalarm_new.avi", 1000, last[2] + 1200, last[3] + 1200, 1))
+        assert index.sync("gate", cams["gate"]) == 2
+        assert len(index.query(cameras=["gate"])) == 31
+
+        alarms = index.query(start=last[2] + 1, recordType=1)
+        assert [(name, rec.path) for name, rec in alarms] == [("gate", "/mnt/sd/record/MDalarm_new.avi")]
+        assert len(index.query(recordType=1)) == 2 * 10 + 1
+
+        # overwritten recordings disappear with a full sync
+        del garden.records[:5]
+        assert index.sync("garden", cams["garden"], full=True) == 25
+        assert index.stats()["garden"][0] == 25
+        index.close()
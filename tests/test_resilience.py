@@ -0,0 +1,160 @@
+# coding=utf-8
+
+import socket
+
+import pytest
+
+from .conftest import requiresSimulator
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCircuitBreaker(object):
+    def test_half_open(self):
+        from foscontrol.resilience import CircuitBreaker
+        from foscontrol.errors import CircuitOpen
+
+        clock = FakeClock()
+        changes = []
+        breaker = CircuitBreaker(threshold=2, resetTimeout=10, clock=clock)
+        breaker.listeners.append(lambda b, old, new: changes.append(new))
+
+        breaker.failure()
+        assert breaker.allow()
+        breaker.failure()
+        assert breaker.state == "open" and not breaker.available()
+        with pytest.raises(CircuitOpen):
+            breaker.check("cam")
+
+        clock.now = 10
+        assert breaker.available()
+        assert breaker.allow()  # trial request
+        assert not breaker.allow()
+        breaker.failure()
+        assert breaker.retryAt == 30  # interval doubled
+
+        clock.now = 30
+        assert breaker.allow()
+        breaker.success()
+        assert breaker.state == "closed"
+        assert changes == ["open", "halfOpen", "open", "halfOpen", "closed"]
+
+    def test_listener_uses_breaker(self):
+        from foscontrol.resilience import CircuitBreaker
+
+        clock = FakeClock()
+        breaker = CircuitBreaker(threshold=1, resetTimeout=10, clock=clock)
+        seen = []
+        # called without the lock held, else allow() would deadlock
+        breaker.listeners.append(lambda b, old, new: seen.append((new, b.allow())))
+        breaker.failure()
+        clock.now = 10
+        assert breaker.allow()
+        breaker.success()
+        assert seen == [("open", False), ("halfOpen", False), ("closed", True)]
+
+    def test_retry_delay(self):
+        from foscontrol.resilience import RetryPolicy, isIdempotent
+
+        policy = RetryPolicy(backoff=1, maxBackoff=3, jitter=0)
+        assert [policy.delay(x) for x in (1, 2, 3)] == [1, 2, 3]
+        assert isIdempotent("getDevInfo") and not isIdempotent("setDevName")
+
+    def test_network_errors(self):
+        import errno
+        from foscontrol.resilience import HTTPError, URLError, isNetworkError
+
+        assert isNetworkError(socket.timeout("timed out"))
+        assert isNetworkError(URLError("refused"))
+        assert isNetworkError(socket.error(errno.ECONNRESET, "reset"))
+        assert isNetworkError(socket.error(errno.EHOSTUNREACH, "no route to host"))
+        assert isNetworkError(HTTPError("http://cam/", 503, "busy", {}, None))
+        assert not isNetworkError(HTTPError("http://cam/", 404, "not found", {}, None))
+        # local errors
+        assert not isNetworkError(IOError(errno.ENOSPC, "no space left on device"))
+        assert not isNetworkError(IOError(errno.EACCES, "permission denied"))
+        assert not isNetworkError(IOError(errno.ENOENT, "no such file"))
+
+
+@requiresSimulator
+class TestCamResilience(object):
+    def test_retry_and_breaker(self):
+        import foscontrol
+        from foscontrol.resilience import CircuitBreaker, RetryPolicy
+        from foscontrol.errors import CircuitOpen
+
+        # a port nobody listens on
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+        sock.close()
+
+        waits = []
+        cam = foscontrol.Cam("http", "127.0.0.1", port, "admin", "", timeout=(1, 1),
+                             retry=RetryPolicy(attempts=3, sleep=waits.append),
+                             breaker=CircuitBreaker(threshold=2, resetTimeout=60))
+        with pytest.raises(IOError):
+            cam.getDevInfo()
+        assert len(waits) == 2 and cam.breaker.failures == 1  # one failure per command
+
+        with pytest.raises(IOError):
+            cam.setDevName("x")  # no retry, 2nd failure opens the breaker
+        assert len(waits) == 2 and not cam.isAvailable()
+        with pytest.raises(CircuitOpen):
+            cam.getDevInfo()
+
+    def test_breaker_opt_in(self):
+        import foscontrol
+
+        assert foscontrol.Cam("http", "127.0.0.1", 80, "admin", "").breaker is None
+        breaker = foscontrol.Cam("http", "127.0.0.1", 80, "admin", "", breaker=True).breaker
+        assert breaker.probe is None  # no background timer
+
+    def test_half_open_after_reset(self):
+        import time
+        from foscontrol.resilience import NO_RETRY, CircuitBreaker
+        from foscontrol.errors import CircuitOpen
+        from foscontrol.simulator import CamSimulator
+
+        with CamSimulator() as sim:
+            camera = sim.addCamera(rebootTime=0.2)
+            cam = sim.client(camera, retry=NO_RETRY,
+                             breaker=CircuitBreaker(threshold=1, resetTimeout=0.3))
+
+            camera.reboot()
+            with pytest.raises(IOError):
+                cam.getDevInfo()
+            with pytest.raises(CircuitOpen):
+                cam.getDevInfo()
+            time.sleep(0.4)
+            assert cam.isAvailable()
+            assert cam.getDevInfo().result == 0  # trial request
+            assert cam.breaker.state == "closed"
+
+    def test_probe_closes_breaker(self):
+        import threading
+        from foscontrol.resilience import NO_RETRY, CircuitBreaker
+        from foscontrol.simulator import CamSimulator
+
+        with CamSimulator() as sim:
+            camera = sim.addCamera(rebootTime=0.2)
+            cam = sim.client(camera, retry=NO_RETRY)
+            cam.breaker = CircuitBreaker(threshold=1, resetTimeout=0.3, probe=cam.probe)
+            closed = threading.Event()
+            cam.breaker.listeners.append(lambda b, old, new: new == "closed" and closed.set())
+
+            camera.reboot()
+            try:
+                with pytest.raises(IOError):
+                    cam.getDevInfo()
+                assert not cam.isAvailable()
+                assert closed.wait(5)
+                assert cam.getDevInfo().result == 0
+            finally:
+                cam.breaker.cancel()
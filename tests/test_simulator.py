@@ -0,0 +1,58 @@
+# coding=utf-8
+
+import socket
+import struct
+
+import pytest
+
+from .conftest import requiresSimulator
+
+pytestmark = requiresSimulator
+
+
+def receive(sock, size):
+    data = b""
+    while len(data) < size:
+        part = sock.recv(size - len(data))
+        assert part, "connection closed"
+        data += part
+    return data
+
+
+class TestSimulator(object):
+    def test_cgi(self, sim):
+        camera = sim.addCamera(name="garden", password="secret", logEntries=25)
+        cam = sim.client(camera)
+
+        assert cam.getDevName().devName == "garden"
+        assert len(cam.getLog()._log) == 25
+        assert cam.ptzAddPresetPoint("TopMost").result == 2
+        assert cam.setAlarmRecordConfig(True, 6, 30).result == -1
+
+        data, name = cam.snapPicture()
+        assert data.startswith(b"\xff\xd8") and name.endswith(".jpg")
+
+        cam.password = "wrong"
+        assert cam.getDevInfo().result == -2
+        assert camera.calls["getDevInfo"] == 1
+
+    def test_forced_errors(self, sim):
+        cam = sim.client(sim.addCamera(errors={"getDevState": -4}))
+        assert cam.getDevState().result == -4
+        assert cam.getDevInfo().result == 0
+
+    def test_serverpush(self, sim):
+        camera = sim.addCamera(password="pw")
+        sock = socket.create_connection((camera.host, camera.port))
+        try:
+            sock.sendall(b"SERVERPUSH / HTTP/1.1\r\nHost: localhost\r\nAccept:*/*\r\nConnection: Close\r\n\r\n\r\n")
+            login = struct.pack("<x64s64sI32x", b"admin", b"pw", 1)
+            sock.sendall(struct.pack("<I4sI", 12, b"FOSC", len(login)) + login)
+            cmd, magic, size = struct.unpack("<I4sI", receive(sock, 12))
+            assert (cmd, magic) == (100, b"FOSC")
+            assert receive(sock, size)[8] == len(camera.presets)
+
+            sock.sendall(struct.pack("<I4sII", 15, b"FOSC", 4, 1))
+            assert receive(sock, 16) == struct.pack("<I4sII", 29, b"FOSC", 4, 0)
+        finally:
+            sock.close()
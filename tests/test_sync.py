@@ -0,0 +1,72 @@
+# coding=utf-8
+
+import pytest
+
+from .conftest import requiresSimulator
+
+pytestmark = requiresSimulator
+
+
+SPEC = {
+    "smtp": {"isEnable": True, "server": "mail.example.com", "port": 587, "password": "secret"},
+    "systemTime": {"ntpServer": "pool.ntp.org"},
+    "motion": {"isEnable": False},
+}
+
+
+class TestConfigSync(object):
+    def test_validate(self):
+        from foscontrol.sync import ConfigSync
+
+        with pytest.raises(ValueError):
+            ConfigSync({"smtp": {"server": "x", "color": "red"}})
+        with pytest.raises(ValueError):
+            ConfigSync({}, overrides={"gate": {"nothing": {}}})
+
+    def test_reconcile(self, sim):
+        from foscontrol.sync import ConfigSync, formatReport
+
+        cameras = sim.addCameras(3)
+        cams = dict((camera.name, sim.client(camera)) for camera in cameras)
+        broken = sim.addCamera(name="broken", errors={"getSMTPConfig": -3})
+        sync = ConfigSync(SPEC, overrides={"FosSim0002": {"motion": {"sensitivity": 3}}}, workers=2)
+
+        report = sync.reconcile(dict(cams, broken=sim.client(broken)), dryRun=True)
+        assert [c.section for c in report["FosSim0000"]["changes"]] == ["smtp", "systemTime"]
+        assert [c.section for c in report["FosSim0002"]["changes"]] == ["motion", "smtp", "systemTime"]
+        assert "AccessDenied" in report["broken"]["error"]
+        assert cameras[0].calls["setSMTPConfig"] == 0
+
+        text = formatReport(report)
+        assert "FosSim0000: would set smtp.server: '' -> 'mail.example.com'" in text
+        assert "secret" not in text
+        params = report["FosSim0000"]["changes"][1].params
+        assert [params[x] is not None for x in ("year", "month", "day", "hour", "min", "sec")] == [True] * 6
+
+        report = sync.reconcile(cams)
+        assert all(c.result == 0 for entry in report.values() for c in entry["changes"])
+        smtp = cameras[1].settings["smtp"]
+        assert (smtp["isEnable"], smtp["port"], smtp["sender"]) == ("1", "587", "")
+        assert cameras[2].settings["motion"]["sensitivity"] == "3"
+
+        # nothing left to do
+        calls = sum(camera.calls["setSMTPConfig"] for camera in cameras)
+        report = sync.reconcile(cams)
+        assert all(not entry["changes"] for entry in report.values())
+        assert sum(camera.calls["setSMTPConfig"] for camera in cameras) == calls == 3
+        assert formatReport(report).splitlines() == ["FosSim0000: ok", "FosSim0001: ok", "FosSim0002: ok"]
+
+    def test_masked_secret(self, sim):
+        from foscontrol.sync import ConfigSync
+
+        camera = sim.addCamera()
+        camera.settings["ftp"].update(ftpAddr="ftp.example.com", password="********")
+        cam = sim.client(camera)
+        spec = {"ftp": {"ftpAddr": "ftp.example.com", "password": "secret"}}
+
+        assert ConfigSync(spec).reconcile([cam])[cam.target]["changes"] == []
+        changes = ConfigSync(spec, secrets=True).reconcile([cam], dryRun=True)[cam.target]["changes"]
+        assert list(changes[0].diff) == ["password"]
+        camera.settings["ftp"]["password"] = "old"  # readable, compared anyway
+        changes = ConfigSync(spec).reconcile([cam])[cam.target]["changes"]
+        assert changes[0].result == 0 and camera.settings["ftp"]["password"] == "secret"